@@ -34,4 +34,12 @@ setup(name='mdsynthesis',
                 'MDAnalysis>=0.16.0',
                 'tables', 'h5py', 'numpy', 'pandas'
                 ],
+      extras_require={
+          'dask': ['dask[array,dataframe]'],
+          'xarray': ['xarray', 'h5netcdf'],
+          'sparse': ['scipy'],
+          },
+      entry_points={
+          'console_scripts': ['mds = mdsynthesis.scripts.mds:main'],
+          },
       )
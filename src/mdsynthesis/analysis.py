@@ -0,0 +1,450 @@
+"""
+Persistent memoization of analyses of Sims, with results stored in their data.
+
+"""
+import os
+import json
+import uuid
+import pickle
+import hashlib
+import inspect
+from functools import wraps
+
+import six
+
+from .persistent_dict.core import BACKENDS
+
+# handle of the tree of datasets holding memoized results
+MEMOIZED_HANDLE = 'memoized'
+
+
+def _canonical(obj):
+    """Convert an object to a form that pickles the same in every session.
+
+    Items of dicts and members of sets are sorted, since their order depends
+    on insertion, and for sets on the hash seed of the interpreter.
+
+    """
+    if isinstance(obj, dict):
+        items = ((_canonical(key), _canonical(value))
+                 for key, value in obj.items())
+        return ('dict', tuple(sorted(items, key=repr)))
+    elif isinstance(obj, (set, frozenset)):
+        return (type(obj).__name__,
+                tuple(sorted((_canonical(member) for member in obj),
+                             key=repr)))
+    elif isinstance(obj, (list, tuple)):
+        return (type(obj).__name__, tuple(_canonical(item) for item in obj))
+    return obj
+
+
+def _hash_code(code, digest):
+    """Add a code object to a digest, including any nested code objects.
+
+    """
+    digest.update(code.co_code)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            _hash_code(const, digest)
+        else:
+            digest.update(repr(_canonical(const)).encode('utf-8'))
+    digest.update(repr(code.co_names).encode('utf-8'))
+
+
+def _callargs(func, leading, args, kwargs):
+    """Get the arguments of a call by parameter name, excluding the leading
+    positional arguments, such as the Sim.
+
+    """
+    args = tuple(leading) + tuple(args)
+    if six.PY2:
+        callargs = inspect.getcallargs(func, *args, **kwargs)
+        params = inspect.getargspec(func).args
+    else:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        callargs = dict(bound.arguments)
+        params = list(bound.arguments)
+
+    for param in params[:len(leading)]:
+        del callargs[param]
+    return callargs
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime)
+
+
+def _trajectory_state(sim):
+    """Paths, sizes, and modification times of the trajectory files of a
+    Sim's universe definition.
+
+    """
+    trajectory = sim.universedef.trajectory
+    if trajectory is None:
+        trajectory = []
+    elif isinstance(trajectory, six.string_types):
+        trajectory = [trajectory]
+
+    return [(path, _stat(path)) for path in trajectory]
+
+
+def _topology_state(sim):
+    """Path, size, and modification time of the topology file of a Sim's
+    universe definition, with its keyword arguments.
+
+    """
+    topology = sim.universedef.topology
+    return ((topology, _stat(topology) if topology else None),
+            sorted(sim.universedef.kwargs.items()))
+
+
+class Memoized(object):
+    """Analysis function whose results are stored in the data of Sims.
+
+    See :func:`memoize`.
+
+    """
+
+    def __init__(self, func, version=None, selections=()):
+        self.func = func
+        self.version = version
+        self.selections = tuple(selections)
+        wraps(func)(self)
+
+        digest = hashlib.sha1()
+        digest.update(repr(version).encode('utf-8'))
+        _hash_code(six.get_function_code(func), digest)
+        self._code = digest.hexdigest()
+
+    def __repr__(self):
+        return "<Memoized({})>".format(self.__name__)
+
+    def __reduce__(self):
+        # pickled by reference, as functions are
+        return self.__name__
+
+    @property
+    def _basehandle(self):
+        return '{}/{}.{}'.format(MEMOIZED_HANDLE, self.func.__module__,
+                                 self.__name__)
+
+    def _selections(self, sim, callargs):
+        """Definitions of the stored atom selections used by a call.
+
+        """
+        handles = list()
+        for name in self.selections:
+            if name in callargs:
+                value = callargs[name]
+                if value is None:
+                    continue
+                elif isinstance(value, six.string_types):
+                    handles.append(value)
+                else:
+                    handles.extend(value)
+            else:
+                handles.append(name)
+
+        return [(handle, sim.atomselections.get(handle))
+                for handle in handles]
+
+    def _callargs(self, sim, args, kwargs):
+        return _callargs(self.func, (sim,), args, kwargs)
+
+    def _inputs(self, sim):
+        """State of the Sim's universe definition that results depend on.
+
+        """
+        return _topology_state(sim), _trajectory_state(sim)
+
+    def handle(self, sim, *args, **kwargs):
+        """Get the handle of the dataset storing the result of a call.
+
+        The handle includes a hash of the function's code and version, the
+        arguments of the call, the Sim's universe definition with the sizes
+        and modification times of its files, and the definitions of the
+        stored atom selections used.
+
+        Parameters
+        ----------
+        sim : Sim
+            Sim to call the function with.
+        *args, **kwargs
+            Other arguments to call the function with.
+
+        Returns
+        -------
+        handle : str
+            Handle of the dataset in the Sim's data.
+
+        """
+        callargs = self._callargs(sim, args, kwargs)
+        selections = self._selections(sim, callargs)
+
+        digest = hashlib.sha1()
+        digest.update(self._code.encode('utf-8'))
+        digest.update(pickle.dumps(_canonical((callargs,
+                                               self._inputs(sim),
+                                               selections)), protocol=2))
+
+        return '{}/{}'.format(self._basehandle, digest.hexdigest())
+
+    def __call__(self, sim, *args, **kwargs):
+        handle = self.handle(sim, *args, **kwargs)
+
+        try:
+            return sim.data.retrieve(handle)
+        except KeyError:
+            pass
+
+        result = self.func(sim, *args, **kwargs)
+        if not sim.data.readonly:
+            sim.data.add(handle, result)
+
+        return result
+
+    def clear(self, sim):
+        """Remove all results of the function stored in a Sim.
+
+        Parameters
+        ----------
+        sim : Sim
+            Sim to remove results from.
+
+        """
+        prefix = self._basehandle + '/'
+        for handle in sim.data.keys():
+            if handle.startswith(prefix):
+                sim.data.remove(handle)
+
+
+class Incremental(Memoized):
+    """Analysis function whose per-frame results are stored in the data of
+    Sims, and extended as frames are added to their trajectories.
+
+    See :func:`incremental`.
+
+    """
+    # auxiliary file of the datafile recording the frames it was computed
+    # from; it is removed, along with the datafile's other auxiliary files,
+    # whenever the dataset is
+    record = 'frames.json'
+
+    def __repr__(self):
+        return "<Incremental({})>".format(self.__name__)
+
+    def _callargs(self, sim, args, kwargs):
+        return _callargs(self.func, (sim, None, None), args, kwargs)
+
+    def _inputs(self, sim):
+        # trajectory files are tracked by the record instead
+        return _topology_state(sim)
+
+    def _recordpath(self, sim, handle):
+        datafile, proxy, datafiletype = sim.data._get_datafile(handle)
+        return BACKENDS[datafiletype](datafile,
+                                      readonly=True)._auxfile(self.record)
+
+    def _read_record(self, sim, handle):
+        """Get the record of frames a dataset was computed from, if it still
+        matches the dataset.
+
+        """
+        try:
+            with open(self._recordpath(sim, handle), 'r') as f:
+                record = json.load(f)
+            nrows = sim.data.info(handle)['nrows']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        if nrows != record['nrows']:
+            # the dataset changed without the record, e.g. an interrupted
+            # update
+            return None
+        return record
+
+    def _write_record(self, sim, handle, segments, n_frames):
+        record = {'segments': segments,
+                  'n_frames': n_frames,
+                  'nrows': int(sim.data.info(handle)['nrows'])}
+
+        # unique across processes, so concurrent updates don't collide
+        path = self._recordpath(sim, handle)
+        tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            json.dump(record, f)
+        os.rename(tmp, path)
+
+    @staticmethod
+    def _extends(segments, recorded):
+        """Check if trajectory segments only extend recorded ones.
+
+        Segments extend the recorded ones if these are unchanged and in the
+        same order, except that the last may have grown, and new segments may
+        follow.
+
+        """
+        if len(recorded) > len(segments):
+            return False
+
+        for i, ((path, stat), (rpath, rstat)) in enumerate(zip(segments,
+                                                               recorded)):
+            if path != rpath or stat is None or rstat is None:
+                return False
+            if stat != rstat and (i < len(recorded) - 1 or
+                                  stat[0] < rstat[0]):
+                return False
+
+        return True
+
+    def frames(self, sim, *args, **kwargs):
+        """Get the range of frames a call has yet to compute.
+
+        Frames already computed are those given by the record stored with
+        the dataset, if the Sim's trajectory only extends the segments
+        recorded; otherwise, all frames are computed again.
+
+        Parameters
+        ----------
+        sim : Sim
+            Sim to call the function with.
+        *args, **kwargs
+            Other arguments to call the function with.
+
+        Returns
+        -------
+        start, stop : int
+            Range of frames to compute.
+
+        """
+        handle = self.handle(sim, *args, **kwargs)
+        return self._frames(sim, handle)[:2]
+
+    def _frames(self, sim, handle):
+        segments = [[path, list(stat) if stat else None]
+                    for path, stat in _trajectory_state(sim)]
+        n_frames = int(sim.universe.trajectory.n_frames)
+
+        record = self._read_record(sim, handle)
+        if (record is None or record['n_frames'] > n_frames or
+                not self._extends(segments, record['segments'])):
+            start = 0
+        else:
+            start = record['n_frames']
+
+        return start, n_frames, segments
+
+    def __call__(self, sim, *args, **kwargs):
+        handle = self.handle(sim, *args, **kwargs)
+        start, stop, segments = self._frames(sim, handle)
+
+        if start == stop:
+            return sim.data.retrieve(handle)
+
+        if sim.data.readonly:
+            return self.func(sim, 0, stop, *args, **kwargs)
+
+        result = self.func(sim, start, stop, *args, **kwargs)
+        if start == 0:
+            sim.data.add(handle, result)
+        else:
+            sim.data.append(handle, result)
+        self._write_record(sim, handle, segments, stop)
+
+        return sim.data.retrieve(handle)
+
+
+def memoize(func=None, version=None, selections=()):
+    """Store the results of an analysis function in the data of Sims.
+
+    The function must take a Sim as its first argument. Its result is
+    stored in the Sim's data, under a handle including a hash of everything
+    it depends on: the function's code and *version*, the arguments of the
+    call, the Sim's universe definition along with the sizes and
+    modification times of its files, and the definitions of the stored atom
+    selections it uses. Calls with the same inputs then return the stored
+    result, while changing any of these gives a new result.
+
+    Functions the analysis calls, and globals it uses, are not part of the
+    hash; bump *version* when these change. For immutable Sims, results are
+    computed but not stored.
+
+    Can be used as ``@memoize`` or ``@memoize(version=2)``.
+
+    Parameters
+    ----------
+    func : function
+        Function to memoize.
+    version : object
+        Version of the function; results stored for other versions are not
+        used.
+    selections : list
+        Stored atom selections used by the function, given by handle, or by
+        the name of a parameter of the function whose value is a handle or a
+        list of handles.
+
+    Returns
+    -------
+    memoized : Memoized
+        Function storing its results; its ``clear`` method removes all
+        results stored in a Sim.
+
+    """
+    if func is None:
+        def decorator(func):
+            return Memoized(func, version=version, selections=selections)
+        return decorator
+
+    return Memoized(func, version=version, selections=selections)
+
+
+def incremental(func=None, version=None, selections=()):
+    """Store the per-frame results of an analysis function in the data of
+    Sims, computing only new frames as their trajectories are extended.
+
+    The function must take a Sim, then the *start* and *stop* of a range of
+    frames, as its first arguments, and return a pandas Series or DataFrame
+    with the results for these frames. Results are stored in the Sim's
+    data as for :func:`memoize`, but with the trajectory files left out of
+    the hash. Instead, the trajectory segments and number of frames used
+    are recorded with the dataset. When called again after frames are
+    appended to the last segment, or segments are added to the universe
+    definition, the function is called only for the new frames, and its
+    results are appended to the dataset. If recorded segments are changed
+    otherwise, all frames are computed again.
+
+    The function is then called with only the other arguments, and returns
+    the results for all frames.
+
+    Can be used as ``@incremental`` or ``@incremental(version=2)``.
+
+    Parameters
+    ----------
+    func : function
+        Function to store results of.
+    version : object
+        Version of the function; results stored for other versions are not
+        used.
+    selections : list
+        Stored atom selections used by the function, given by handle, or by
+        the name of a parameter of the function whose value is a handle or a
+        list of handles.
+
+    Returns
+    -------
+    incremental : Incremental
+        Function storing its results; its ``frames`` method gives the range
+        of frames a call would compute.
+
+    """
+    if func is None:
+        def decorator(func):
+            return Incremental(func, version=version, selections=selections)
+        return decorator
+
+    return Incremental(func, version=version, selections=selections)
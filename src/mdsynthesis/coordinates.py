@@ -0,0 +1,280 @@
+"""
+Local caches of coordinates, stored within a Sim as uncompressed arrays that
+can be memory-mapped for fast, random access to frames.
+
+"""
+import os
+import json
+import uuid
+import errno
+import shutil
+
+from .names import COORDINATES_DIR_NAME
+from .util import replace_directory
+
+# arrays stored for each cache
+ARRAYS = ('indices', 'positions', 'dimensions', 'time')
+
+
+class Coordinates(object):
+    """Local caches of coordinates for stored atom selections.
+
+    Reading compressed trajectories means decompressing every frame on every
+    pass, even when only a few of the atoms are needed. A cache stores the
+    coordinates of a selection's atoms, along with box dimensions and times,
+    for each frame of the Sim's trajectory as uncompressed ``.npy`` files
+    inside the Sim. These are memory-mapped on use, so any frame is available
+    at memory speed without loading the whole array.
+
+    Each cache is stored under a name, which defaults to the handle of the
+    selection it was made from.
+
+    """
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def __repr__(self):
+        return "<Coordinates({})>".format(self.keys())
+
+    def __iter__(self):
+        return self.keys().__iter__()
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def __delitem__(self, name):
+        self.remove(name)
+
+    @property
+    def _path(self):
+        return os.path.join(self._sim._simdir, COORDINATES_DIR_NAME)
+
+    def _cachedir(self, name):
+        cachedir = os.path.join(self._path, name)
+        if not os.path.exists(os.path.join(cachedir, 'info.json')):
+            raise KeyError("No coordinate cache '{}'".format(name))
+        return cachedir
+
+    def _check_writable(self):
+        if getattr(self._sim, 'immutable', False):
+            raise OSError(errno.EROFS, "Coordinates of '{}' are "
+                          "read-only".format(self._sim.abspath))
+
+    def keys(self):
+        """List names of all coordinate caches.
+
+        Returns
+        -------
+        names : list
+            Names of available caches.
+
+        """
+        if not os.path.isdir(self._path):
+            return []
+
+        return sorted(name for name in os.listdir(self._path)
+                      if not name.startswith('.') and
+                      os.path.exists(os.path.join(self._path, name,
+                                                  'info.json')))
+
+    def add(self, selection=None, name=None, start=None, stop=None,
+            step=None):
+        """Cache the coordinates of a stored atom selection.
+
+        The coordinates of the selection's atoms, the box dimensions, and the
+        time of every frame in the given range of the Sim's trajectory are
+        written to a buffer that replaces any existing cache of the same
+        name only once complete.
+
+        Parameters
+        ----------
+        selection : str
+            Handle of the stored atom selection to cache; ``None`` caches all
+            atoms.
+        name : str
+            Name to store the cache under; defaults to *selection*, or
+            ``'all'`` if caching all atoms.
+        start, stop, step : int
+            Range of frames to cache, as for slicing the trajectory.
+
+        Returns
+        -------
+        n_frames : int
+            Number of frames cached.
+
+        """
+        import numpy as np
+
+        self._check_writable()
+
+        if name is None:
+            name = 'all' if selection is None else selection
+        if not name or name.startswith('.') or os.sep in name:
+            raise ValueError("Invalid name for coordinate cache: "
+                             "'{}'".format(name))
+
+        universe = self._sim.universe
+        if universe is None:
+            raise ValueError("Sim has no universe defined.")
+
+        if selection is None:
+            atoms = universe.atoms
+        else:
+            atoms = self._sim.atomselections.create(selection)
+
+        n_frames = len(range(*slice(start, stop, step).indices(
+            universe.trajectory.n_frames)))
+
+        # unique across processes, so concurrent caching doesn't collide
+        cachedir = os.path.join(self._path, name)
+        wbuffer = os.path.join(self._path, '.{}.{}.buffer'.format(
+            name, uuid.uuid4().hex))
+        os.makedirs(wbuffer)
+
+        try:
+            np.save(os.path.join(wbuffer, 'indices.npy'), atoms.indices)
+
+            arrays = {
+                key: np.lib.format.open_memmap(
+                    os.path.join(wbuffer, '{}.npy'.format(key)), mode='w+',
+                    dtype=dtype, shape=shape)
+                for key, dtype, shape in (
+                    ('positions', np.float32, (n_frames, len(atoms), 3)),
+                    ('dimensions', np.float32, (n_frames, 6)),
+                    ('time', np.float64, (n_frames,)))}
+
+            for i, ts in enumerate(universe.trajectory[start:stop:step]):
+                arrays['positions'][i] = atoms.positions
+                if ts.dimensions is not None:
+                    arrays['dimensions'][i] = ts.dimensions
+                arrays['time'][i] = ts.time
+
+            for array in arrays.values():
+                array.flush()
+            del arrays
+
+            with open(os.path.join(wbuffer, 'info.json'), 'w') as f:
+                json.dump({'selection': selection,
+                           'start': start,
+                           'stop': stop,
+                           'step': step,
+                           'n_frames': n_frames,
+                           'n_atoms': len(atoms)}, f)
+
+            # readers with open memory maps keep the old files
+            replace_directory(wbuffer, cachedir)
+        except BaseException:
+            if os.path.exists(wbuffer):
+                shutil.rmtree(wbuffer)
+            raise
+
+        return n_frames
+
+    def remove(self, name):
+        """Remove a coordinate cache.
+
+        Parameters
+        ----------
+        name : str
+            Name of the cache to remove.
+
+        """
+        self._check_writable()
+        shutil.rmtree(self._cachedir(name))
+
+    def info(self, name):
+        """Describe a coordinate cache.
+
+        Parameters
+        ----------
+        name : str
+            Name of the cache.
+
+        Returns
+        -------
+        info : dict
+            The *selection* cached, the *start*, *stop*, and *step* of the
+            frames cached, and the number of frames and atoms as *n_frames*
+            and *n_atoms*.
+
+        """
+        with open(os.path.join(self._cachedir(name), 'info.json'), 'r') as f:
+            return json.load(f)
+
+    def get(self, name, array='positions'):
+        """Get a cached array, memory-mapped.
+
+        Parameters
+        ----------
+        name : str
+            Name of the cache.
+        array : {'positions', 'dimensions', 'time', 'indices'}
+            Array to get: coordinates with shape ``(n_frames, n_atoms, 3)``,
+            box dimensions with shape ``(n_frames, 6)``, time of each frame,
+            or indices of the cached atoms in the Sim's universe.
+
+        Returns
+        -------
+        array : numpy.memmap
+            Read-only memory map of the array.
+
+        """
+        import numpy as np
+
+        if array not in ARRAYS:
+            raise ValueError("No array '{}'; must be one of "
+                             "{}".format(array, ARRAYS))
+
+        return np.load(os.path.join(self._cachedir(name),
+                                    '{}.npy'.format(array)),
+                       mmap_mode='r')
+
+    def universe(self, name):
+        """Build a reduced universe reading from a coordinate cache.
+
+        The universe has only the cached atoms, with topology taken from the
+        Sim's universe, and its trajectory reads frames directly from the
+        memory-mapped cache.
+
+        Parameters
+        ----------
+        name : str
+            Name of the cache.
+
+        Returns
+        -------
+        universe : MDAnalysis.Universe
+            Universe of the cached atoms and frames.
+
+        """
+        import MDAnalysis as mda
+        from MDAnalysis.coordinates.memory import MemoryReader
+
+        indices = self.get(name, 'indices')
+        positions = self.get(name, 'positions')
+        dimensions = self.get(name, 'dimensions')
+        time = self.get(name, 'time')
+
+        universe = self._sim.universe
+        if universe is None:
+            raise ValueError("Sim has no universe defined.")
+
+        class CacheReader(MemoryReader):
+            """Reads the time of each frame from the cache, rather than
+            counting from zero in steps of `dt`"""
+
+            def _read_next_timestep(self, ts=None):
+                ts = super(CacheReader, self)._read_next_timestep(ts)
+                ts.time = float(time[ts.frame])
+                return ts
+
+        reduced = mda.Merge(universe.atoms[indices])
+
+        dt = float(time[1] - time[0]) if len(time) > 1 else 1
+        kwargs = dict(format=CacheReader, order='fac', dt=dt)
+        if dimensions.any():
+            kwargs['dimensions'] = dimensions
+        reduced.load_new(positions, **kwargs)
+
+        return reduced
@@ -1,19 +1,87 @@
 from datreant.util import makedirs
 from functools import wraps
+import threading
+import errno
 import six
 import os
 
-from .persistent_dict import npdata, pddata, pydata
+from .persistent_dict import npdata, pddata, pydata, shdata, spdata, xrdata
 from .persistent_dict.core import DataFile
 
 
+# names of datafiles for each type of dataset
+DATAFILES = (pddata.pddatafile, npdata.npdatafile, shdata.shdatafile,
+             xrdata.xrdatafile, spdata.spdatafile, pydata.pydatafile)
+
+# errors of hardlinking files where the filesystem doesn't allow it
+HARDLINK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP)
+
+
+def _datafiles(files):
+    """Find the datafiles among the files of a directory.
+
+    :Arguments:
+        *files*
+            names of the files in a directory
+
+    :Returns:
+        *datafiletype*
+            type of the directory's dataset; ``None`` if there is none
+        *members*
+            names of the datafiles and their auxiliary files, such as segments,
+            shards, and the files used for locking
+    """
+    present = [dfiletype for dfiletype in DATAFILES if dfiletype in files]
+    if not present:
+        return None, []
+
+    members = list()
+    for filename in files:
+        name = filename.lstrip('.')
+        if any(name == dfiletype or name.startswith(dfiletype + '.')
+               for dfiletype in present):
+            members.append(filename)
+
+    # as for Data._get_datafile, the last type found wins
+    return present[-1], members
+
+
 class Data(object):
     """Interface to stored data.
 
+    Instances can be shared between threads; each call works with its own
+    DataFile, and locks on datafiles hold between threads as well as between
+    processes.
+
+    If *readonly* is True, datafiles are read without any locking, and the
+    locations of datasets are cached after they are first looked up; this
+    is only safe if no one modifies the datasets, e.g. for archived data.
+    Any attempt to modify datasets raises :exc:`OSError`.
+
     """
 
-    def __init__(self, treant):
+    def __init__(self, treant, readonly=False):
         self.treant = treant
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lookups = dict()
+        self._keys = None
+
+    def _check_writable(self):
+        """Raise :exc:`OSError` if datasets are read-only.
+
+        """
+        if self.readonly:
+            raise OSError(errno.EROFS, "Data for '{}' is read-only".format(
+                self.treant.abspath))
+
+    @property
+    def _datafile(self):
+        """DataFile mounted by the innermost decorated method call of the
+        current thread.
+
+        """
+        return self._local.datafile
 
     def __repr__(self):
         return "<Data({})>".format(self.keys())
@@ -65,10 +133,12 @@ class Data(object):
                 ``persistence.npdatafile``
 
         """
+        if handle in self._lookups:
+            return self._lookups[handle]
+
         datafile = None
         datafiletype = None
-        for dfiletype in (pddata.pddatafile, npdata.npdatafile,
-                          pydata.pydatafile):
+        for dfiletype in DATAFILES:
             dfile = os.path.join(self.treant.abspath, handle, dfiletype)
             if os.path.exists(dfile):
                 datafile = dfile
@@ -79,15 +149,20 @@ class Data(object):
         if datafile is None and datafiletype is None:
             raise KeyError("No data for '{}'".format(handle))
 
+        if self.readonly:
+            self._lookups[handle] = (datafile, proxyfile, datafiletype)
+
         return (datafile, proxyfile, datafiletype)
 
     def _read_datafile(func):
         """Decorator for generating DataFile instance for reading data.
 
-        DataFile instance is generated and mounted at self._datafile. It
-        is then dereferenced after the method call. Since data files can be
-        deleted in the filesystem, this should handle cleanly the scenarios
-        in which data appears, goes missing, etc. while a Treant is loaded.
+        DataFile instance is generated and mounted at self._datafile for the
+        calling thread. It is then dereferenced after the method call,
+        restoring any DataFile mounted by an enclosing call. Since data files
+        can be deleted in the filesystem, this should handle cleanly the
+        scenarios in which data appears, goes missing, etc. while a Treant is
+        loaded.
 
         .. note:: Methods wrapped with this decorator need to have *handle* as
                   the first argument.
@@ -99,13 +174,14 @@ class Data(object):
             filename, proxy, filetype = self._get_datafile(handle)
 
             if filename:
-                self._datafile = DataFile(
+                outer = getattr(self._local, 'datafile', None)
+                self._local.datafile = DataFile(
                     os.path.join(self.treant.abspath, handle),
-                    datafiletype=filetype)
+                    datafiletype=filetype, readonly=self.readonly)
                 try:
                     out = func(self, handle, *args, **kwargs)
                 finally:
-                    del self._datafile
+                    self._local.datafile = outer
             else:
                 out = None
 
@@ -116,10 +192,12 @@ class Data(object):
     def _write_datafile(func):
         """Decorator for generating DataFile instance for writing data.
 
-        DataFile instance is generated and mounted at self._datafile. It
-        is then dereferenced after the method call. Since data files can be
-        deleted in the filesystem, this should handle cleanly the scenarios
-        in which data appears, goes missing, etc. while a Treant is loaded.
+        DataFile instance is generated and mounted at self._datafile for the
+        calling thread. It is then dereferenced after the method call,
+        restoring any DataFile mounted by an enclosing call. Since data files
+        can be deleted in the filesystem, this should handle cleanly the
+        scenarios in which data appears, goes missing, etc. while a Treant is
+        loaded.
 
         .. note:: Methods wrapped with this decorator need to have *handle* as
                   the first argument.
@@ -128,15 +206,17 @@ class Data(object):
 
         @wraps(func)
         def inner(self, handle, *args, **kwargs):
+            self._check_writable()
             dirname = os.path.join(self.treant.abspath, handle)
 
             self._makedirs(dirname)
-            self._datafile = DataFile(dirname)
+            outer = getattr(self._local, 'datafile', None)
+            self._local.datafile = DataFile(dirname)
 
             try:
                 out = func(self, handle, *args, **kwargs)
             finally:
-                del self._datafile
+                self._local.datafile = outer
 
             return out
 
@@ -198,13 +278,37 @@ class Data(object):
         self.remove(handle)
 
     @_write_datafile
-    def add(self, handle, data):
+    def add(self, handle, data, shard_rows=None, precision=None,
+            downcast=None):
         """Store data in Treant.
 
         A data instance can be a pandas object (Series, DataFrame, Panel),
-        a numpy array, or a pickleable python object. If the dataset doesn't
-        exist, it is added. If a dataset already exists for the given handle,
-        it is replaced.
+        a numpy array, an xarray object (Dataset, DataArray), a scipy sparse
+        matrix or a list of sparse matrices of the same shape, or a
+        pickleable python object. If the dataset doesn't exist, it is added.
+        If a dataset already exists for the given handle, it is replaced.
+
+        Sparse matrices, such as contact maps, are stored in compressed form,
+        with lists of matrices stacked into one; they are returned in their
+        original format.
+
+        Data is written to a temporary file alongside the existing dataset
+        which is renamed into place only once complete. The existing dataset
+        remains readable until then, and is left intact if writing fails or is
+        interrupted.
+
+        Floating point numpy arrays that don't need their full precision,
+        such as coordinates and quantities derived from them, can be stored
+        lossily and compressed, with *precision* rounding values to a number
+        of decimal places, or *downcast* storing them with a smaller dtype.
+        These are retrieved with their original dtype; storage and read
+        bandwidth are often cut several times over.
+
+        Very large numpy arrays can be split along their first axis into
+        shards with *shard_rows* rows each, stored as separate files. Shards
+        are locked independently, so regions of different shards can be
+        read and written at the same time, and retrieving a range of rows
+        reads only the shards holding them.
 
         :Arguments:
             *handle*
@@ -212,8 +316,87 @@ class Data(object):
             *data*
                 data structure to store
 
+        :Keywords:
+            *shard_rows*
+                for numpy arrays, number of rows in each shard; if ``None``,
+                the array is stored in a single file [``None``]
+            *precision*
+                for floating point numpy arrays, number of decimal places to
+                keep, as for XTC files; values are rounded, so e.g. 3 keeps
+                coordinates in Angstrom to within half a thousandth
+                [``None``]
+            *downcast*
+                for floating point numpy arrays, floating point dtype to store
+                the array as, such as ``'float32'`` or ``'float16'``; float16
+                can't be combined with *precision* [``None``]
+
         """
-        self._datafile.add_data('main', data)
+        datafiletype = self._datafile.add_data('main', data,
+                                               shard_rows=shard_rows,
+                                               precision=precision,
+                                               downcast=downcast)
+        self._remove_others(handle, datafiletype)
+
+    @_write_datafile
+    def create(self, handle, shape, dtype, chunks=None, fillvalue=None,
+               shard_rows=None):
+        """Preallocate a numpy array, to be filled in with
+        :meth:`write_region`.
+
+        This allows workers in separate processes to each write their part of
+        the array, such as the results for a block of frames, directly to
+        the dataset. If a dataset already exists for the given handle, it is
+        replaced.
+
+        :Arguments:
+            *handle*
+                name given to data; needed for retrieval
+            *shape*
+                shape of the array
+            *dtype*
+                dtype of the array
+
+        :Keywords:
+            *chunks*
+                shape of HDF5 chunks; ``True`` to choose one automatically,
+                ``None`` to store the array contiguously; chunks matching the
+                regions written keep writes from touching the same chunk
+                [``None``]
+            *fillvalue*
+                value of elements not yet written [``None``, for zero]
+            *shard_rows*
+                number of rows in each shard, as for :meth:`add`; the regions
+                written by each worker are best aligned with shards, so that
+                workers don't wait on each other [``None``]
+
+        """
+        datafiletype = self._datafile.create_data(
+            'main', shape, dtype, chunks=chunks, fillvalue=fillvalue,
+            shard_rows=shard_rows)
+        self._remove_others(handle, datafiletype)
+
+    @_read_datafile
+    def write_region(self, handle, region, values):
+        """Write values to a region of a stored numpy array, in place.
+
+        The dataset is locked exclusively for the duration of the write, so
+        writes from any number of threads or processes are applied one at a
+        time; only the writing itself is serialized, not the computing of the
+        values. For sharded arrays only the shards written to are locked.
+        Regions written by different workers should be disjoint.
+
+        :Arguments:
+            *handle*
+                name of numpy array to write to
+            *region*
+                index of the region to write, e.g. ``slice(100, 200)`` for
+                rows 100 to 199, or a tuple of slices
+            *values*
+                values to write; must broadcast to the region's shape
+
+        """
+        self._check_writable()
+        self._datafile.write_region('main', region, values)
 
     def remove(self, handle, **kwargs):
         """Remove a dataset, or some subset of a dataset.
@@ -241,21 +424,52 @@ class Data(object):
                 columns to remove
 
         """
+        self._check_writable()
         datafile, proxy, datafiletype = self._get_datafile(handle)
 
         if kwargs and datafiletype == pddata.pddatafile:
             self._delete_data(handle, **kwargs)
         elif datafile:
-            os.remove(datafile)
-            os.remove(proxy)
-            top = self.treant.abspath
-            directory = os.path.dirname(datafile)
-            while directory != top:
-                try:
-                    os.rmdir(directory)
-                    directory = os.path.dirname(directory)
-                except OSError:
-                    break
+            self._remove_datafile(datafile)
+
+    def _remove_datafile(self, datafile):
+        """Remove a datafile along with its auxiliary files.
+
+        Auxiliary files, such as the proxy file used for locks, are hidden
+        files prefixed with the datafile's name; these may have auxiliary
+        files of their own, such as the locks of shards. The directories
+        containing the datafile are removed up to the Treant's directory,
+        stopping at the first that isn't empty.
+
+        :Arguments:
+            *datafile*
+                path to datafile to remove
+
+        """
+        directory, filename = os.path.split(datafile)
+        os.remove(datafile)
+        for auxfile in os.listdir(directory):
+            if auxfile.lstrip('.').startswith("{}.".format(filename)):
+                os.remove(os.path.join(directory, auxfile))
+
+        top = self.treant.abspath
+        while directory != top:
+            try:
+                os.rmdir(directory)
+                directory = os.path.dirname(directory)
+            except OSError:
+                break
+
+    def _remove_others(self, handle, datafiletype):
+        """Remove datafiles of other types than the given one for a dataset,
+        such as those of a dataset it replaced.
+
+        """
+        directory = os.path.join(self.treant.abspath, handle)
+        for dfiletype in DATAFILES:
+            datafile = os.path.join(directory, dfiletype)
+            if dfiletype != datafiletype and os.path.exists(datafile):
+                self._remove_datafile(datafile)
 
     @_write_datafile
     def _delete_data(self, handle, **kwargs):
@@ -291,18 +505,7 @@ class Data(object):
         try:
             self._datafile.del_data('main', **kwargs)
         except NotImplementedError:
-            datafile = self._get_datafile(handle)[0]
-
-            os.remove(datafile)
-            os.remove(proxy)
-            top = self.treant.abspath
-            directory = os.path.dirname(datafile)
-            while directory != top:
-                try:
-                    os.rmdir(directory)
-                    directory = os.path.dirname(directory)
-                except OSError:
-                    break
+            self._remove_datafile(filename)
 
     @_read_datafile
     def retrieve(self, handle, **kwargs):
@@ -314,7 +517,19 @@ class Data(object):
 
         For pandas objects (Series, DataFrame, or Panel) subsets of the whole
         dataset can be returned using keywords such as *start* and *stop* for
-        ranges of rows, and *columns* for selected columns.
+        ranges of rows, and *columns* for selected columns. Ranges of rows
+        can also be returned for numpy arrays; for sharded arrays, only the
+        shards holding these rows are read. For sparse matrices, *start* and
+        *stop* give a range of rows, and for lists of sparse matrices, a range
+        of matrices; only the stored elements of these are read.
+
+        For structured numpy arrays, such as per-frame records, *columns*
+        selects fields; only these fields are read, and the array returned
+        has only these fields. Combined with *start* and *stop*, this keeps
+        memory use to the size of the selection rather than of the whole
+        dataset::
+
+            retrieve('records', columns=['time', 'rmsd'], start=1000)
 
         Also for pandas objects, the *where* keyword takes a string as input
         and can be used to filter out rows and columns without loading the full
@@ -331,6 +546,22 @@ class Data(object):
 
         See :meth:`pandas.HDFStore.select` for more information.
 
+        For xarray objects, *sel* and *isel* select by label and by position
+        along dimensions, and *variables* selects variables of a Dataset;
+        only the selected parts of the stored variables are read. For
+        example, given a DataArray with dimensions (frame, residue) and
+        time labels along frames::
+
+            retrieve('mydata', sel={'frame': slice(100, 200),
+                                    'residue': ['ALA', 'GLY']})
+
+        With *lazy*, numpy arrays are returned as a :class:`dask.array.Array`
+        chunked as stored in HDF5, Series and DataFrames as a dask
+        collection partitioned by ranges of rows, and xarray objects with
+        their variables as dask arrays; these read only the parts
+        of the dataset needed when computed, so datasets larger than memory
+        can be worked with. This requires dask.
+
         :Arguments:
             *handle*
                 name of data to retrieve
@@ -343,12 +574,29 @@ class Data(object):
             *stop*
                 row number to stop selection
             *columns*
-                list of columns to return; all columns returned by default
+                list of columns, or fields of structured arrays, to return;
+                all returned by default
             *iterator*
                 if True, return an iterator [``False``]
             *chunksize*
                 number of rows to include in iteration; implies
-                ``iterator=True``
+                ``iterator=True``; if *lazy*, number of rows in each
+                partition
+            *sel*
+                dict of labels to select along each dimension of an xarray
+                object
+            *isel*
+                dict of positions to select along each dimension of an
+                xarray object
+            *variables*
+                list of variables of an xarray Dataset to return
+            *lazy*
+                if True, return a dask collection reading the data on demand
+                [``False``]
+            *chunks*
+                if *lazy*, chunks of the dask arrays for numpy arrays and
+                xarray objects; by default, the HDF5 chunks they are stored
+                with
 
         :Returns:
             *data*
@@ -357,22 +605,325 @@ class Data(object):
         """
         return self._datafile.get_data('main', **kwargs)
 
+    @_read_datafile
+    def info(self, handle):
+        """Describe a stored dataset, without loading it.
+
+        Only metadata is read: HDF5 attributes and table metadata for numpy
+        arrays and pandas objects, and a small header stored ahead of the
+        object for pickled python objects.
+
+        For all datasets, the returned dict gives:
+
+            *type*
+                the datafile type
+            *size*
+                the size of the dataset on disk, in bytes
+
+        For numpy arrays, it also gives *shape*, *dtype*, number of rows as
+        *nrows*, field names of structured arrays as *columns*, the size in
+        memory as *nbytes*, and the HDF5 *chunks* and *compression*.
+
+        For pandas objects, it also gives the storage type as *pandas_type*,
+        *nrows*, *columns* for DataFrames, the *dtypes* of the stored table's
+        columns, and an estimate of the size in memory as *nbytes*.
+
+        For python objects, it also gives the object's type as *pytype* and
+        its *length*, if it has one.
+
+        :Arguments:
+            *handle*
+                name of dataset to describe
+
+        :Returns:
+            *info*
+                dict describing the dataset
+
+        """
+        return self._datafile.get_info('main')
+
+    def describe(self):
+        """Describe all stored datasets, without loading them.
+
+        :Returns:
+            *info*
+                dict giving the output of :meth:`info` for each dataset
+                handle
+
+        """
+        out = dict()
+        for handle in self.keys():
+            try:
+                out[handle] = self.info(handle)
+            except KeyError:
+                # removed since listing
+                pass
+        return out
+
     @_write_datafile
-    def append(self, handle, data):
+    def append(self, handle, data, shadow=False, segment=False):
         """Append rows to an existing dataset.
 
         The object must be of the same pandas class (Series, DataFrame, Panel)
         as the existing dataset, and it must have exactly the same columns
         (names included).
 
+        By default the dataset is locked for the duration of the append,
+        blocking any readers. With *shadow*, rows are instead appended to a
+        copy of the datafile that atomically replaces it when complete;
+        readers can continue to retrieve the dataset as it was before the
+        append while it is in progress. This costs a copy of the datafile,
+        so it is best suited to datasets that are read often, such as those
+        being monitored while a long analysis appends to them.
+
+        With *segment*, rows are instead written to a new segment file under
+        the dataset's directory without taking any lock, so many processes
+        can append to the same dataset at once. Segments are merged with the
+        rest of the dataset transparently on retrieval; use :meth:`compact`
+        to merge them into the datafile itself. Only Series and DataFrames
+        can be appended as segments.
+
         :Arguments:
             *handle*
                 name of data to append to
             *data*
                 data to append
 
+        :Keywords:
+            *shadow*
+                if True, append without blocking readers [``False``]
+            *segment*
+                if True, append as a new segment file [``False``]
+
+        """
+        self._datafile.append_data('main', data, shadow=shadow,
+                                   segment=segment)
+
+    @_write_datafile
+    def compact(self, handle):
+        """Merge segments appended to a dataset into its datafile.
+
+        Segments are merged in the order they were appended, into a copy of
+        the datafile that replaces it when complete; readers see the dataset
+        as it was until then, and retrieval is faster afterwards. Any
+        segments appended while compacting are left for the next compaction.
+
+        :Arguments:
+            *handle*
+                name of dataset to compact
+
+        :Returns:
+            *n_segments*
+                number of segments merged
+
+        """
+        filename, proxy, filetype = self._get_datafile(handle)
+        self._datafile.datafiletype = filetype
+        return self._datafile.compact_data('main')
+
+    @_read_datafile
+    def repack(self, handle, complevel=None, complib=None):
+        """Rewrite a dataset's datafile compactly, reclaiming free space.
+
+        HDF5 never reuses the space freed when rows are removed from pandas
+        objects, or when stored arrays are written over in place, so their
+        datafiles only grow. Repacking copies only the live data to a new
+        datafile, optionally with new compression settings, that replaces
+        the old one when complete. Readers can retrieve the dataset as it was
+        while this is done; writers wait. Datasets stored as pickles or
+        xarray objects are always written whole, so are left as they are.
+
+        :Arguments:
+            *handle*
+                name of dataset to repack
+
+        :Keywords:
+            *complevel*
+                compression level to rewrite with, from 0 to 9; for numpy
+                arrays and sparse matrices, 0 gives no compression
+                [``None``, to keep pandas' default or each array's own]
+            *complib*
+                compression library to rewrite with; for pandas objects, one
+                of those of :class:`pandas.HDFStore`, and otherwise
+                ``'gzip'`` or ``'lzf'`` [``None``]
+
+        :Returns:
+            *recovered*
+                bytes on disk recovered; 0 if the datafile is no smaller,
+                e.g. when rewritten without compression
+
+        """
+        self._check_writable()
+        return self._datafile.repack_data('main', complevel=complevel,
+                                          complib=complib)
+
+    def repack_all(self, complevel=None, complib=None):
+        """Rewrite all datasets' datafiles compactly.
+
+        See :meth:`repack`.
+
+        :Keywords:
+            *complevel*
+                compression level to rewrite with
+            *complib*
+                compression library to rewrite with
+
+        :Returns:
+            *recovered*
+                dict giving the bytes on disk recovered for each dataset
+                handle
+
+        """
+        self._check_writable()
+
+        out = dict()
+        for handle in self.keys():
+            try:
+                out[handle] = self.repack(handle, complevel=complevel,
+                                          complib=complib)
+            except KeyError:
+                # removed since listing
+                pass
+        return out
+
+    @_read_datafile
+    def _copy(self, handle, other, newhandle, method):
+        """Copy a dataset to the Data of another Treant.
+
+        """
+        other._check_writable()
+        dirname = os.path.join(other.treant.abspath, newhandle)
+        other._makedirs(dirname)
+
+        datafiletype = self._datafile.datafiletype
+        out = self._datafile.copy_data(dirname, method=method)
+        other._remove_others(newhandle, datafiletype)
+        return out
+
+    def copy_to(self, other, handles, newhandle=None, method='auto'):
+        """Copy datasets to another Sim, without reading them.
+
+        The files of each dataset are copied as they are, so datasets keep
+        their storage options, such as compression, chunking, shards, and
+        lossy storage, and nothing is deserialized or compressed again.
+        Where the filesystem supports it, files are copied as reflinks,
+        sharing their blocks with the originals until either is changed, so
+        even large datasets are copied in an instant without taking more
+        space. Readers of the other Sim's datasets see them as they were until
+        each copy is complete.
+
+        :Arguments:
+            *other*
+                Sim to copy to
+            *handles*
+                name of dataset to copy, or list of names
+
+        :Keywords:
+            *newhandle*
+                name to give the copy, if a single dataset is copied
+                [``None``, for the same name]
+            *method*
+                how to copy files: ``'reflink'``, ``'hardlink'``, ``'copy'``,
+                or ``'auto'`` to make reflinks where possible and copy
+                otherwise; hardlinked datasets share any changes made in
+                place, such as with :meth:`write_region` [``'auto'``]
+
+        :Returns:
+            *method*
+                the method used to copy the dataset's datafile; if *handles*
+                is a list, a dict giving this for each handle
+
+        """
+        data = other if isinstance(other, Data) else other.data
+
+        if isinstance(handles, six.string_types):
+            newhandle = handles if newhandle is None else newhandle
+            return self._copy(handles, data, newhandle, method)
+        elif newhandle is not None:
+            raise ValueError("A new handle can only be given when copying a "
+                             "single dataset.")
+
+        return dict((handle, self._copy(handle, data, handle, method))
+                    for handle in handles)
+
+    def move_to(self, other, handles, newhandle=None):
+        """Move datasets to another Sim, without reading them.
+
+        Datasets are copied as for :meth:`copy_to`, then removed. Within a
+        filesystem, files are hardlinked into place instead of copied, so
+        moves take an instant whatever the size of the datasets.
+
+        :Arguments:
+            *other*
+                Sim to move to
+            *handles*
+                name of dataset to move, or list of names
+
+        :Keywords:
+            *newhandle*
+                name to give the dataset, if a single dataset is moved
+                [``None``, for the same name]
+
+        :Returns:
+            *method*
+                the method used to move the dataset's datafile; if *handles*
+                is a list, a dict giving this for each handle
+
+        """
+        self._check_writable()
+        data = other if isinstance(other, Data) else other.data
+
+        def move(handle, newhandle):
+            try:
+                out = self._copy(handle, data, newhandle, 'hardlink')
+            except OSError as e:
+                # e.g. across filesystems
+                if e.errno not in HARDLINK_ERRNOS:
+                    raise
+                out = self._copy(handle, data, newhandle, 'auto')
+
+            self.remove(handle)
+            return out
+
+        if isinstance(handles, six.string_types):
+            return move(handles, handles if newhandle is None else newhandle)
+        elif newhandle is not None:
+            raise ValueError("A new handle can only be given when moving a "
+                             "single dataset.")
+
+        return dict((handle, move(handle, handle)) for handle in handles)
+
+    def usage(self):
+        """Get the space on disk taken by each dataset, without opening any.
+
+        Only the sizes of files are looked up, so this is fast even for many
+        large datasets.
+
+        :Returns:
+            *usage*
+                dict giving, for each dataset handle, the datafile type as
+                *type*, and the total size in bytes of the datafile and its
+                auxiliary files, such as segments and shards, as *size*
+
         """
-        self._datafile.append_data('main', data)
+        out = dict()
+        top = self.treant.abspath
+        for root, dirs, files in os.walk(top):
+            datafiletype, members = _datafiles(files)
+            if datafiletype is None:
+                continue
+
+            size = 0
+            for filename in members:
+                try:
+                    size += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    # removed since listing
+                    pass
+
+            out[os.path.relpath(root, start=top)] = {'type': datafiletype,
+                                                     'size': size}
+        return out
 
     def keys(self):
         """List available datasets.
@@ -382,12 +933,17 @@ class Data(object):
                 list of handles to available datasets
 
         """
+        if self._keys is not None:
+            return list(self._keys)
+
         datasets = list()
         top = self.treant.abspath
         for root, dirs, files in os.walk(top):
-            if ((pddata.pddatafile in files) or
-                    (npdata.npdatafile in files) or
-                    (pydata.pydatafile in files)):
+            if any(datafile in files for datafile in DATAFILES):
                 datasets.append(os.path.relpath(root, start=top))
         datasets.sort()
+
+        if self.readonly:
+            self._keys = list(datasets)
+
         return datasets
@@ -7,8 +7,10 @@ from datreant import discover as _discover
 from datreant import Bundle
 from datreant.names import TREANTDIR_NAME
 
-from .treants import Sim
+from .treants import Sim, _usage as _treant_usage
+from .data import Data
 from .names import SIMDIR_NAME
+from .util import starmap, isinstance_lazy
 
 
 def _is_sim(treant):
@@ -17,9 +19,239 @@ def _is_sim(treant):
                                        SIMDIR_NAME))
 
 
-def discover(dirpath='.', depth=None, treantdepth=None):
+def discover(dirpath='.', depth=None, treantdepth=None, immutable=False):
+    """Find all Sims within a given directory, recursively.
+
+    Parameters
+    ----------
+    dirpath : str
+        Top-level directory to search.
+    depth : int
+        Maximum directory depth to tolerate while traversing in search of
+        Sims. ``None`` indicates no depth limit.
+    treantdepth : int
+        Maximum depth of Sims to tolerate while traversing in search of
+        Sims. ``None`` indicates no Sim depth limit.
+    immutable : bool
+        If True, give the Sims as immutable; see :class:`Sim`.
+
+    Returns
+    -------
+    found : Bundle
+        Bundle of found Sims.
+
+    """
     treants = _discover(dirpath=dirpath,
                         depth=depth,
                         treantdepth=treantdepth)
 
-    return Bundle([Sim(treant) for treant in treants if _is_sim(treant)])
+    return Bundle([Sim(treant, immutable=immutable)
+                   for treant in treants if _is_sim(treant)])
+
+
+def _describe(treant):
+    return (treant.abspath, Data(treant).describe())
+
+
+def describe(bundle, processes=1):
+    """Describe the stored datasets of each member of a Bundle, without loading
+    them.
+
+    Parameters
+    ----------
+    bundle : Bundle
+        Treants whose datasets to describe.
+    processes : int
+        Number of processes to use.
+
+    Returns
+    -------
+    info : dict
+        For each member's absolute path, the output of
+        :meth:`mdsynthesis.data.Data.describe`.
+
+    """
+    out = bundle.map(_describe, processes=processes)
+    return dict(out) if out else dict()
+
+
+def _usage(treant):
+    # read-only, so that neither lock files nor a Sim's state are created
+    if _is_sim(treant):
+        return (treant.abspath,
+                Sim(treant.abspath, immutable=True).usage())
+
+    return (treant.abspath, _treant_usage(treant.abspath))
+
+
+def usage(bundle, processes=1):
+    """Get the space on disk taken by each member of a Bundle.
+
+    Only the sizes of files are looked up, so with enough processes this
+    takes seconds even for many thousands of Sims. Nothing is written, so
+    Treants on read-only storage can be measured; members that aren't Sims
+    are measured as Sims without a universe definition or coordinate
+    caches.
+
+    Parameters
+    ----------
+    bundle : Bundle
+        Treants whose disk usage to get.
+    processes : int
+        Number of processes to use.
+
+    Returns
+    -------
+    usage : dict
+        For each member's absolute path, the output of
+        :meth:`mdsynthesis.Sim.usage`.
+
+    """
+    out = bundle.map(_usage, processes=processes)
+    return dict(out) if out else dict()
+
+
+def _repack(treant, complevel=None, complib=None):
+    return (treant.abspath,
+            Data(treant).repack_all(complevel=complevel, complib=complib))
+
+
+def repack(bundle, complevel=None, complib=None, processes=1):
+    """Rewrite the datafiles of each member of a Bundle compactly, reclaiming
+    free space.
+
+    Parameters
+    ----------
+    bundle : Bundle
+        Treants whose datasets to repack.
+    complevel : int
+        Compression level to rewrite with; see
+        :meth:`mdsynthesis.data.Data.repack`.
+    complib : str
+        Compression library to rewrite with; see
+        :meth:`mdsynthesis.data.Data.repack`.
+    processes : int
+        Number of processes to use.
+
+    Returns
+    -------
+    recovered : dict
+        For each member's absolute path, the bytes on disk recovered for
+        each dataset, as given by
+        :meth:`mdsynthesis.data.Data.repack_all`.
+
+    """
+    out = bundle.map(_repack, processes=processes, complevel=complevel,
+                     complib=complib)
+    return dict(out) if out else dict()
+
+
+def _define_universe(abspath, definition):
+    Sim(abspath).universedef.define(**definition)
+
+
+def define_universes(bundle, definitions, processes=1):
+    """Set the universe definition of each member of a Bundle.
+
+    Each definition is written in a single transaction with
+    :meth:`mdsynthesis.metadata.UniverseDefinition.define`.
+
+    Parameters
+    ----------
+    bundle : Bundle
+        Sims whose universes to define.
+    definitions : dict or list
+        Keyword arguments to
+        :meth:`~mdsynthesis.metadata.UniverseDefinition.define`, i.e.
+        *topology*, and optionally *trajectory* and *kwargs*; either a single
+        dict used for every member, or a list of dicts, one for each member
+        in member order.
+    processes : int
+        Number of processes to use.
+
+    """
+    if isinstance(definitions, dict):
+        definitions = [definitions] * len(bundle)
+    elif len(definitions) != len(bundle):
+        raise ValueError("Need one definition for each member of the "
+                         "Bundle, or a single definition for all.")
+
+    starmap(_define_universe, zip(bundle.abspaths, definitions),
+            processes=processes)
+
+
+def _update_atomselections(treant, selections=None):
+    sim = treant if isinstance(treant, Sim) else Sim(treant)
+    sim.atomselections.update(selections)
+
+
+def update_atomselections(bundle, selections, processes=1):
+    """Add many atom selections at once to each member of a Bundle.
+
+    Selections are written to each member in a single transaction with
+    :meth:`mdsynthesis.metadata.AtomSelections.update`.
+
+    Parameters
+    ----------
+    bundle : Bundle
+        Sims to add selections to.
+    selections : dict
+        Selections to add, with handles as keys.
+    processes : int
+        Number of processes to use.
+
+    """
+    bundle.map(_update_atomselections, processes=processes,
+               selections=selections)
+
+
+def concatenate(bundle, handle, **kwargs):
+    """Concatenate a dataset across the members of a Bundle into a single dask
+    collection, without reading it.
+
+    Each member's dataset is retrieved lazily with
+    :meth:`mdsynthesis.data.Data.retrieve`, and these are joined along
+    their first axis, in member order; members without the dataset are
+    skipped. Reductions over the whole ensemble can then be computed with any
+    dask scheduler, reading the datasets a chunk at a time. This requires
+    dask.
+
+    Parameters
+    ----------
+    bundle : Bundle
+        Treants whose datasets to concatenate.
+    handle : str
+        Name of the dataset; must be a numpy array for all members, or a
+        Series or DataFrame for all members.
+    **kwargs
+        Keyword arguments to :meth:`~mdsynthesis.data.Data.retrieve`, such
+        as *chunks* or *chunksize*, or *start* and *stop* to select the
+        same rows from each member.
+
+    Returns
+    -------
+    data : dask.array.Array or dask.dataframe.DataFrame
+        Concatenated datasets.
+
+    """
+    parts = list()
+    for treant in bundle:
+        data = treant.data if isinstance(treant, Sim) else Data(treant)
+        try:
+            parts.append(data.retrieve(handle, lazy=True, **kwargs))
+        except KeyError:
+            continue
+
+    if not parts:
+        raise KeyError("No member has data for '{}'".format(handle))
+
+    arrays = [isinstance_lazy(part, 'dask.array', 'Array') for part in parts]
+    if all(arrays):
+        import dask.array as da
+        return da.concatenate(parts)
+    elif not any(arrays):
+        import dask.dataframe as dd
+        return dd.concat(parts)
+    else:
+        raise TypeError("Cannot concatenate numpy arrays with pandas "
+                        "objects.")
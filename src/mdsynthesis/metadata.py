@@ -6,16 +6,59 @@ Sim) in ways that are user-friendly.
 
 """
 import os
+import json
+import errno
+from contextlib import contextmanager
 from six import string_types
-import numpy as np
-from numpy.lib.utils import deprecate
-import warnings
 
 from datreant import Leaf
-from datreant.metadata import Metadata
-import MDAnalysis as mda
+from datreant.metadata import Metadata, Tags, Categories
 
 from .names import SIMDIR_NAME
+from .util import isinstance_lazy
+
+
+class FrozenFile(object):
+    """Stand-in for a JSONFile whose state is read once, without locking.
+
+    """
+
+    def __init__(self, filename, init_state):
+        self.filename = filename
+        try:
+            with open(filename, 'r') as f:
+                self._state = json.load(f)
+        except (IOError, OSError):
+            init_state(self)
+
+    @contextmanager
+    def read(self):
+        yield self._state
+
+
+class ReadOnly(object):
+    """Mixin making a Metadata component read-only.
+
+    The component's state file is read without locking on first access, and
+    its state is cached for the life of the component. Any attempt to modify
+    it raises :exc:`OSError`.
+
+    """
+
+    @property
+    def _read(self):
+        if getattr(self, '_frozen', None) is None:
+            self._frozen = FrozenFile(
+                os.path.join(self._tree._treantdir, self._statefilename),
+                init_state=self._init_state)
+
+        self._statefile = self._frozen
+        return self._frozen.read()
+
+    @property
+    def _write(self):
+        raise OSError(errno.EROFS, "{} of '{}' are read-only".format(
+            self.__class__.__name__, self._tree.abspath))
 
 
 class UniverseDefinition(Metadata):
@@ -41,6 +84,58 @@ class UniverseDefinition(Metadata):
             'kwargs': dict()
         }
 
+    @staticmethod
+    def _topology_path(path):
+        """Normalize a topology path for storage.
+
+        """
+        if isinstance(path, string_types):
+            return os.path.abspath(path)
+        elif isinstance(path, Leaf):
+            return path.abspath
+        elif path is None:
+            return None
+        else:
+            raise TypeError("Path to topology must be a string or Leaf")
+
+    @staticmethod
+    def _trajectory_paths(path):
+        """Normalize trajectory path(s) for storage.
+
+        """
+        if isinstance(path, string_types):
+            trajs = [path]
+        elif isinstance(path, Leaf):
+            trajs = [path.abspath]
+        elif isinstance(path, (list, tuple)):
+            trajs = list(path)
+        elif path is None:
+            trajs = []
+        else:
+            raise TypeError("Path to topology must be a string, Leaf, or"
+                            " list/tuple of paths.")
+
+        return [os.path.abspath(traj) for traj in trajs]
+
+    @staticmethod
+    def _check_kwargs(kwargs):
+        """Check that universe keyword arguments can be stored.
+
+        """
+        if kwargs is None:
+            pass
+        elif isinstance(kwargs, dict):
+            # check that values are serializable
+            for key, value in kwargs.items():
+                if not (isinstance(value, (string_types, bool, int, float)) or
+                        value is None):
+                    raise ValueError("Cannot store keyword '{}' for Universe; "
+                                     "value must be a string, bool, int, "
+                                     "float, or ``None``, "
+                                     "not '{}'".format(key, type(value)))
+        else:
+            raise TypeError("Must be a dictionary or ``None``")
+
     @property
     def topology(self):
         """The topology file for this Sim's universe.
@@ -60,16 +155,7 @@ class UniverseDefinition(Metadata):
 
     @topology.setter
     def topology(self, path):
-        if isinstance(path, string_types):
-            path = path
-        elif isinstance(path, Leaf):
-            path = path.abspath
-        elif path is None:
-            pass
-        else:
-            raise TypeError("Path to topology must be a string or Leaf")
-
-        self._set_topology(path)
+        self._set_topology(self._topology_path(path))
 
         # Move into Sim
         # reset universe, if present
@@ -78,13 +164,8 @@ class UniverseDefinition(Metadata):
 
     def _set_topology(self, path):
         with self._write:
-            mdsdict = self._statefile._state
-            topstate = mdsdict['topology']
-
-            if path is None:
-                mdsdict['topology'] = dict()
-            else:
-                topstate['abspath'] = os.path.abspath(path)
+            self._statefile._state['topology'] = (
+                dict() if path is None else {'abspath': path})
 
     @property
     def trajectory(self):
@@ -98,41 +179,25 @@ class UniverseDefinition(Metadata):
 
         """
         with self._read:
-            mdsdict = self._statefile._state
-            traj = mdsdict['trajectory']
-            if not traj:
-                return None
-            elif len(traj) == 1:
-                return traj[0][0]
-            else:
-                return tuple([t[0] for t in traj])
+            return self._get_trajectory(self._statefile._state)
 
-    @trajectory.setter
-    def trajectory(self, path):
-        if isinstance(path, string_types):
-            trajs = [path]
-        elif isinstance(path, Leaf):
-            trajs = [path.abspath]
-        elif isinstance(path, (list, tuple)):
-            trajs = list(path)
-        elif path is None:
-            trajs = []
+    @staticmethod
+    def _get_trajectory(mdsdict):
+        traj = mdsdict['trajectory']
+        if not traj:
+            return None
+        elif len(traj) == 1:
+            return traj[0][0]
         else:
-            raise TypeError("Path to topology must be a string, Leaf, or"
-                            " list/tuple of paths.")
+            return tuple([t[0] for t in traj])
 
-        self._set_trajectory(trajs)
+    @trajectory.setter
+    def trajectory(self, path):
+        self._set_trajectory(self._trajectory_paths(path))
 
     def _set_trajectory(self, trajs):
         with self._write:
-            mdsdict = self._statefile._state
-            mdsdict['trajectory'] = []
-            trajstate = mdsdict['trajectory']
-
-            for traj in trajs:
-                trajstate.append([
-                    os.path.abspath(traj),
-                ])
+            self._statefile._state['trajectory'] = [[traj] for traj in trajs]
 
     @property
     def kwargs(self):
@@ -149,48 +214,196 @@ class UniverseDefinition(Metadata):
 
     @kwargs.setter
     def kwargs(self, kwargs):
-        if kwargs is None:
-            pass
-        elif isinstance(kwargs, dict):
-            # check that values are serializable
-            for key, value in kwargs.items():
-                if not (isinstance(value, (string_types, bool, int, float)) or
-                        value is None):
-                    raise ValueError("Cannot store keyword '{}' for Universe; "
-                                     "value must be a string, bool, int, "
-                                     "float, or ``None``, "
-                                     "not '{}'".format(key, type(value)))
-        else:
-            raise TypeError("Must be a dictionary or ``None``")
+        self._check_kwargs(kwargs)
 
         with self._write:
             self._statefile._state['kwargs'] = kwargs
 
-    @property
-    def _args(self):
-        """dict to generate a universe"""
-        if self.topology is None:
+    def define(self, topology, trajectory=None, kwargs=None):
+        """Set the topology, trajectory and keyword arguments of the universe
+        all at once.
+
+        The definition is validated in full, then written to the state file
+        under a single lock; it is replaced entirely, so nothing is kept from
+        the previous definition. Alternate definitions are unaffected.
+
+        Parameters
+        ----------
+        topology : str or Leaf
+            Path to the topology file; ``None`` disables the universe.
+        trajectory : str, Leaf, list, or tuple
+            Path(s) to the trajectory file(s), used in order; ``None`` for no
+            trajectory.
+        kwargs : dict
+            Keyword arguments applied when building the universe; values must
+            be strings, ints, floats, bools, or ``None``.
+
+        """
+        definition = self._definition(topology, trajectory, kwargs)
+
+        with self._write:
+            self._statefile._state.update(definition)
+
+    @classmethod
+    def _definition(cls, topology, trajectory, kwargs):
+        """Validate a universe definition, giving it in its stored form.
+
+        """
+        topology = cls._topology_path(topology)
+        trajs = cls._trajectory_paths(trajectory)
+        cls._check_kwargs(kwargs)
+
+        return {
+            'topology': dict() if topology is None else {'abspath': topology},
+            'trajectory': [[traj] for traj in trajs],
+            'kwargs': dict() if kwargs is None else kwargs
+        }
+
+    @classmethod
+    def _get_args(cls, mdsdict):
+        if not mdsdict['topology']:
             return None
         args = [
-            self.topology,
+            mdsdict['topology']['abspath'],
         ]
-        if self.trajectory is not None:
-            args.append(self.trajectory)
+        trajectory = cls._get_trajectory(mdsdict)
+        if trajectory is not None:
+            args.append(trajectory)
         return args
 
+    @property
+    def _args(self):
+        """dict to generate a universe"""
+        with self._read:
+            return self._get_args(self._statefile._state)
+
+    @property
+    def alternates(self):
+        """Names of the alternate universe definitions of this Sim.
+
+        Alternate definitions give other universes for the same simulation,
+        such as reduced or strided trajectories, and can be built by name
+        with :meth:`mdsynthesis.Sim.alternate`.
+
+        """
+        with self._read:
+            return sorted(self._statefile._state.get('alternates', dict()))
+
+    def add_alternate(self, name, topology, trajectory=None, kwargs=None):
+        """Add an alternate universe definition.
+
+        If an alternate definition with the given name already exists, it is
+        replaced.
+
+        Parameters
+        ----------
+        name : str
+            Name for the alternate definition.
+        topology : str or Leaf
+            Path to the topology file.
+        trajectory : str, Leaf, list, or tuple
+            Path(s) to the trajectory file(s), used in order; ``None`` for no
+            trajectory.
+        kwargs : dict
+            Keyword arguments applied when building the universe; values must
+            be strings, ints, floats, bools, or ``None``.
+
+        """
+        if topology is None:
+            raise ValueError("An alternate universe needs a topology.")
+
+        definition = self._definition(topology, trajectory, kwargs)
+
+        with self._write:
+            alternates = self._statefile._state.setdefault('alternates',
+                                                           dict())
+            alternates[name] = definition
+
+    def remove_alternate(self, name):
+        """Remove an alternate universe definition.
+
+        If the named definition doesn't exist, :exc:`KeyError` raised.
+
+        Parameters
+        ----------
+        name : str
+            Name of the alternate definition to remove.
+
+        """
+        with self._write:
+            alternates = self._statefile._state.get('alternates', dict())
+            try:
+                del alternates[name]
+            except KeyError:
+                raise KeyError("No alternate universe '{}'".format(name))
+
+    def get_alternate(self, name):
+        """Get an alternate universe definition.
+
+        If the named definition doesn't exist, :exc:`KeyError` raised.
+
+        Parameters
+        ----------
+        name : str
+            Name of the alternate definition.
+
+        Returns
+        -------
+        definition : dict
+            The *topology*, *trajectory*, and *kwargs* of the alternate
+            universe, given as for the Sim's universe.
+
+        """
+        with self._read:
+            alternates = self._statefile._state.get('alternates', dict())
+            try:
+                mdsdict = alternates[name]
+            except KeyError:
+                raise KeyError("No alternate universe '{}'".format(name))
+
+            return {'topology': mdsdict['topology']['abspath'],
+                    'trajectory': self._get_trajectory(mdsdict),
+                    'kwargs': mdsdict['kwargs']}
+
+    def _alternate_args(self, name):
+        """args and kwargs to generate an alternate universe"""
+        with self._read:
+            alternates = self._statefile._state.get('alternates', dict())
+            try:
+                mdsdict = alternates[name]
+            except KeyError:
+                raise KeyError("No alternate universe '{}'".format(name))
+
+            return self._get_args(mdsdict), mdsdict['kwargs']
+
+    def _files(self):
+        """Paths to the topology and trajectory files of the universe
+        definition and of all alternates, read under a single lock.
+
+        """
+        with self._read:
+            state = self._statefile._state
+            definitions = ([state] +
+                           list(state.get('alternates', dict()).values()))
+
+            paths = list()
+            for mdsdict in definitions:
+                if mdsdict.get('topology'):
+                    paths.append(mdsdict['topology']['abspath'])
+                paths.extend(traj[0] for traj in mdsdict.get('trajectory', []))
+
+        return paths
+
     def _clear(self):
-        self._set_topology(None)
-        self._set_trajectory([])
-        self.kwargs = None
+        self.define(None)
 
     def update(self, universe):
         if universe is None:
             self._clear()
-        elif not isinstance(universe, mda.Universe):
+        elif not isinstance_lazy(universe, 'MDAnalysis', 'Universe'):
             raise TypeError(
                 "Cannot set to {}; must be Universe".format(type(universe)))
         else:
-            self.topology = universe.filename
             try:  # ChainReader?
                 traj = universe.trajectory.filenames
             except AttributeError:
@@ -198,8 +411,7 @@ class UniverseDefinition(Metadata):
                     traj = [universe.trajectory.filename]
                 except AttributeError:  # Only topology
                     traj = []
-            self.trajectory = traj
-            self.kwargs = universe.kwargs
+            self.define(universe.filename, traj, universe.kwargs)
 
 
 class AtomSelections(Metadata):
@@ -247,9 +459,7 @@ class AtomSelections(Metadata):
         """Selection for the given handle.
 
         """
-        if isinstance(selection, (string_types, np.ndarray)):
-            selection = [selection]
-        self.add(handle, *selection)
+        self.add(handle, *self._as_tuple(selection))
 
     def __iter__(self):
         return self.keys().__iter__()
@@ -279,27 +489,64 @@ class AtomSelections(Metadata):
             structural alignments.
 
         """
-        if len(selection) == 1:
-            sel = selection[0]
-            if isinstance(sel, np.ndarray):
-                outsel = sel.tolist()
-            elif isinstance(sel, string_types):
-                outsel = sel
-        else:
-            outsel = list()
-            for sel in selection:
-                if isinstance(sel, np.ndarray):
-                    outsel.append(sel.tolist())
-                elif isinstance(sel, string_types):
-                    outsel.append(sel)
-                else:
-                    raise ValueError("Selections must be strings, arrays of "
-                                     "atom indices, or tuples/lists of these.")
+        outsel = self._serialize(selection)
 
         with self._write:
             seldict = self._statefile._state
             seldict[handle] = outsel
 
+    @staticmethod
+    def _as_tuple(selection):
+        """Give a selection as a tuple of its parts.
+
+        """
+        if (isinstance(selection, string_types) or
+                isinstance_lazy(selection, 'numpy', 'ndarray')):
+            return (selection,)
+        else:
+            return tuple(selection)
+
+    @staticmethod
+    def _serialize(selection):
+        """Convert a tuple of selection parts to its stored form.
+
+        """
+        outsel = list()
+        for sel in selection:
+            if isinstance_lazy(sel, 'numpy', 'ndarray'):
+                outsel.append(sel.tolist())
+            elif isinstance(sel, string_types):
+                outsel.append(sel)
+            else:
+                raise ValueError("Selections must be strings, arrays of "
+                                 "atom indices, or tuples/lists of these.")
+
+        if len(outsel) == 1:
+            outsel = outsel[0]
+
+        return outsel
+
+    def update(self, selections):
+        """Add many atom selections at once.
+
+        All selections are validated before any is stored, then written
+        together in a single transaction. Selections with the same handles as
+        existing ones replace them.
+
+        Parameters
+        ----------
+        selections : dict
+            Selections to add, with handles as keys; each value can be given
+            in any form accepted for a single selection, e.g. a selection
+            string, an array of atom indices, or a list/tuple of these.
+
+        """
+        outsels = {handle: self._serialize(self._as_tuple(selection))
+                   for handle, selection in selections.items()}
+
+        with self._write:
+            self._statefile._state.update(outsels)
+
     def remove(self, *handle):
         """Remove an atom selection for the universe.
 
@@ -391,6 +638,8 @@ class AtomSelections(Metadata):
             list of strings defining the atom selection
 
         """
+        import numpy as np
+
         with self._read:
             seldict = self._statefile._state
 
@@ -416,3 +665,27 @@ class AtomSelections(Metadata):
             out = tuple(out)
 
         return out
+
+
+class ReadOnlyUniverseDefinition(ReadOnly, UniverseDefinition):
+    """The defined universe of the Sim, read-only.
+
+    """
+
+
+class ReadOnlyAtomSelections(ReadOnly, AtomSelections):
+    """Stored atom selections for the universe, read-only.
+
+    """
+
+
+class ReadOnlyTags(ReadOnly, Tags):
+    """Interface to tags, read-only.
+
+    """
+
+
+class ReadOnlyCategories(ReadOnly, Categories):
+    """Interface to categories, read-only.
+
+    """
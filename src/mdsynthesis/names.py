@@ -1 +1,3 @@
 SIMDIR_NAME = 'mdsynthesis'
+COORDINATES_DIR_NAME = 'coordinates'
+UNIVERSES_DIR_NAME = 'universes'
@@ -0,0 +1,514 @@
+"""
+Base components shared by the file backends for storing datasets.
+
+"""
+
+import os
+import errno
+import fcntl
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+from datreant.state import BaseFile
+
+try:
+    from threading import get_ident
+except ImportError:  # python 2
+    from thread import get_ident
+
+
+class ProxyLock(object):
+    """Readers-writer lock on a proxy file, shared by all threads of a process.
+
+    Advisory locks from `fcntl.lockf` belong to the process, not to the file
+    descriptor or thread that applied them: threads of one process never
+    block each other with them, and closing any descriptor to the proxy file
+    drops every lock the process holds on it. A ProxyLock therefore keeps a
+    single lock on the proxy file for the whole process, applied while any of
+    its threads hold the ProxyLock and released when the last one is done,
+    and arbitrates between the threads itself.
+
+    Acquisitions are reentrant per thread, and a thread holding the lock
+    exclusively can also acquire it shared. A thread holding it shared can
+    acquire it exclusively once it is the only thread holding it; if another
+    process upgrades its lock at the same time, one of them gives up its
+    shared lock until the other is done, rather than deadlock.
+
+    Use `get` and `put` to obtain and return the ProxyLock for a path, so
+    that all threads use the same one.
+
+    """
+    _registry = dict()
+    _registry_lock = threading.Lock()
+    _pid = None
+
+    def __init__(self, path):
+        self.path = path
+        self.users = 0
+
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = dict()
+        self._writer = None
+        self._writes = 0
+        self._waiting = 0
+
+        self._fds = list()
+        self._mode = None
+        self._pending = False
+
+    @classmethod
+    def get(cls, path):
+        """Get the ProxyLock for the given path.
+
+        Each call must be matched by a call to `put` once the lock is no
+        longer needed.
+
+        """
+        with cls._registry_lock:
+            # locks aren't inherited by forked processes; neither is this
+            if cls._pid != os.getpid():
+                cls._registry = dict()
+                cls._pid = os.getpid()
+
+            lock = cls._registry.get(path)
+            if lock is None:
+                lock = cls._registry[path] = cls(path)
+            lock.users += 1
+
+        return lock
+
+    @classmethod
+    def put(cls, lock):
+        """Return a ProxyLock obtained with `get`.
+
+        """
+        with cls._registry_lock:
+            lock.users -= 1
+            if not lock.users and cls._registry.get(lock.path) is lock:
+                del cls._registry[lock.path]
+
+    def acquire(self, exclusive=False):
+        me = get_ident()
+        with self._cond:
+            if exclusive:
+                self._waiting += 1
+                try:
+                    while not (self._writer in (None, me) and
+                               set(self._readers) <= set([me])):
+                        self._cond.wait()
+                finally:
+                    self._waiting -= 1
+                self._writer = me
+                self._writes += 1
+            else:
+                # waiting writers go first, except for reentrant reads
+                while not (self._writer == me or me in self._readers or
+                           (self._writer is None and not self._waiting)):
+                    self._cond.wait()
+                self._readers[me] = self._readers.get(me, 0) + 1
+
+            try:
+                self._sync()
+            except BaseException:
+                self._leave(me, exclusive)
+                self._cond.notify_all()
+                # restore the lock for those still held, such as a shared
+                # one given up for an upgrade
+                self._sync()
+                raise
+
+    def release(self, exclusive=False):
+        me = get_ident()
+        with self._cond:
+            self._leave(me, exclusive)
+            self._cond.notify_all()
+            self._sync()
+
+    def _leave(self, me, exclusive):
+        if exclusive:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+        else:
+            self._readers[me] -= 1
+            if not self._readers[me]:
+                del self._readers[me]
+
+    def _sync(self):
+        """Set the process's lock on the proxy file to match the holders;
+        must be called holding `_cond`.
+
+        Waiting for other processes can take any time, so `_cond` is
+        released meanwhile, with the change marked as pending; other threads
+        wait for it to be done before changing the lock themselves. Since
+        the holders may have changed by then, the lock is checked again.
+
+        """
+        while True:
+            while self._pending:
+                self._cond.wait()
+
+            if self._writer is not None:
+                mode = 'exclusive'
+            elif self._readers:
+                mode = 'shared'
+            else:
+                mode = None
+
+            if mode == self._mode:
+                return
+
+            self._pending = True
+            self._cond.release()
+            try:
+                self._apply(mode)
+            finally:
+                self._cond.acquire()
+                self._pending = False
+                self._cond.notify_all()
+
+    def _apply(self, mode):
+        """Set the process's lock on the proxy file to the given mode.
+
+        File descriptors are only closed once no lock is needed, since
+        closing one would drop the lock.
+
+        """
+        try:
+            if mode is None:
+                fcntl.lockf(self._fds[0][0], fcntl.LOCK_UN)
+                self._mode = None
+            elif mode == 'exclusive':
+                fds = [fd for fd, writable in self._fds if writable]
+                if not fds:
+                    fds.append(os.open(self.path, os.O_RDWR | os.O_CREAT))
+                    self._fds.append((fds[0], True))
+                self._lock(fds[0], fcntl.LOCK_EX)
+            else:
+                if not self._fds:
+                    self._fds.append((os.open(self.path,
+                                              os.O_RDONLY | os.O_CREAT),
+                                      False))
+                self._lock(self._fds[0][0], fcntl.LOCK_SH)
+            self._mode = mode
+        finally:
+            if self._mode is None:
+                for fd, writable in self._fds:
+                    os.close(fd)
+                self._fds = list()
+
+    def _lock(self, fd, operation):
+        """Apply a lock to the proxy file, waiting for other processes.
+
+        The kernel refuses to wait on a process that waits for a lock this
+        one holds, as when two processes holding the lock shared both upgrade
+        it. A shared lock is then given up until the exclusive one is
+        applied, so that the other process can go first. Since the kernel
+        can't tell which thread waits for what, this is also reported when
+        no deadlock exists; the lock is applied again shortly after.
+
+        """
+        delay = 0.001
+        while True:
+            try:
+                fcntl.lockf(fd, operation)
+                return
+            except (IOError, OSError) as e:
+                if e.errno != errno.EDEADLK:
+                    raise
+
+            if self._mode == 'shared':
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+                self._mode = None
+            time.sleep(delay)
+            delay = min(2 * delay, 0.1)
+
+
+class File(BaseFile):
+    """Base class for data file backends.
+
+    In addition to the shared and exclusive locks given by
+    :class:`datreant.state.BaseFile`, writes can be *staged*: they are made
+    to a buffer file that atomically replaces the datafile once complete.
+    A staged write holds only a shared lock on the datafile's proxy, so
+    readers are never blocked by it and see the old data until the buffer is
+    committed. In-place writers still get exclusive access, and staged writes
+    are serialized among themselves with an exclusive lock on a separate
+    writer proxy file.
+
+    Child classes implementing staged writes need to implement
+    `_open_buffer_w`, which should open the buffer file given by
+    `_writebuffer` for writing.
+
+    Locks are applied through a :class:`ProxyLock`, so they also hold between
+    threads of the same process. A File instance itself should only be used
+    by one thread at a time.
+
+    A *readonly* File takes no locks at all, and doesn't create the proxy
+    file; it can be used for datafiles that no one modifies, such as those on
+    read-only storage. Any attempt to write raises :exc:`OSError`.
+
+    :Arguments:
+        *filename*
+            name of file on disk object corresponds to
+
+    :Keywords:
+        *readonly*
+            if True, read without locking and refuse writes [``False``]
+
+    """
+
+    def __init__(self, filename, readonly=False):
+        self.readonly = readonly
+        if not readonly:
+            super(File, self).__init__(filename)
+        else:
+            self.filename = os.path.abspath(filename)
+            self.handle = None
+            self.fd = None
+            self.fdlock = None
+            self.proxy = self._auxfile('proxy')
+
+    def _check_writable(self):
+        """Raise :exc:`OSError` if the File is read-only.
+
+        """
+        if self.readonly:
+            raise OSError(errno.EROFS,
+                          "Datafile is read-only: '{}'".format(self.filename))
+
+    def _auxfile(self, suffix):
+        """Path to an auxiliary file for this datafile.
+
+        Auxiliary files are hidden and prefixed with the datafile's name, so
+        they can be found and removed along with the datafile.
+
+        """
+        auxfile = ".{}.{}".format(os.path.basename(self.filename), suffix)
+        return os.path.join(os.path.dirname(self.filename), auxfile)
+
+    @property
+    def _writebuffer(self):
+        return self._auxfile('buffer')
+
+    @property
+    def _writerproxy(self):
+        return self._auxfile('wproxy')
+
+    def _open_buffer_w(self):
+        raise NotImplementedError
+
+    def _apply_shared_lock(self):
+        """Apply shared lock.
+
+        """
+        if self.readonly:
+            self.fdlock = 'shared'
+            return
+
+        self._proxylock = ProxyLock.get(self.proxy)
+        try:
+            self._proxylock.acquire()
+        except BaseException:
+            ProxyLock.put(self._proxylock)
+            raise
+        self.fdlock = 'shared'
+
+    def _apply_exclusive_lock(self):
+        """Apply exclusive lock.
+
+        """
+        self._check_writable()
+
+        self._proxylock = ProxyLock.get(self.proxy)
+        try:
+            self._proxylock.acquire(exclusive=True)
+        except BaseException:
+            ProxyLock.put(self._proxylock)
+            raise
+        self.fdlock = 'exclusive'
+
+    def _release_lock(self):
+        """Release shared or exclusive lock.
+
+        """
+        if self.readonly:
+            self.fdlock = None
+            return
+
+        try:
+            self._proxylock.release(exclusive=self.fdlock == 'exclusive')
+        finally:
+            ProxyLock.put(self._proxylock)
+            self._proxylock = None
+            self.fdlock = None
+
+    def get_size(self):
+        """Get size of the datafile on disk, in bytes.
+
+        """
+        return os.path.getsize(self.filename)
+
+    def _contents(self):
+        """List paths to the files holding the data: the datafile first, then
+        any auxiliary files, such as segments or shards, it needs; must be
+        called holding a lock.
+
+        """
+        return [self.filename]
+
+    def _auxdata(self):
+        """List paths to all auxiliary files holding data, whether in use or
+        not.
+
+        """
+        return list()
+
+    def _remove_auxfiles(self, paths):
+        """Remove auxiliary files, along with their own auxiliary files.
+
+        """
+        directory = os.path.dirname(self.filename)
+        for path in paths:
+            prefix = ".{}.".format(os.path.basename(path))
+            for auxfile in os.listdir(directory):
+                if auxfile.startswith(prefix):
+                    os.remove(os.path.join(directory, auxfile))
+            os.remove(path)
+
+    @contextmanager
+    def _stage_path(self, copy=True, exclusive=False):
+        """Stage a write to the datafile as for :meth:`stage`, but without
+        opening the buffer; its path is given instead.
+
+        """
+        self._check_writable()
+
+        wlock = ProxyLock.get(self._writerproxy)
+        try:
+            wlock.acquire(exclusive=True)
+            try:
+                # a shared lock excludes in-place writers, but not readers
+                release = not self.fdlock
+                if release and exclusive:
+                    self._apply_exclusive_lock()
+                elif release:
+                    self._apply_shared_lock()
+
+                try:
+                    if copy and os.path.exists(self.filename):
+                        shutil.copyfile(self.filename, self._writebuffer)
+
+                    yield self._writebuffer
+
+                    os.rename(self._writebuffer, self.filename)
+                except BaseException:
+                    if os.path.exists(self._writebuffer):
+                        os.remove(self._writebuffer)
+                    raise
+                finally:
+                    if release:
+                        self._release_lock()
+            finally:
+                wlock.release(exclusive=True)
+        finally:
+            ProxyLock.put(wlock)
+
+    @contextmanager
+    def stage(self, copy=True, exclusive=False):
+        """Stage a write to the datafile, committing it when done.
+
+        The buffer is opened with `_open_buffer_w` and is available as
+        `self.handle` within the context. If an exception is raised the
+        buffer is discarded, leaving the datafile untouched; since the buffer
+        is renamed into place, this holds even if the process is killed.
+
+        :Keywords:
+            *copy*
+                if True, the buffer starts as a copy of the existing datafile,
+                as needed for appending; if False, the buffer starts empty
+                and its contents replace the datafile entirely
+            *exclusive*
+                if True, hold an exclusive lock on the datafile, blocking
+                readers; needed if files other than the datafile are changed
+                within the context
+
+        """
+        with self._stage_path(copy=copy, exclusive=exclusive):
+            self.handle = self._open_buffer_w()
+            try:
+                yield self.handle
+            finally:
+                self.handle.close()
+
+    def copy_to(self, target, method='auto'):
+        """Copy the datafile, with the auxiliary files holding its data, to
+        another datafile of the same type, replacing its data.
+
+        Files are copied as they are, without reading the data, so the copy
+        keeps its compression, chunking, and other storage options. They are
+        first copied to temporary files next to the target under a shared
+        lock on this datafile, then committed to the target as for
+        :meth:`stage`; readers of the target see its existing data until
+        then. Only one datafile is locked at a time.
+
+        :Arguments:
+            *target*
+                :class:`File` of the same type to copy to; its directory must
+                exist
+
+        :Keywords:
+            *method*
+                how to copy each file; see
+                :func:`~mdsynthesis.util.clone_file` [``'auto'``]
+
+        :Returns:
+            *method*
+                the method used to copy the datafile
+        """
+        from ..util import clone_file
+
+        target._check_writable()
+        if os.path.abspath(target.filename) == self.filename:
+            raise ValueError("Cannot copy a datafile onto itself: "
+                             "'{}'".format(self.filename))
+
+        # unique across processes, so concurrent copies don't collide
+        stamp = uuid.uuid4().hex
+        directory = os.path.dirname(target.filename)
+        copies = list()
+        placed = list()
+        try:
+            with self.read():
+                contents = self._contents()
+                for i, path in enumerate(contents):
+                    tmp = target._auxfile("{}.{}.copy".format(stamp, i))
+                    copies.append(tmp)
+                    used = clone_file(path, tmp, method=method)
+                    if not i:
+                        out = used
+
+            # auxiliary files keep their names, which are unique; they are
+            # only renamed into place with readers of the target blocked
+            auxfiles = [os.path.join(directory, os.path.basename(path))
+                        for path in contents[1:]]
+            exclusive = bool(auxfiles) or bool(target._auxdata())
+            with target._stage_path(copy=False, exclusive=exclusive) as buf:
+                old = [path for path in target._auxdata()
+                       if path not in auxfiles]
+                for tmp, path in zip(copies[1:], auxfiles):
+                    if not os.path.exists(path):
+                        placed.append(path)
+                    os.rename(tmp, path)
+                os.rename(copies[0], buf)
+                target._remove_auxfiles(old)
+        except BaseException:
+            for path in copies + placed:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        return out
@@ -5,12 +5,43 @@ Abstract interface components for reading and writing datasets.
 
 import os
 
-import numpy as np
-import pandas as pd
-
 from . import pydata
 from . import npdata
 from . import pddata
+from . import shdata
+from . import xrdata
+from . import spdata
+from ..util import isinstance_lazy
+
+# pandas classes stored with pddata; not all are present in every version
+PANDAS_CLASSES = ('Series', 'DataFrame', 'Panel', 'Panel4D')
+
+# xarray classes stored with xrdata
+XARRAY_CLASSES = ('Dataset', 'DataArray')
+
+# scipy.sparse classes stored with spdata; sparray is missing before scipy 1.8
+SPARSE_CLASSES = ('spmatrix', 'sparray')
+
+# backend class for each type of data file
+BACKENDS = {pddata.pddatafile: pddata.pdDataFile,
+            npdata.npdatafile: npdata.npDataFile,
+            shdata.shdatafile: shdata.shDataFile,
+            xrdata.xrdatafile: xrdata.xrDataFile,
+            spdata.spdatafile: spdata.spDataFile,
+            pydata.pydatafile: pydata.pyDataFile}
+
+
+def _is_sparse(data):
+    """Check if data is a scipy sparse matrix, or a non-empty list of sparse
+    matrices of the same shape.
+
+    """
+    if isinstance(data, (list, tuple)):
+        return (len(data) > 0 and
+                all(isinstance_lazy(m, 'scipy.sparse', *SPARSE_CLASSES)
+                    for m in data) and
+                len(set(m.shape for m in data)) == 1)
+    return isinstance_lazy(data, 'scipy.sparse', *SPARSE_CLASSES)
 
 
 class DataFile(object):
@@ -23,25 +54,32 @@ class DataFile(object):
 
     """
 
-    def __init__(self, datadir, datafiletype=None, **kwargs):
+    def __init__(self, datadir, datafiletype=None, readonly=False, **kwargs):
         """Initialize data interface.
 
         :Arguments:
            *datadir*
               path to data directory
            *datafiletype*
-              If known, either pddata.pddatafile or npdata.npdatafile
+              If known, one of pddata.pddatafile, npdata.npdatafile,
+              shdata.shdatafile, xrdata.xrdatafile, spdata.spdatafile, or
+              pydata.pydatafile
+           *readonly*
+              If True, read datafiles without locking and refuse writes
 
         """
         self.datadir = datadir
-        self.datafile = None
+        self.readonly = readonly
 
         # if given, can get data
         self.datafiletype = datafiletype
 
-    def add_data(self, key, data):
+    def add_data(self, key, data, shard_rows=None, precision=None,
+                 downcast=None):
         """Add a pandas data object (Series, DataFrame, Panel), numpy array,
-        or pickleable python object to the data file.
+        xarray object (Dataset, DataArray), scipy sparse matrix or list of
+        sparse matrices of the same shape, or pickleable python object to the
+        data file.
 
         If data already exists for the given key, then it is overwritten.
 
@@ -52,23 +90,127 @@ class DataFile(object):
             *data*
                 the data object to store; should be either a pandas Series,
                 DataFrame, Panel, or a numpy array
+
+        :Keywords:
+            *shard_rows*
+                for numpy arrays, if given, split the array along its first
+                axis into shards with this many rows
+            *precision*
+                for floating point numpy arrays, if given, store lossily with
+                this many decimal places
+            *downcast*
+                for floating point numpy arrays, if given, store lossily as
+                this floating point dtype
+
+        :Returns:
+            *datafiletype*
+                type of datafile the data object was stored in
         """
-        if isinstance(data, np.ndarray):
-            self.datafile = npdata.npDataFile(
-                os.path.join(self.datadir, npdata.npdatafile))
-        elif isinstance(data, (pd.Series, pd.DataFrame, pd.Panel, pd.Panel4D)):
-            self.datafile = pddata.pdDataFile(
-                os.path.join(self.datadir, pddata.pddatafile))
+        lossy = dict(precision=precision, downcast=downcast)
+        if (precision is not None or downcast is not None) and not (
+                isinstance_lazy(data, 'numpy', 'ndarray')):
+            raise TypeError('Can only store numpy arrays lossily.')
+
+        if shard_rows is not None:
+            if not isinstance_lazy(data, 'numpy', 'ndarray'):
+                raise TypeError('Can only shard numpy arrays.')
+            datafile = shdata.shDataFile(
+                os.path.join(self.datadir, shdata.shdatafile),
+                readonly=self.readonly)
+            datafile.add_data(key, data, shard_rows, **lossy)
+            return shdata.shdatafile
+        elif isinstance_lazy(data, 'numpy', 'ndarray'):
+            datafile = npdata.npDataFile(
+                os.path.join(self.datadir, npdata.npdatafile),
+                readonly=self.readonly)
+            datafile.add_data(key, data, **lossy)
+            return npdata.npdatafile
+        elif isinstance_lazy(data, 'pandas', *PANDAS_CLASSES):
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+        elif isinstance_lazy(data, 'xarray', *XARRAY_CLASSES):
+            datafile = xrdata.xrDataFile(
+                os.path.join(self.datadir, xrdata.xrdatafile),
+                readonly=self.readonly)
+        elif _is_sparse(data):
+            datafile = spdata.spDataFile(
+                os.path.join(self.datadir, spdata.spdatafile),
+                readonly=self.readonly)
         else:
-            self.datafile = pydata.pyDataFile(
-                os.path.join(self.datadir, pydata.pydatafile))
+            datafile = pydata.pyDataFile(
+                os.path.join(self.datadir, pydata.pydatafile),
+                readonly=self.readonly)
+
+        datafile.add_data(key, data)
+        return os.path.basename(datafile.filename)
+
+    def create_data(self, key, shape, dtype, chunks=None, fillvalue=None,
+                    shard_rows=None):
+        """Preallocate a numpy array in the data file.
+
+        :Arguments:
+            *key*
+                name given to the data; used as the index for retrieving
+                the data later
+            *shape*
+                shape of the array
+            *dtype*
+                dtype of the array
 
-        self.datafile.add_data(key, data)
+        :Keywords:
+            *chunks*
+                shape of HDF5 chunks; ``True`` to choose one automatically
+            *fillvalue*
+                value of elements not yet written
+            *shard_rows*
+                if given, split the array along its first axis into shards
+                with this many rows
 
-        # dereference
-        self.datafile = None
+        :Returns:
+            *datafiletype*
+                type of datafile the array was created in
+        """
+        if shard_rows is not None:
+            datafile = shdata.shDataFile(
+                os.path.join(self.datadir, shdata.shdatafile),
+                readonly=self.readonly)
+            datafile.create_data(key, shape, dtype, shard_rows,
+                                 chunks=chunks, fillvalue=fillvalue)
+            return shdata.shdatafile
+
+        datafile = npdata.npDataFile(
+            os.path.join(self.datadir, npdata.npdatafile),
+            readonly=self.readonly)
+        datafile.create_data(key, shape, dtype, chunks=chunks,
+                             fillvalue=fillvalue)
+        return npdata.npdatafile
+
+    def write_region(self, key, region, values):
+        """Write values to a region of a stored numpy array, in place.
 
-    def append_data(self, key, data):
+        :Arguments:
+            *key*
+                name of data to write to
+            *region*
+                index of the region to write
+            *values*
+                values to write
+        """
+        if self.datafiletype == npdata.npdatafile:
+            datafile = npdata.npDataFile(
+                os.path.join(self.datadir, npdata.npdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == shdata.shdatafile:
+            datafile = shdata.shDataFile(
+                os.path.join(self.datadir, shdata.shdatafile),
+                readonly=self.readonly)
+        else:
+            raise TypeError('Can only write regions of numpy arrays.')
+
+        datafile.write_region(key, region, values)
+
+    def append_data(self, key, data, shadow=False, segment=False):
         """Append rows to an existing pandas data object stored in the data file.
 
         Note that column names of new data must match those of the existing
@@ -83,19 +225,138 @@ class DataFile(object):
                 stored data; must have same columns (with names) as existing
                 data
 
+        :Keywords:
+            *shadow*
+                if True, append to a copy of the data file that atomically
+                replaces it when complete, so readers are not blocked
+                [``False``]
+            *segment*
+                if True, write the rows to a new segment file without locking
+                the data file [``False``]
+
         """
+        if shadow and segment:
+            raise ValueError("Cannot append both as shadow and as segment.")
+
         # TODO: add exceptions where appending isn't possible
-        if isinstance(data, np.ndarray):
+        if isinstance_lazy(data, 'numpy', 'ndarray'):
             raise TypeError('Cannot append numpy arrays.')
-        elif isinstance(data, (pd.Series, pd.DataFrame, pd.Panel, pd.Panel4D)):
-            self.datafile = pddata.pdDataFile(
-                os.path.join(self.datadir, pddata.pddatafile))
-            self.datafile.append_data(key, data)
+        elif isinstance_lazy(data, 'xarray', *XARRAY_CLASSES):
+            raise TypeError('Cannot append xarray objects.')
+        elif _is_sparse(data):
+            raise TypeError('Cannot append sparse matrices.')
+        elif isinstance_lazy(data, 'pandas', *PANDAS_CLASSES):
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+            if segment:
+                datafile.append_segment(key, data)
+            else:
+                datafile.append_data(key, data, shadow=shadow)
         else:
             raise TypeError('Cannot append python object.')
 
-            # dereference
-            self.datafile = None
+    def compact_data(self, key):
+        """Merge segments appended to a stored data object into the data file.
+
+        Only pandas objects can have segments; for other data objects this
+        does nothing.
+
+        :Arguments:
+            *key*
+                name of data object to compact
+
+        :Returns:
+            *n_segments*
+                number of segments merged
+        """
+        if self.datafiletype == pddata.pddatafile:
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+            out = datafile.compact(key)
+        else:
+            out = 0
+
+        return out
+
+    def copy_data(self, datadir, method='auto'):
+        """Copy the data file, as it is, to another data directory, replacing
+        any data file of the same type there.
+
+        The data is not read, so it keeps its storage options, such as
+        compression, chunking, and shards.
+
+        :Arguments:
+            *datadir*
+                path to data directory to copy to; must exist
+
+        :Keywords:
+            *method*
+                how to copy each file; see
+                :func:`~mdsynthesis.util.clone_file`
+
+        :Returns:
+            *method*
+                the method used to copy the data file
+        """
+        if self.datafiletype not in BACKENDS:
+            raise TypeError('Cannot copy data without knowing datatype.')
+
+        backend = BACKENDS[self.datafiletype]
+        datafile = backend(os.path.join(self.datadir, self.datafiletype),
+                           readonly=self.readonly)
+        target = backend(os.path.join(datadir, self.datafiletype))
+
+        return datafile.copy_to(target, method=method)
+
+    def repack_data(self, key, complevel=None, complib=None):
+        """Rewrite the data file compactly, reclaiming free space.
+
+        Only HDF5 data files are repacked; other data files are always
+        rewritten whole when changed, so have no free space to reclaim.
+
+        :Arguments:
+            *key*
+                name of data object to repack
+
+        :Keywords:
+            *complevel*
+                compression level to rewrite with
+            *complib*
+                compression library to rewrite with; for pandas objects, as
+                for :class:`pandas.HDFStore`, and otherwise ``'gzip'`` or
+                ``'lzf'``
+
+        :Returns:
+            *recovered*
+                bytes on disk recovered by repacking; 0 if the data file
+                is no smaller
+        """
+        if self.datafiletype == npdata.npdatafile:
+            datafile = npdata.npDataFile(
+                os.path.join(self.datadir, npdata.npdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == shdata.shdatafile:
+            datafile = shdata.shDataFile(
+                os.path.join(self.datadir, shdata.shdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == pddata.pddatafile:
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == spdata.spdatafile:
+            datafile = spdata.spDataFile(
+                os.path.join(self.datadir, spdata.spdatafile),
+                readonly=self.readonly)
+        else:
+            return 0
+
+        size = datafile.get_size()
+        datafile.repack(key, complevel=complevel, complib=complib)
+
+        # rewritten files can be larger, e.g. uncompressed, or for tiny ones
+        return max(0, size - datafile.get_size())
 
     def get_data(self, key, **kwargs):
         """Retrieve data object stored in file.
@@ -108,11 +369,16 @@ class DataFile(object):
             *where*
                 for pandas objects, conditions for what rows/columns to return
             *start*
-                for pandas objects, row number to start selection
+                for pandas objects, numpy arrays, and sparse matrices, row
+                number to start selection; for lists of sparse matrices,
+                number of the matrix to start selection
             *stop*
-                for pandas objects, row number to stop selection
+                for pandas objects, numpy arrays, and sparse matrices, row
+                number to stop selection; for lists of sparse matrices,
+                number of the matrix to stop selection
             *columns*
-                for pandas objects, list of columns to return; all columns
+                for pandas objects, list of columns to return, and for
+                structured numpy arrays, list of fields to return; all
                 returned by default
             *iterator*
                 for pandas objects, if True, return an iterator [``False``]
@@ -120,31 +386,138 @@ class DataFile(object):
                 for pandas objects, number of rows to include in iteration;
                 implies ``iterator=True``
 
+            *sel*
+                for xarray objects, dict of labels to select along each
+                dimension
+            *isel*
+                for xarray objects, dict of positions to select along each
+                dimension
+            *variables*
+                for xarray Datasets, list of variables to return
+            *lazy*
+                for pandas Series and DataFrames, numpy arrays, and xarray
+                objects, if True, return a dask collection reading the data
+                on demand [``False``]
+            *chunks*
+                for numpy arrays and xarray objects retrieved lazily, chunks
+                of the dask arrays
+
         :Returns:
             *data*
                 the selected data
         """
+        if kwargs.pop('lazy', False):
+            return self._get_lazy(key, **kwargs)
+
         if self.datafiletype == npdata.npdatafile:
-            self.datafile = npdata.npDataFile(
-                os.path.join(self.datadir, npdata.npdatafile))
-            out = self.datafile.get_data(key, **kwargs)
-            self.datafile = None
+            datafile = npdata.npDataFile(
+                os.path.join(self.datadir, npdata.npdatafile),
+                readonly=self.readonly)
+            out = datafile.get_data(key, **kwargs)
+        elif self.datafiletype == shdata.shdatafile:
+            datafile = shdata.shDataFile(
+                os.path.join(self.datadir, shdata.shdatafile),
+                readonly=self.readonly)
+            out = datafile.get_data(key, **kwargs)
         elif self.datafiletype == pddata.pddatafile:
-            self.datafile = pddata.pdDataFile(
-                os.path.join(self.datadir, pddata.pddatafile))
-            out = self.datafile.get_data(key, **kwargs)
-            self.datafile = None
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+            out = datafile.get_data(key, **kwargs)
+        elif self.datafiletype == xrdata.xrdatafile:
+            datafile = xrdata.xrDataFile(
+                os.path.join(self.datadir, xrdata.xrdatafile),
+                readonly=self.readonly)
+            out = datafile.get_data(key, **kwargs)
+        elif self.datafiletype == spdata.spdatafile:
+            datafile = spdata.spDataFile(
+                os.path.join(self.datadir, spdata.spdatafile),
+                readonly=self.readonly)
+            out = datafile.get_data(key, **kwargs)
         elif self.datafiletype == pydata.pydatafile:
-            self.datafile = pydata.pyDataFile(
-                os.path.join(self.datadir, pydata.pydatafile))
-            out = self.datafile.get_data(key)
-            self.datafile = None
+            datafile = pydata.pyDataFile(
+                os.path.join(self.datadir, pydata.pydatafile),
+                readonly=self.readonly)
+            out = datafile.get_data(key)
         else:
             raise TypeError('Cannot return data without knowing datatype.')
             out = None
 
         return out
 
+    def _get_lazy(self, key, **kwargs):
+        """Retrieve data object stored in file as a dask collection.
+
+        """
+        if self.datafiletype == npdata.npdatafile:
+            datafile = npdata.npDataFile(
+                os.path.join(self.datadir, npdata.npdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == shdata.shdatafile:
+            datafile = shdata.shDataFile(
+                os.path.join(self.datadir, shdata.shdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == pddata.pddatafile:
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == xrdata.xrdatafile:
+            datafile = xrdata.xrDataFile(
+                os.path.join(self.datadir, xrdata.xrdatafile),
+                readonly=self.readonly)
+            return datafile.get_data(key, lazy=True, **kwargs)
+        else:
+            raise TypeError('Can only retrieve pandas objects, numpy '
+                            'arrays, and xarray objects lazily.')
+
+        return datafile.get_lazy(key, **kwargs)
+
+    def get_info(self, key):
+        """Describe data object stored in file, without loading it.
+
+        :Arguments:
+            *key*
+                name of data to describe
+
+        :Returns:
+            *info*
+                dict describing the data object; always gives the datafile
+                type as *type* and its size on disk in bytes as *size*; see
+                the `get_info` methods of the pddata, npdata, and pydata
+                backends for what else is given
+        """
+        if self.datafiletype == npdata.npdatafile:
+            datafile = npdata.npDataFile(
+                os.path.join(self.datadir, npdata.npdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == shdata.shdatafile:
+            datafile = shdata.shDataFile(
+                os.path.join(self.datadir, shdata.shdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == pddata.pddatafile:
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == xrdata.xrdatafile:
+            datafile = xrdata.xrDataFile(
+                os.path.join(self.datadir, xrdata.xrdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == spdata.spdatafile:
+            datafile = spdata.spDataFile(
+                os.path.join(self.datadir, spdata.spdatafile),
+                readonly=self.readonly)
+        elif self.datafiletype == pydata.pydatafile:
+            datafile = pydata.pyDataFile(
+                os.path.join(self.datadir, pydata.pydatafile),
+                readonly=self.readonly)
+        else:
+            raise TypeError('Cannot describe data without knowing datatype.')
+
+        out = datafile.get_info(key)
+        out['type'] = self.datafiletype
+
+        return out
+
     def del_data(self, key, **kwargs):
         """Delete a stored data object.
 
@@ -162,16 +535,17 @@ class DataFile(object):
 
         """
         if self.datafiletype == npdata.npdatafile:
-            self.datafile = npdata.npDataFile(
-                os.path.join(self.datadir, npdata.npdatafile))
-            out = self.datafile.del_data(key, **kwargs)
-            self.datafile = None
+            datafile = npdata.npDataFile(
+                os.path.join(self.datadir, npdata.npdatafile),
+                readonly=self.readonly)
+            out = datafile.del_data(key, **kwargs)
         elif self.datafiletype == pddata.pddatafile:
-            self.datafile = pddata.pdDataFile(
-                os.path.join(self.datadir, pddata.pddatafile))
-            out = self.datafile.del_data(key, **kwargs)
-            self.datafile = None
-        elif self.datafiletype == pydata.pydatafile:
+            datafile = pddata.pdDataFile(
+                os.path.join(self.datadir, pddata.pddatafile),
+                readonly=self.readonly)
+            out = datafile.del_data(key, **kwargs)
+        elif self.datafiletype in (shdata.shdatafile, xrdata.xrdatafile,
+                                   spdata.spdatafile, pydata.pydatafile):
             pass
         else:
             raise TypeError('Cannot return data without knowing datatype.')
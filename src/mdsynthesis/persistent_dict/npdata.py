@@ -3,12 +3,221 @@ File backends for storing numpy arrays.
 
 """
 
-import h5py
-
-from datreant.state import BaseFile as File
+from .base import File
 
 npdatafile = 'npData.h5'
 
+# attribute giving the dtype of arrays stored lossily, to be decoded to
+DTYPE_ATTR = 'mdsynthesis_dtype'
+
+
+def fields_dtype(dtype, columns):
+    """Get the dtype of a structured array with only the given fields.
+
+    :Arguments:
+        *dtype*
+            dtype of the structured array
+        *columns*
+            names of the fields to keep, in order
+
+    :Returns:
+        *dtype*
+            dtype with only the given fields
+    """
+    import numpy as np
+
+    if dtype.names is None:
+        raise TypeError('Can only select columns of structured arrays.')
+
+    missing = [name for name in columns if name not in dtype.names]
+    if missing:
+        raise KeyError("No such fields: {}".format(', '.join(missing)))
+
+    return np.dtype([(name, dtype.fields[name][0]) for name in columns])
+
+
+def lossy_dtype(data, precision=None, downcast=None):
+    """Check that an array can be stored lossily as asked, and get the dtype
+    to store it with.
+
+    With only *precision*, arrays are stored as float64: values are stored
+    as scaled integers whatever their dtype, but the HDF5 scale-offset filter
+    works in the precision of the dtype, and in float32 can be off by a step.
+
+    :Arguments:
+        *data*
+            the numpy array to store
+
+    :Keywords:
+        *precision*
+            number of decimal places to keep
+        *downcast*
+            floating point dtype to store the array as
+
+    :Returns:
+        *dtype*
+            dtype to store the array with
+    """
+    import numpy as np
+
+    if data.dtype.kind != 'f':
+        raise TypeError('Can only store floating point arrays lossily.')
+    if not data.shape:
+        raise ValueError('Cannot store a scalar lossily.')
+
+    if downcast is None:
+        return np.dtype('float64')
+
+    downcast = np.dtype(downcast)
+    if downcast.kind != 'f':
+        raise TypeError('Can only downcast to a floating point dtype.')
+    if precision is not None and downcast.itemsize < 4:
+        # not supported by the scale-offset filter
+        raise ValueError("Cannot store {} arrays with a given precision; "
+                         "give only one of precision and "
+                         "downcast.".format(downcast))
+    return downcast
+
+
+def _filters(dataset, complevel=None, complib=None):
+    """Get the HDF5 filters to rewrite a dataset with.
+
+    """
+    if not dataset.shape or not dataset.size:
+        # filters need chunks, which can't be empty
+        return dict()
+
+    filters = {'scaleoffset': dataset.scaleoffset,
+               'fletcher32': dataset.fletcher32}
+    if complevel is None and complib is None:
+        filters.update(compression=dataset.compression,
+                       compression_opts=dataset.compression_opts,
+                       shuffle=dataset.shuffle)
+    elif complevel != 0:
+        complib = 'gzip' if complib is None else complib
+        filters.update(compression=complib,
+                       compression_opts=(complevel if complib == 'gzip'
+                                         else None),
+                       shuffle=True)
+
+    if any(filters.values()):
+        filters['chunks'] = dataset.chunks or True
+    else:
+        filters['chunks'] = dataset.chunks
+    return filters
+
+
+def copy_hdf5(source, dest, complevel=None, complib=None):
+    """Copy all groups and datasets of an open HDF5 file to another.
+
+    Datasets are copied in blocks of rows, keeping their chunks, filters,
+    and attributes, except for compression if given. Only live data is
+    copied, so the copy has none of the free space left in the source by
+    deleted or replaced datasets.
+
+    :Arguments:
+        *source*
+            :class:`h5py.Group` to copy from
+        *dest*
+            :class:`h5py.Group` to copy to
+
+    :Keywords:
+        *complevel*
+            gzip compression level to rewrite datasets with, from 0 to 9; 0
+            for no compression
+        *complib*
+            compression filter to rewrite datasets with, ``'gzip'`` or
+            ``'lzf'``; by default, datasets keep their own compression
+    """
+    import h5py
+
+    for name, obj in source.items():
+        if isinstance(obj, h5py.Group):
+            copy = dest.create_group(name)
+            copy_hdf5(obj, copy, complevel=complevel, complib=complib)
+        else:
+            copy = dest.create_dataset(
+                name, shape=obj.shape, dtype=obj.dtype,
+                fillvalue=obj.fillvalue,
+                **_filters(obj, complevel=complevel, complib=complib))
+
+            if not obj.shape:
+                copy[()] = obj[()]
+            elif obj.size:
+                # about 64 MiB at a time
+                rowsize = obj.size // obj.shape[0] * obj.dtype.itemsize
+                block = max(1, 2**26 // max(1, rowsize))
+                for start in range(0, obj.shape[0], block):
+                    copy[start:start + block] = obj[start:start + block]
+
+        for attr, value in obj.attrs.items():
+            copy.attrs[attr] = value
+
+
+def repack_hdf5(datafile, complevel=None, complib=None):
+    """Rewrite an HDF5 datafile compactly with :func:`copy_hdf5`.
+
+    The copy replaces the datafile when complete. Readers see the existing
+    data until then; writers wait.
+
+    :Arguments:
+        *datafile*
+            :class:`File` using h5py as its backend
+
+    :Keywords:
+        *complevel*
+            gzip compression level to rewrite datasets with
+        *complib*
+            compression filter to rewrite datasets with
+    """
+    import h5py
+
+    with datafile.stage(copy=False):
+        source = h5py.File(datafile.filename, 'r')
+        try:
+            copy_hdf5(source, datafile.handle, complevel=complevel,
+                      complib=complib)
+        finally:
+            source.close()
+
+
+class LazyDataset(object):
+    """Array-like view of a stored numpy array, reading regions on demand.
+
+    Each region is read with the datafile opened and locked only for the
+    duration of the read, so instances can be held onto, and pickled to
+    other processes, without holding the datafile open.
+
+    :Arguments:
+        *filename*
+            path to the datafile
+        *key*
+            name of the array in the datafile
+        *shape*
+            shape of the array
+        *dtype*
+            dtype of the array
+
+    :Keywords:
+        *readonly*
+            if True, read without locking [``False``]
+    """
+
+    def __init__(self, filename, key, shape, dtype, readonly=False):
+        self.filename = filename
+        self.key = key
+        self.shape = shape
+        self.dtype = dtype
+        self.readonly = readonly
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __getitem__(self, region):
+        return npDataFile(self.filename,
+                          readonly=self.readonly).get_region(self.key, region)
+
 
 class npDataFile(File):
     """Interface to numpy object data files.
@@ -20,15 +229,48 @@ class npDataFile(File):
     """
 
     def _open_file_r(self):
+        import h5py
         return h5py.File(self.filename, 'r')
 
     def _open_file_w(self):
-        return h5py.File(self.filename, 'w')
+        import h5py
+        return h5py.File(self.filename, 'a')
+
+    def _open_buffer_w(self):
+        import h5py
+        return h5py.File(self._writebuffer, 'w')
+
+    @staticmethod
+    def _dtype(dataset):
+        """Get the dtype a stored array is retrieved as.
+
+        """
+        import numpy as np
+
+        if DTYPE_ATTR in dataset.attrs:
+            return np.dtype(dataset.attrs[DTYPE_ATTR])
+        return dataset.dtype
 
-    def add_data(self, key, data):
+    @classmethod
+    def _decode(cls, dataset, data):
+        """Cast data read from an array stored lossily back to its dtype.
+
+        """
+        dtype = cls._dtype(dataset)
+        if dtype != dataset.dtype:
+            return data.astype(dtype)
+        return data
+
+    def add_data(self, key, data, precision=None, downcast=None):
         """Add a numpy array to the data file.
 
-        If data already exists for the given key, then it is overwritten.
+        If data already exists for the given key, then it is overwritten. The
+        array is written to a buffer that replaces the existing data file only
+        when complete, so readers see the existing data until then.
+
+        Floating point arrays can be stored lossily, with *precision* or
+        *downcast*; these are compressed, and retrieved with their original
+        dtype.
 
         :Arguments:
             *key*
@@ -36,27 +278,241 @@ class npDataFile(File):
                 the data later
             *data*
                 the numpy array to store
+
+        :Keywords:
+            *precision*
+                number of decimal places to keep, as with the precision of
+                XTC files; values are rounded to this many places, so to
+                within half of ``10**-precision``, and stored as scaled
+                integers with the HDF5 scale-offset filter; with *downcast*
+                to float32, values may be off by up to a further
+                ``10**-precision``
+            *downcast*
+                floating point dtype to store the array as, such as
+                ``'float32'`` or ``'float16'``; float16 can't be combined
+                with *precision*
+        """
+        import numpy as np
+
+        kwargs = dict()
+        if precision is not None or downcast is not None:
+            stored = lossy_dtype(data, precision=precision, downcast=downcast)
+            original = data.dtype
+
+            if precision is not None:
+                data = np.round(data.astype(np.float64), int(precision))
+            data = data.astype(stored, copy=False)
+
+            # filters need chunks, which can't be empty
+            if data.size:
+                kwargs.update(compression='gzip', shuffle=True)
+                if precision is not None:
+                    kwargs['scaleoffset'] = int(precision)
+
+        with self.stage(copy=False):
+            dataset = self.handle.create_dataset(key, data=data, **kwargs)
+            if precision is not None or downcast is not None:
+                dataset.attrs[DTYPE_ATTR] = original.str
+
+    def create_data(self, key, shape, dtype, chunks=None, fillvalue=None):
+        """Preallocate a numpy array in the data file, to be filled in with
+        :meth:`write_region`.
+
+        If data already exists for the given key, then it is overwritten, as
+        for :meth:`add_data`.
+
+        :Arguments:
+            *key*
+                name given to the data; used as the index for retrieving
+                the data later
+            *shape*
+                shape of the array
+            *dtype*
+                dtype of the array
+
+        :Keywords:
+            *chunks*
+                shape of HDF5 chunks; ``True`` to choose one automatically,
+                ``None`` to store the array contiguously [``None``]
+            *fillvalue*
+                value of elements not yet written [``None``, for zero]
+        """
+        with self.stage(copy=False):
+            self.handle.create_dataset(key, shape=shape, dtype=dtype,
+                                       chunks=chunks, fillvalue=fillvalue)
+
+    def write_region(self, key, region, values):
+        """Write values to a region of a stored numpy array, in place.
+
+        The data file is locked exclusively while writing, so writes from
+        any number of threads or processes are applied one at a time.
+
+        :Arguments:
+            *key*
+                name of data to write to
+            *region*
+                index of the region to write, e.g. a slice of rows, or a
+                tuple of slices
+            *values*
+                values to write; must broadcast to the region's shape
         """
         with self.write():
-            try:
-                self.handle.create_dataset(key, data=data)
-            except RuntimeError:
-                del self.handle[key]
-                self.handle.create_dataset(key, data=data)
+            self.handle[key][region] = values
+
+    def repack(self, key, complevel=None, complib=None):
+        """Rewrite the data file compactly, reclaiming space left by replaced
+        arrays.
+
+        See :func:`repack_hdf5`.
+
+        :Arguments:
+            *key*
+                not used, but needed to give consistent interface
+
+        :Keywords:
+            *complevel*
+                gzip compression level to rewrite with, from 0 to 9; 0 for no
+                compression
+            *complib*
+                compression filter to rewrite with, ``'gzip'`` or ``'lzf'``;
+                by default, arrays keep their compression
+        """
+        repack_hdf5(self, complevel=complevel, complib=complib)
 
-    def get_data(self, key, **kwargs):
-        """Retrieve numpy array stored in file.
+    def get_data(self, key, start=None, stop=None, columns=None, **kwargs):
+        """Retrieve numpy array stored in file, or a range of its rows.
 
         :Arguments:
             *key*
                 name of data to retrieve
 
+        :Keywords:
+            *start*
+                row number to start selection
+            *stop*
+                row number to stop selection
+            *columns*
+                for structured arrays, list of fields to return; only these
+                are read, and the array returned has only these fields
+
         :Returns:
             *data*
                 the selected data
         """
+        import numpy as np
+
         with self.read():
-            return self.handle[key].value
+            dataset = self.handle[key]
+
+            if columns is None:
+                if start is None and stop is None:
+                    return self._decode(dataset, dataset[()])
+                else:
+                    return self._decode(dataset, dataset[start:stop])
+
+            # HDF5 converts the stored records to ones with only the given
+            # fields as they are read, so other fields never reach memory
+            rows = slice(*slice(start, stop).indices(dataset.shape[0]))
+            out = np.empty((len(range(rows.start, rows.stop)),) +
+                           dataset.shape[1:],
+                           dtype=fields_dtype(dataset.dtype, columns))
+            if out.size:
+                dataset.read_direct(out, source_sel=np.s_[rows])
+            return out
+
+    def get_region(self, key, region):
+        """Retrieve a region of a stored numpy array.
+
+        :Arguments:
+            *key*
+                name of data to retrieve
+            *region*
+                index of the region to read, e.g. a slice of rows, or a tuple
+                of slices
+
+        :Returns:
+            *data*
+                the selected data
+        """
+        with self.read():
+            dataset = self.handle[key]
+            return self._decode(dataset, dataset[region])
+
+    def get_lazy(self, key, chunks=None, start=None, stop=None, **kwargs):
+        """Get a stored numpy array as a dask array, without reading it.
+
+        Chunks are read only when computed, each opening and locking the
+        datafile only for as long as it is read.
+
+        :Arguments:
+            *key*
+                name of data to retrieve
+
+        :Keywords:
+            *chunks*
+                chunks of the dask array; by default, those the array is
+                stored with in HDF5, or chosen by dask if stored contiguously
+            *start*
+                row number to start selection
+            *stop*
+                row number to stop selection
+
+        :Returns:
+            *data*
+                :class:`dask.array.Array` of the selected data
+        """
+        import numpy as np
+        import dask.array as da
+
+        with self.read():
+            dataset = self.handle[key]
+            shape, dtype = dataset.shape, self._dtype(dataset)
+            if chunks is None:
+                chunks = dataset.chunks or 'auto'
+
+        lazy = LazyDataset(self.filename, key, shape, dtype,
+                           readonly=self.readonly)
+        array = da.from_array(lazy, chunks=chunks, name=False, lock=False,
+                              meta=np.empty((0,) * len(shape), dtype=dtype))
+
+        if start is None and stop is None:
+            return array
+        else:
+            return array[start:stop]
+
+    def get_info(self, key):
+        """Describe stored array from its metadata, without reading it.
+
+        :Arguments:
+            *key*
+                name of data to describe
+
+        :Returns:
+            *info*
+                dict giving the array's *shape*, *dtype*, number of rows as
+                *nrows* (``None`` for scalars), field names as *columns*
+                (``None`` if not a structured array), size in memory as
+                *nbytes*, HDF5 *chunks* and *compression*, the decimal places
+                kept as *precision* and dtype stored as *stored_dtype* (both
+                ``None`` unless stored lossily), and size on disk in bytes as
+                *size*
+        """
+        with self.read():
+            dataset = self.handle[key]
+            dtype = self._dtype(dataset)
+            lossy = DTYPE_ATTR in dataset.attrs
+            info = {'shape': dataset.shape,
+                    'dtype': str(dtype),
+                    'nrows': dataset.shape[0] if dataset.shape else None,
+                    'columns': list(dtype.names) if dtype.names else None,
+                    'nbytes': dataset.size * dtype.itemsize,
+                    'chunks': dataset.chunks,
+                    'compression': dataset.compression,
+                    'precision': dataset.scaleoffset,
+                    'stored_dtype': str(dataset.dtype) if lossy else None}
+
+        info['size'] = self.get_size()
+        return info
 
     def del_data(self, key, **kwargs):
         """Delete a stored data object.
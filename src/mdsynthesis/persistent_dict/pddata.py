@@ -3,13 +3,29 @@ File backends for storing pandas objects.
 
 """
 
-import pandas as pd
-import numpy as np
+import os
+import time
+import uuid
 
-from datreant.state import BaseFile as File
+from .base import File, ProxyLock
 
 pddatafile = 'pdData.h5'
 
+# default number of rows in each partition of dask DataFrames
+PARTITION_ROWS = 2**20
+
+# attribute of the data file listing segments already merged into it
+MERGED_ATTR = 'mdsynthesis_merged'
+
+
+def _read_rows(filename, key, start, stop, readonly):
+    """Read a range of rows of a stored pandas object, as a partition of a
+    dask DataFrame.
+
+    """
+    datafile = pdDataFile(filename, readonly=readonly)
+    return datafile.get_data(key, start=start, stop=stop)
+
 
 class pdDataFile(File):
     """Interface to pandas object data files.
@@ -19,18 +35,118 @@ class pdDataFile(File):
     and retrieving stored data. It uses pandas' HDFStore object as its
     backend.
 
+    Rows can also be appended as segment files alongside the data file,
+    without any locking; these are merged with the data file's contents
+    when reading, and can be merged into the data file with `compact`.
+    Segments merged into the data file are recorded in it, so that they are
+    ignored from the moment it is committed, even if removing them fails.
+
     """
 
     def _open_file_r(self):
+        import pandas as pd
         return pd.HDFStore(self.filename, 'r')
 
     def _open_file_w(self):
+        import pandas as pd
         return pd.HDFStore(self.filename, 'a')
 
+    def _open_buffer_w(self):
+        import pandas as pd
+        return pd.HDFStore(self._writebuffer, 'a')
+
+    def _segments(self):
+        """List paths to all committed segment files, in order of creation.
+
+        """
+        directory, filename = os.path.split(self.filename)
+        prefix = ".{}.".format(filename)
+        return sorted(os.path.join(directory, f)
+                      for f in os.listdir(directory)
+                      if f.startswith(prefix) and f.endswith('.segment'))
+
+    @property
+    def _segmentproxy(self):
+        # held shared while committing a segment, and exclusively while
+        # committing data that replaces all segments
+        return self._auxfile('sproxy')
+
+    @staticmethod
+    def _merged(store):
+        """List names of segment files recorded as merged into an open
+        HDFStore.
+
+        """
+        return list(getattr(store.root._v_attrs, MERGED_ATTR, []))
+
+    def _pending(self):
+        """List paths to segment files not yet merged into the data file, in
+        order of creation; must be called holding a lock.
+
+        """
+        merged = set(self._merged(self.handle))
+        return [segment for segment in self._segments()
+                if os.path.basename(segment) not in merged]
+
+    def _remove_merged(self):
+        """Remove segment files recorded as merged into the data file.
+
+        Readers that may still read them along with the data file they
+        replaced are waited for.
+
+        """
+        with self.write():
+            merged = set(self._merged(self.handle))
+            for segment in self._segments():
+                if os.path.basename(segment) in merged:
+                    os.remove(segment)
+
+    def _contents(self):
+        return [self.filename] + self._pending()
+
+    def _auxdata(self):
+        return self._segments()
+
+    @staticmethod
+    def _append(store, key, data, complevel=5, complib='blosc'):
+        """Append rows to object in an open HDFStore, indexing all columns if
+        possible.
+
+        """
+        try:
+            store.append(key, data, data_columns=True, complevel=complevel,
+                         complib=complib)
+        except AttributeError:
+            store.append(key, data, complevel=complevel, complib=complib)
+
+    @staticmethod
+    def _put(store, key, data, complevel=5, complib='blosc'):
+        """Put object in an open HDFStore as a table, indexing all columns if
+        possible.
+
+        """
+        import pandas as pd
+        import numpy as np
+
+        try:
+            # FIXME: band-aid heuristic to catch a known corner case that
+            # HDFStore doesn't catch; see ``Issue 20``
+            if (isinstance(data, pd.DataFrame) and
+                    data.columns.dtype == np.dtype('int64')):
+                raise AttributeError
+
+            store.put(key, data, format='table', data_columns=True,
+                      complevel=complevel, complib=complib)
+        except AttributeError:
+            store.put(key, data, format='table', complevel=complevel,
+                      complib=complib)
+
     def add_data(self, key, data):
         """Add a pandas data object (Series, DataFrame, Panel) to the data file.
 
-        If data already exists for the given key, then it is overwritten.
+        If data already exists for the given key, then it is overwritten. The
+        data is written to a buffer that replaces the existing data file only
+        when complete; readers see the existing data until then.
 
         :Arguments:
             *key*
@@ -40,27 +156,29 @@ class pdDataFile(File):
                 the data object to store; should be either a Series, DataFrame,
                 or Panel
         """
-        with self.write():
-            # index all columns if possible
-            try:
-                # FIXME: band-aid heuristic to catch a known corner case that
-                # HDFStore doesn't catch; see ``Issue 20``
-                if (isinstance(data, pd.DataFrame) and
-                        data.columns.dtype == np.dtype('int64')):
-                    raise AttributeError
-
-                self.handle.put(
-                    key,
-                    data,
-                    format='table',
-                    data_columns=True,
-                    complevel=5,
-                    complib='blosc')
-            except AttributeError:
-                self.handle.put(
-                    key, data, format='table', complevel=5, complib='blosc')
-
-    def append_data(self, key, data):
+        slock = ProxyLock.get(self._segmentproxy)
+        locked = False
+        try:
+            with self.stage(copy=False):
+                self._put(self.handle, key, data)
+
+                # segments belong to the data being replaced; readers of the
+                # new data must not see them, and none can be committed
+                # until it is
+                slock.acquire(exclusive=True)
+                locked = True
+                segments = self._segments()
+                self.handle.root._v_attrs[MERGED_ATTR] = [
+                    os.path.basename(segment) for segment in segments]
+        finally:
+            if locked:
+                slock.release(exclusive=True)
+            ProxyLock.put(slock)
+
+        if segments:
+            self._remove_merged()
+
+    def append_data(self, key, data, shadow=False):
         """Append rows to an existing pandas data object stored in the data file.
 
         Note that column names of new data must match those of the existing
@@ -75,17 +193,176 @@ class pdDataFile(File):
                 stored data; must have same columns (with names) as existing
                 data
 
+        :Keywords:
+            *shadow*
+                if True, append to a copy of the data file that replaces it
+                when complete; readers are not blocked while appending, at the
+                cost of copying the file [``False``]
+
         """
-        with self.write():
+        if shadow:
+            context = self.stage()
+        else:
+            context = self.write()
+
+        with context:
+            self._append(self.handle, key, data)
+
+    def append_segment(self, key, data):
+        """Append rows to an existing pandas data object as a new segment file.
+
+        No lock is taken on the data file, so any number of processes can
+        append segments at the same time. Each segment is written to a buffer
+        first and renamed when complete, so readers never see a partial
+        segment. Renaming waits only for data replacing the whole dataset to
+        be committed, so the segment is either discarded along with the data
+        it replaces, or appended to the new data. Only Series and DataFrames
+        can be appended as segments.
+
+        If the data file doesn't exist yet, the rows are appended to it
+        directly instead.
+
+        :Arguments:
+            *key*
+                name of existing data object to append to
+            *data*
+                the data object whose rows are to be appended to the existing
+                stored data; must have same columns (with names) as existing
+                data
+
+        """
+        import pandas as pd
+
+        self._check_writable()
+
+        if not isinstance(data, (pd.Series, pd.DataFrame)):
+            raise TypeError("Only Series and DataFrames can be appended "
+                            "as segments.")
+
+        if not os.path.exists(self.filename):
+            return self.append_data(key, data)
+
+        # names sort by time of creation, and are unique across processes
+        stamp = "{:020d}-{}".format(int(time.time() * 1e6), uuid.uuid4().hex)
+        segment = self._auxfile("{}.segment".format(stamp))
+        wbuffer = self._auxfile("{}.segbuffer".format(stamp))
+
+        try:
+            store = pd.HDFStore(wbuffer, 'w')
+            try:
+                self._append(store, key, data)
+            finally:
+                store.close()
+
+            # only waits for the data to be replaced, if it is being
+            slock = ProxyLock.get(self._segmentproxy)
+            try:
+                slock.acquire()
+                try:
+                    os.rename(wbuffer, segment)
+                finally:
+                    slock.release()
+            finally:
+                ProxyLock.put(slock)
+        except BaseException:
+            if os.path.exists(wbuffer):
+                os.remove(wbuffer)
+            raise
+
+    def compact(self, key):
+        """Merge all segment files into the data file, in order of creation.
+
+        Segments are merged into a copy of the data file that records them as
+        merged, and that replaces the data file when complete; readers see
+        the existing data until then. Segments are then removed.
+
+        :Arguments:
+            *key*
+                name of data object the segments were appended to
+
+        :Returns:
+            *n_segments*
+                number of segments merged
+
+        """
+        import pandas as pd
+
+        if not self._segments():
+            return 0
+
+        with self.stage():
+            segments = self._pending()
+            for segment in segments:
+                store = pd.HDFStore(segment, 'r')
+                try:
+                    data = store.select(key)
+                finally:
+                    store.close()
+
+                self._append(self.handle, key, data)
+
+            # keep those merged before but not yet removed
+            present = set(os.path.basename(segment)
+                          for segment in self._segments())
+            merged = [name for name in self._merged(self.handle)
+                      if name in present]
+            self.handle.root._v_attrs[MERGED_ATTR] = merged + [
+                os.path.basename(segment) for segment in segments]
+
+        if segments or merged:
+            self._remove_merged()
+
+        return len(segments)
+
+    def repack(self, key, complevel=None, complib=None):
+        """Rewrite the data file compactly, reclaiming space left by removed
+        or replaced rows.
+
+        The stored object is copied to a new file in blocks of rows, which
+        then replaces the data file. Readers see the existing data until
+        then; writers wait. Segments are left as they are; see
+        :meth:`compact`.
+
+        :Arguments:
+            *key*
+                name of data object to repack
+
+        :Keywords:
+            *complevel*
+                compression level to rewrite with, from 0 to 9 [5]
+            *complib*
+                compression library to rewrite with, as for
+                :class:`pandas.HDFStore` ['blosc']
+        """
+        import pandas as pd
+
+        complevel = 5 if complevel is None else complevel
+        complib = 'blosc' if complib is None else complib
+
+        with self.stage(copy=False):
+            source = pd.HDFStore(self.filename, 'r')
             try:
-                self.handle.append(
-                    key, data, data_columns=True, complevel=5, complib='blosc')
-            except AttributeError:
-                self.handle.append(key, data, complevel=5, complib='blosc')
+                merged = self._merged(source)
+                if merged:
+                    self.handle.root._v_attrs[MERGED_ATTR] = merged
+
+                if source.get_storer(key).nrows:
+                    blocks = source.select(key, chunksize=PARTITION_ROWS)
+                else:
+                    blocks = [source.select(key)]
+
+                for i, block in enumerate(blocks):
+                    write = self._append if i else self._put
+                    write(self.handle, key, block, complevel=complevel,
+                          complib=complib)
+            finally:
+                source.close()
 
     def get_data(self, key, **kwargs):
         """Retrieve pandas object stored in file, optionally based on where criteria.
 
+        Rows appended as segments are included after those in the data file.
+
         :Arguments:
             *key*
                 name of data to retrieve
@@ -100,7 +377,8 @@ class pdDataFile(File):
             *columns*
                 list of columns to return; all columns returned by default
             *iterator*
-                if True, return an iterator [``False``]
+                if True, return an iterator [``False``]; not available while
+                there are segments that have yet to be compacted
             *chunksize*
                 number of rows to include in iteration; implies
                 ``iterator=True``
@@ -110,11 +388,173 @@ class pdDataFile(File):
                 the selected data
         """
         with self.read():
-            return self.handle.select(key, **kwargs)
+            segments = self._pending()
+            if not segments:
+                return self.handle.select(key, **kwargs)
+            else:
+                return self._select_segmented(key, segments, **kwargs)
+
+    def _select_segmented(self, key, segments, where=None, start=None,
+                          stop=None, columns=None, iterator=False,
+                          chunksize=None):
+        """Select from the data file and its segments as a single object.
+
+        Row numbers given by *start* and *stop* refer to rows of the whole,
+        with the rows of each segment following those of the data file.
+
+        """
+        import pandas as pd
+
+        if iterator or chunksize is not None:
+            raise NotImplementedError("Cannot iterate over a dataset with "
+                                      "segments; compact it first.")
+
+        stores = [self.handle]
+        try:
+            for segment in segments:
+                stores.append(pd.HDFStore(segment, 'r'))
+
+            nrows = [store.get_storer(key).nrows for store in stores]
+            total = sum(nrows)
+
+            start = 0 if start is None else start
+            stop = total if stop is None else stop
+            start = max(start + total if start < 0 else start, 0)
+            stop = min(stop + total if stop < 0 else stop, total)
+
+            parts = list()
+            offset = 0
+            for store, n in zip(stores, nrows):
+                lo = min(max(start - offset, 0), n)
+                hi = min(max(stop - offset, 0), n)
+                offset += n
+
+                if hi > lo:
+                    parts.append(store.select(key, where=where, start=lo,
+                                              stop=hi, columns=columns))
+        finally:
+            for store in stores[1:]:
+                store.close()
+
+        if not parts:
+            return self.handle.select(key, where=where, start=0, stop=0,
+                                      columns=columns)
+
+        return pd.concat(parts)
+
+    def get_lazy(self, key, chunksize=None, start=None, stop=None,
+                 **kwargs):
+        """Get a stored Series or DataFrame as a dask collection, without
+        reading it.
+
+        Each partition is a range of rows, read only when computed, with the
+        data file opened and locked only for as long as it is read. Rows
+        appended as segments are included.
+
+        :Arguments:
+            *key*
+                name of data to retrieve
+
+        :Keywords:
+            *chunksize*
+                number of rows in each partition; by default, as many whole
+                HDF5 chunks of the stored table as fit in about a million rows
+            *start*
+                row number to start selection
+            *stop*
+                row number to stop selection
+
+        :Returns:
+            *data*
+                :class:`dask.dataframe.DataFrame` or
+                :class:`dask.dataframe.Series` of the selected data
+        """
+        import dask
+        import dask.dataframe as dd
+        import pandas as pd
+
+        with self.read():
+            meta = self.get_data(key, start=0, stop=0)
+            if not isinstance(meta, (pd.Series, pd.DataFrame)):
+                raise TypeError("Only Series and DataFrames can be "
+                                "retrieved lazily.")
+
+            if chunksize is None:
+                chunkrows = self.handle.get_storer(key).table.chunkshape[0]
+                chunksize = chunkrows * max(1, PARTITION_ROWS // chunkrows)
+
+            nrows = self.get_info(key)['nrows']
+
+        start, stop, step = slice(start, stop).indices(nrows)
+        partitions = [dask.delayed(_read_rows)(self.filename, key, lo,
+                                               min(lo + chunksize, stop),
+                                               self.readonly)
+                      for lo in range(start, stop, chunksize)]
+
+        if not partitions:
+            return dd.from_pandas(meta, npartitions=1)
+        return dd.from_delayed(partitions, meta=meta)
+
+    def get_size(self):
+        """Get size of the data file and its segments on disk, in bytes.
+
+        """
+        return (os.path.getsize(self.filename) +
+                sum(os.path.getsize(seg) for seg in self._segments()))
+
+    def get_info(self, key):
+        """Describe stored pandas object from its table metadata, without
+        reading it.
+
+        Rows appended as segments are included.
+
+        :Arguments:
+            *key*
+                name of data to describe
+
+        :Returns:
+            *info*
+                dict giving the storage type as *pandas_type* (e.g.
+                ``'frame_table'``), number of rows as *nrows*, *columns*
+                (``None`` if not a DataFrame), the *dtypes* of the stored
+                table's columns, estimated size in memory as *nbytes*, and
+                size on disk in bytes as *size*
+        """
+        import pandas as pd
+
+        with self.read():
+            storer = self.handle.get_storer(key)
+            table = storer.table
+
+            info = {'pandas_type': storer.pandas_type,
+                    'columns': None,
+                    'dtypes': {name: str(dtype)
+                               for name, dtype in table.coldtypes.items()
+                               if name != 'index'}}
+            if storer.pandas_type == 'frame_table':
+                info['columns'] = list(storer.non_index_axes[0][1])
+
+            # plain ints, as numpy's aren't serializable as JSON
+            nrows = int(storer.nrows)
+            for segment in self._pending():
+                store = pd.HDFStore(segment, 'r')
+                try:
+                    nrows += int(store.get_storer(key).nrows)
+                finally:
+                    store.close()
+
+            info['nrows'] = nrows
+            info['nbytes'] = nrows * int(table.rowsize)
+            info['size'] = self.get_size()
+
+        return info
 
     def del_data(self, key, **kwargs):
         """Delete a stored data object.
 
+        Any segments are first compacted into the data file, so that
+        selections apply to all rows.
+
         :Arguments:
             *key*
                 name of data to delete
@@ -128,6 +568,7 @@ class pdDataFile(File):
                 row number to stop selection
 
         """
+        self.compact(key)
         with self.write():
             self.handle.remove(key, **kwargs)
 
@@ -5,10 +5,13 @@ File backends for storing general python objects.
 
 from six.moves import cPickle as pickle
 
-from datreant.state import BaseFile as File
+from .base import File
 
 pydatafile = 'pyData.pkl'
 
+# key marking the header pickled ahead of the stored object
+HEADER = 'mdsynthesis.pydata.header'
+
 
 class pyDataFile(File):
     """Interface to python object data files.
@@ -26,10 +29,15 @@ class pyDataFile(File):
     def _open_file_w(self):
         return open(self.filename, 'wb+')
 
+    def _open_buffer_w(self):
+        return open(self._writebuffer, 'wb')
+
     def add_data(self, key, data):
         """Add a numpy array to the data file.
 
-        If data already exists for the given key, then it is overwritten.
+        If data already exists for the given key, then it is overwritten. The
+        object is written to a buffer that replaces the existing data file
+        only when complete, so readers see the existing data until then.
 
         :Arguments:
             *key*
@@ -39,9 +47,42 @@ class pyDataFile(File):
         """
         # use highest python 2 pickle protocol. This allows efficient storage
         # across python versions
-        with self.write():
+        with self.stage(copy=False):
+            pickle.dump(self._make_header(data), self.handle, 2)
             pickle.dump(data, self.handle, 2)
 
+    @staticmethod
+    def _make_header(data):
+        """Make header describing `data`, to be stored ahead of it.
+
+        """
+        try:
+            length = len(data)
+        except TypeError:
+            length = None
+
+        pytype = type(data)
+        return {HEADER: 1,
+                'pytype': "{}.{}".format(pytype.__module__, pytype.__name__),
+                'length': length}
+
+    @staticmethod
+    def _is_header(obj):
+        return (isinstance(obj, dict) and
+                (HEADER in obj or HEADER.encode() in obj))
+
+    def _load(self):
+        """Load the next pickled object from the open file.
+
+        """
+        # load in bytes with python3 to ensure successful read EVERYTIME.
+        # Using the ascii encoding it can happen that python3 can read a
+        # pickle written with python 2.
+        try:
+            return pickle.load(self.handle, encoding='bytes')
+        except TypeError:
+            return pickle.load(self.handle)
+
     def get_data(self, key, **kwargs):
         """Retrieve numpy array stored in file.
 
@@ -54,10 +95,40 @@ class pyDataFile(File):
                 the selected data
         """
         with self.read():
-            # load in bytes with python3 to ensure successful read EVERYTIME.
-            # Using the ascii encoding it can happen that python3 can read a
-            # pickle written with python 2.
-            try:
-                return pickle.load(self.handle, encoding='bytes')
-            except TypeError:
-                return pickle.load(self.handle)
+            data = self._load()
+
+            # objects stored by older versions have no header
+            if self._is_header(data):
+                data = self._load()
+
+            return data
+
+    def get_info(self, key):
+        """Describe stored object from its header, without loading it.
+
+        Objects stored without a header are loaded to describe them.
+
+        :Arguments:
+            *key*
+                not used, but needed to give consistent interface
+
+        :Returns:
+            *info*
+                dict giving the object's type as *pytype*, its length
+                as *length* (``None`` if it has none), and its size on disk
+                in bytes as *size*
+        """
+        with self.read():
+            header = self._load()
+
+        if self._is_header(header):
+            # keys and strings may be bytes if pickled with python 2
+            header = {(k.decode() if isinstance(k, bytes) else k):
+                      (v.decode() if isinstance(v, bytes) else v)
+                      for k, v in header.items()}
+        else:
+            header = self._make_header(header)
+
+        return {'pytype': header['pytype'],
+                'length': header['length'],
+                'size': self.get_size()}
@@ -0,0 +1,432 @@
+"""
+File backends for storing large numpy arrays in shards.
+
+"""
+import os
+import json
+import time
+import uuid
+
+from .base import File
+from .npdata import npDataFile, fields_dtype, lossy_dtype
+
+shdatafile = 'shData.json'
+
+
+class ShardFile(npDataFile):
+    """Interface to a single shard of a sharded numpy array.
+
+    Each shard is an HDF5 file with its own locks, so shards can be read and
+    written independently of each other.
+
+    """
+
+
+class shDataFile(File):
+    """Interface to sharded numpy array data files.
+
+    Arrays are split along their first axis into shards of a fixed number of
+    rows, each stored in its own HDF5 file. The datafile itself is a small
+    JSON manifest giving the array's shape and dtype, the number of rows in
+    each shard, and the generation of shards in use. Shards are hidden
+    auxiliary files of the manifest, so they are removed along with it.
+
+    Readers hold a shared lock on the manifest, and a lock on each shard
+    they read; in-place writes to regions of the array lock only the shards
+    they touch, so writes to different shards can happen at the same time.
+    Replacing the array writes a new generation of shards, then commits the
+    manifest referring to them.
+
+    """
+
+    def _open_file_r(self):
+        return open(self.filename, 'r')
+
+    def _open_file_w(self):
+        return open(self.filename, 'r+')
+
+    def _open_buffer_w(self):
+        return open(self._writebuffer, 'w')
+
+    def _read_manifest(self):
+        """Read the manifest; must be called holding a lock.
+
+        """
+        self.handle.seek(0)
+        return json.load(self.handle)
+
+    def _shardpath(self, generation, index):
+        return self._auxfile("{}.{}.shard".format(generation, index))
+
+    def _shard(self, manifest, index):
+        return ShardFile(self._shardpath(manifest['generation'], index),
+                         readonly=self.readonly)
+
+    def _shards(self, generation=None):
+        """List paths to all shard files, or only those of one generation.
+
+        """
+        directory, filename = os.path.split(self.filename)
+        if generation is None:
+            prefix = ".{}.".format(filename)
+        else:
+            prefix = ".{}.{}.".format(filename, generation)
+        return sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                      if f.startswith(prefix) and f.endswith('.shard'))
+
+    def _contents(self):
+        return ([self.filename] +
+                self._shards(self._read_manifest()['generation']))
+
+    def _auxdata(self):
+        return self._shards()
+
+    @staticmethod
+    def _generation(shard):
+        # shards are named '.<datafile>.<generation>.<index>.shard'
+        return os.path.basename(shard).split('.')[-3]
+
+    def _remove_shards(self, generation):
+        """Remove the shards of a generation, along with their own auxiliary
+        files.
+
+        """
+        self._remove_auxfiles(self._shards(generation))
+
+    @staticmethod
+    def _bounds(manifest):
+        """Get the range of rows in each shard.
+
+        """
+        nrows = manifest['shape'][0]
+        shard_rows = manifest['shard_rows']
+        return [(start, min(start + shard_rows, nrows))
+                for start in range(0, nrows, shard_rows)]
+
+    @staticmethod
+    def _dtype(manifest):
+        import numpy as np
+        descr = manifest['dtype']
+        if isinstance(descr, list):
+            descr = [tuple(field) for field in descr]
+        return np.dtype(descr)
+
+    def _replace(self, key, shape, dtype, shard_rows, fill):
+        """Write a new generation of shards, then commit a manifest
+        referring to them and remove the old generation.
+
+        """
+        import numpy as np
+
+        self._check_writable()
+
+        dtype = np.dtype(dtype)
+        shape = tuple(int(n) for n in shape)
+        if not shape:
+            raise ValueError("Cannot shard a scalar.")
+        if shard_rows < 1:
+            raise ValueError("Shards must have at least one row.")
+
+        # unique across processes, like segments of pandas datasets
+        generation = "{:020d}-{}".format(int(time.time() * 1e6),
+                                         uuid.uuid4().hex)
+        manifest = {'shape': shape,
+                    'dtype': np.lib.format.dtype_to_descr(dtype),
+                    'shard_rows': int(shard_rows),
+                    'generation': generation}
+
+        try:
+            for index, (start, stop) in enumerate(self._bounds(manifest)):
+                fill(self._shard(manifest, index), start, stop)
+
+            # readers must not be reading shards of the old generation when
+            # they are removed
+            with self.stage(copy=False, exclusive=True):
+                json.dump(manifest, self.handle)
+                old = set(self._generation(shard)
+                          for shard in self._shards()) - set([generation])
+        except BaseException:
+            self._remove_shards(generation)
+            raise
+
+        for oldgen in old:
+            self._remove_shards(oldgen)
+
+    def add_data(self, key, data, shard_rows, precision=None, downcast=None):
+        """Add a numpy array to the data file, split into shards.
+
+        If data already exists for the given key, then it is overwritten.
+
+        :Arguments:
+            *key*
+                name given to the data; used as the index for retrieving
+                the data later
+            *data*
+                the numpy array to store
+            *shard_rows*
+                number of rows in each shard
+
+        :Keywords:
+            *precision*
+                number of decimal places to keep in each shard; see
+                :meth:`npDataFile.add_data`
+            *downcast*
+                floating point dtype to store each shard as; see
+                :meth:`npDataFile.add_data`
+        """
+        if precision is not None or downcast is not None:
+            # fail before writing any shards
+            lossy_dtype(data, precision=precision, downcast=downcast)
+
+        def fill(shard, start, stop):
+            shard.add_data(key, data[start:stop], precision=precision,
+                           downcast=downcast)
+
+        self._replace(key, data.shape, data.dtype, shard_rows, fill)
+
+    def create_data(self, key, shape, dtype, shard_rows, chunks=None,
+                    fillvalue=None):
+        """Preallocate a numpy array split into shards, to be filled in with
+        :meth:`write_region`.
+
+        :Arguments:
+            *key*
+                name given to the data; used as the index for retrieving
+                the data later
+            *shape*
+                shape of the array
+            *dtype*
+                dtype of the array
+            *shard_rows*
+                number of rows in each shard
+
+        :Keywords:
+            *chunks*
+                shape of HDF5 chunks within each shard; ``True`` to choose one
+                automatically, ``None`` to store shards contiguously
+            *fillvalue*
+                value of elements not yet written [``None``, for zero]
+        """
+        def fill(shard, start, stop):
+            shardchunks = chunks
+            if isinstance(chunks, tuple):
+                # chunks can't be larger than the last, smaller shard
+                shardchunks = (min(chunks[0], stop - start),) + chunks[1:]
+            shard.create_data(key, (stop - start,) + tuple(shape[1:]), dtype,
+                              chunks=shardchunks, fillvalue=fillvalue)
+
+        self._replace(key, shape, dtype, shard_rows, fill)
+
+    def write_region(self, key, region, values):
+        """Write values to a region of a sharded numpy array, in place.
+
+        Only the shards overlapping the region are locked, each exclusively
+        while it is written.
+
+        :Arguments:
+            *key*
+                name of data to write to
+            *region*
+                index of the region to write; its first element must be a row
+                number or a slice of rows with unit step
+            *values*
+                values to write; must broadcast to the region's shape
+        """
+        import numpy as np
+
+        self._check_writable()
+
+        if not isinstance(region, tuple):
+            region = (region,)
+        rows, rest = region[0], region[1:]
+
+        with self.read():
+            manifest = self._read_manifest()
+            bounds = self._bounds(manifest)
+            nrows = manifest['shape'][0]
+
+            if isinstance(rows, slice):
+                start, stop, step = rows.indices(nrows)
+                if step != 1:
+                    raise ValueError("Rows of sharded arrays must be written "
+                                     "with unit step.")
+
+                shape = np.broadcast_to(np.empty((), self._dtype(manifest)),
+                                        manifest['shape'])[region].shape
+                values = np.broadcast_to(values, shape)
+
+                for index, (first, last) in enumerate(bounds):
+                    if first >= stop or last <= start:
+                        continue
+                    lo, hi = max(start, first), min(stop, last)
+                    self._shard(manifest, index).write_region(
+                        key, (slice(lo - first, hi - first),) + rest,
+                        values[lo - start:hi - start])
+            else:
+                row = int(rows)
+                if row < 0:
+                    row += nrows
+                if not 0 <= row < nrows:
+                    raise IndexError("Row {} out of range for array with {} "
+                                     "rows".format(rows, nrows))
+                index = row // manifest['shard_rows']
+                self._shard(manifest, index).write_region(
+                    key, (row - bounds[index][0],) + rest, values)
+
+    def repack(self, key, complevel=None, complib=None):
+        """Rewrite each shard compactly, reclaiming space left by writes to
+        regions of compressed shards.
+
+        Each shard is repacked in turn, as for :meth:`npDataFile.repack`.
+
+        :Arguments:
+            *key*
+                name of data to repack
+
+        :Keywords:
+            *complevel*
+                gzip compression level to rewrite with
+            *complib*
+                compression filter to rewrite with
+        """
+        self._check_writable()
+
+        with self.read():
+            manifest = self._read_manifest()
+            for index in range(len(self._bounds(manifest))):
+                self._shard(manifest, index).repack(
+                    key, complevel=complevel, complib=complib)
+
+    def get_data(self, key, start=None, stop=None, columns=None, **kwargs):
+        """Retrieve a sharded numpy array, or a range of its rows.
+
+        Only the shards holding the rows requested are read.
+
+        :Arguments:
+            *key*
+                name of data to retrieve
+
+        :Keywords:
+            *start*
+                row number to start selection
+            *stop*
+                row number to stop selection
+            *columns*
+                for structured arrays, list of fields to return; only these
+                are read
+
+        :Returns:
+            *data*
+                the selected data
+        """
+        import numpy as np
+
+        with self.read():
+            manifest = self._read_manifest()
+            start, stop, step = slice(start, stop).indices(
+                manifest['shape'][0])
+
+            parts = list()
+            for index, (first, last) in enumerate(self._bounds(manifest)):
+                if first >= stop or last <= start:
+                    continue
+                parts.append(self._shard(manifest, index).get_data(
+                    key, start=max(start, first) - first,
+                    stop=min(stop, last) - first, columns=columns))
+
+        dtype = self._dtype(manifest)
+        if columns is not None:
+            dtype = fields_dtype(dtype, columns)
+
+        if parts:
+            return np.concatenate(parts)
+        else:
+            return np.empty((0,) + tuple(manifest['shape'][1:]), dtype=dtype)
+
+    def get_lazy(self, key, chunks=None, start=None, stop=None, **kwargs):
+        """Get a sharded numpy array as a dask array, without reading it.
+
+        The dask array joins those of each shard; see
+        :meth:`npDataFile.get_lazy`. It reads the shards in use when it was
+        made, so replacing the array invalidates it.
+
+        :Arguments:
+            *key*
+                name of data to retrieve
+
+        :Keywords:
+            *chunks*
+                chunks of the dask array of each shard; by default, those the
+                shards are stored with in HDF5
+            *start*
+                row number to start selection
+            *stop*
+                row number to stop selection
+
+        :Returns:
+            *data*
+                :class:`dask.array.Array` of the selected data
+        """
+        import numpy as np
+        import dask.array as da
+
+        with self.read():
+            manifest = self._read_manifest()
+            nrows = manifest['shape'][0]
+            start, stop, step = slice(start, stop).indices(nrows)
+
+            parts = list()
+            for index, (first, last) in enumerate(self._bounds(manifest)):
+                if first >= stop or last <= start:
+                    continue
+                parts.append(self._shard(manifest, index).get_lazy(
+                    key, chunks=chunks, start=max(start, first) - first,
+                    stop=min(stop, last) - first))
+
+        if parts:
+            return da.concatenate(parts)
+        else:
+            return da.from_array(
+                np.empty((0,) + tuple(manifest['shape'][1:]),
+                         dtype=self._dtype(manifest)))
+
+    def get_size(self):
+        """Get size of the manifest and all shards on disk, in bytes.
+
+        """
+        return (os.path.getsize(self.filename) +
+                sum(os.path.getsize(shard) for shard in self._shards()))
+
+    def get_info(self, key):
+        """Describe stored array from its manifest, without reading it.
+
+        :Arguments:
+            *key*
+                name of data to describe
+
+        :Returns:
+            *info*
+                dict giving the array's *shape*, *dtype*, number of rows as
+                *nrows*, field names as *columns* (``None`` if not a
+                structured array), size in memory as *nbytes*, number of rows
+                in each shard as *shard_rows*, number of shards as *shards*,
+                and size on disk in bytes as *size*, including all shards
+        """
+        with self.read():
+            manifest = self._read_manifest()
+            size = self.get_size()
+
+        dtype = self._dtype(manifest)
+        shape = tuple(manifest['shape'])
+        nelements = 1
+        for n in shape:
+            nelements *= n
+
+        return {'shape': shape,
+                'dtype': str(dtype),
+                'nrows': shape[0],
+                'columns': list(dtype.names) if dtype.names else None,
+                'nbytes': nelements * dtype.itemsize,
+                'shard_rows': manifest['shard_rows'],
+                'shards': len(self._bounds(manifest)),
+                'size': size}
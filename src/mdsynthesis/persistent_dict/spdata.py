@@ -0,0 +1,188 @@
+"""
+File backends for storing scipy sparse matrices.
+
+"""
+
+from .base import File
+from .npdata import repack_hdf5
+
+spdatafile = 'spData.h5'
+
+# components of the CSR matrices stored
+COMPONENTS = ('data', 'indices', 'indptr')
+
+
+class spDataFile(File):
+    """Interface to sparse matrix data files.
+
+    Sparse matrices of any format are stored in HDF5 as the compressed
+    components of the equivalent CSR matrix, and returned in their original
+    format. Lists of sparse matrices of the same shape, such as contact maps
+    for each frame, are stored as a single CSR matrix stacking them.
+    Ranges of rows of a matrix, or of matrices of a stack, can be retrieved
+    reading only the parts of the components holding them. This class uses
+    h5py as its backend.
+
+    """
+
+    def _open_file_r(self):
+        import h5py
+        return h5py.File(self.filename, 'r')
+
+    def _open_file_w(self):
+        import h5py
+        return h5py.File(self.filename, 'a')
+
+    def _open_buffer_w(self):
+        import h5py
+        return h5py.File(self._writebuffer, 'w')
+
+    def add_data(self, key, data):
+        """Add a sparse matrix, or a list of sparse matrices of the same
+        shape, to the data file.
+
+        If data already exists for the given key, then it is overwritten. The
+        matrices are written to a buffer that replaces the existing data file
+        only when complete, so readers see the existing data until then.
+
+        :Arguments:
+            *key*
+                name given to the data; used as the index for retrieving
+                the data later
+            *data*
+                the sparse matrix, or list of sparse matrices, to store
+        """
+        import scipy.sparse as sp
+
+        if isinstance(data, (list, tuple)):
+            frames = len(data)
+            first = data[0]
+            matrix = sp.vstack(data, format='csr')
+        else:
+            frames = None
+            first = data
+            matrix = sp.csr_matrix(data)
+
+        with self.stage(copy=False):
+            group = self.handle.create_group(key)
+            group.attrs['format'] = first.format
+            group.attrs['array'] = not isinstance(first, sp.spmatrix)
+            group.attrs['shape'] = first.shape
+            group.attrs['frames'] = -1 if frames is None else frames
+
+            for name in COMPONENTS:
+                component = getattr(matrix, name)
+                if component.size:
+                    group.create_dataset(name, data=component,
+                                         compression='gzip', shuffle=True)
+                else:
+                    group.create_dataset(name, data=component)
+
+    def repack(self, key, complevel=None, complib=None):
+        """Rewrite the data file compactly.
+
+        See :func:`~mdsynthesis.persistent_dict.npdata.repack_hdf5`.
+
+        :Arguments:
+            *key*
+                not used, but needed to give consistent interface
+
+        :Keywords:
+            *complevel*
+                gzip compression level to rewrite with, from 0 to 9; 0 for no
+                compression
+            *complib*
+                compression filter to rewrite with, ``'gzip'`` or ``'lzf'``;
+                by default, components keep their compression
+        """
+        repack_hdf5(self, complevel=complevel, complib=complib)
+
+    def _read_rows(self, group, start, stop):
+        """Read rows of the stored CSR matrix as its components.
+
+        """
+        indptr = group['indptr'][start:stop + 1]
+        first, last = int(indptr[0]), int(indptr[-1])
+
+        return (group['data'][first:last], group['indices'][first:last],
+                indptr - first)
+
+    def get_data(self, key, start=None, stop=None, **kwargs):
+        """Retrieve sparse matrix, or list of sparse matrices, stored in file.
+
+        :Arguments:
+            *key*
+                name of data to retrieve
+
+        :Keywords:
+            *start*
+                row to start selection, or for lists, matrix to start
+                selection
+            *stop*
+                row to stop selection, or for lists, matrix to stop selection
+
+        :Returns:
+            *data*
+                the selected data
+        """
+        import scipy.sparse as sp
+
+        with self.read():
+            group = self.handle[key]
+            fmt = str(group.attrs['format'])
+            array = bool(group.attrs['array'])
+            nrows, ncols = (int(n) for n in group.attrs['shape'])
+            frames = int(group.attrs['frames'])
+
+            total = nrows if frames < 0 else frames
+            start, stop, step = slice(start, stop).indices(total)
+            stop = max(start, stop)
+
+            if frames < 0:
+                components = self._read_rows(group, start, stop)
+            else:
+                components = self._read_rows(group, start * nrows,
+                                             stop * nrows)
+
+        csr = sp.csr_array if array else sp.csr_matrix
+        if frames < 0:
+            return csr(components, shape=(stop - start, ncols)).asformat(fmt)
+
+        data, indices, indptr = components
+        out = list()
+        for i in range(stop - start):
+            rows = indptr[i * nrows:(i + 1) * nrows + 1]
+            first, last = rows[0], rows[-1]
+            out.append(csr((data[first:last], indices[first:last],
+                            rows - first),
+                           shape=(nrows, ncols)).asformat(fmt))
+        return out
+
+    def get_info(self, key):
+        """Describe stored sparse matrices from their metadata, without
+        reading them.
+
+        :Arguments:
+            *key*
+                name of data to describe
+
+        :Returns:
+            *info*
+                dict giving the matrices' *format*, *shape*, *dtype*, and
+                total number of stored elements as *nnz*, the number of
+                matrices in a list as *frames* (``None`` if a single matrix),
+                size in memory of the CSR components as *nbytes*, and size on
+                disk in bytes as *size*
+        """
+        with self.read():
+            group = self.handle[key]
+            frames = int(group.attrs['frames'])
+            info = {'format': str(group.attrs['format']),
+                    'shape': tuple(int(n) for n in group.attrs['shape']),
+                    'dtype': str(group['data'].dtype),
+                    'nnz': group['data'].shape[0],
+                    'frames': None if frames < 0 else frames,
+                    'nbytes': sum(group[name].nbytes for name in COMPONENTS)}
+
+        info['size'] = self.get_size()
+        return info
@@ -0,0 +1,178 @@
+"""
+File backends for storing labelled arrays with xarray.
+
+"""
+
+from .base import File
+
+xrdatafile = 'xrData.nc'
+
+# netCDF4 files are written and read through h5py
+ENGINE = 'h5netcdf'
+
+# attribute marking datasets stored from a DataArray, giving its variable
+DATAARRAY_ATTR = 'mdsynthesis_dataarray'
+
+# variable name given to DataArrays without a name
+UNNAMED = '__xarray_dataarray_variable__'
+
+
+class xrDataFile(File):
+    """Interface to xarray object data files.
+
+    Data is stored as xarray Datasets or DataArrays in the netCDF4 format,
+    which is HDF5 underneath, with their dimensions, coordinates, and
+    attributes. This class gives the needed components for storing and
+    retrieving stored data. It uses xarray with the h5netcdf engine as its
+    backend.
+
+    Stored variables are read only as far as needed, so selections by label
+    or by position along dimensions read only the selected parts of each
+    variable.
+
+    """
+
+    def _open_file_r(self):
+        return open(self.filename, 'rb')
+
+    def _open_file_w(self):
+        return open(self.filename, 'r+b')
+
+    def _open_buffer_w(self):
+        return open(self._writebuffer, 'w+b')
+
+    def add_data(self, key, data):
+        """Add an xarray Dataset or DataArray to the data file.
+
+        If data already exists for the given key, then it is overwritten. The
+        object is written to a buffer that replaces the existing data file
+        only when complete, so readers see the existing data until then.
+
+        :Arguments:
+            *key*
+                name given to the data; used as the index for retrieving
+                the data later
+            *data*
+                the xarray object to store
+        """
+        import xarray as xr
+
+        if isinstance(data, xr.DataArray):
+            name = UNNAMED if data.name is None else data.name
+            data = data.to_dataset(name=name)
+            data.attrs[DATAARRAY_ATTR] = name
+
+        with self.stage(copy=False):
+            data.to_netcdf(self.handle, engine=ENGINE, group=key)
+
+    @staticmethod
+    def _select(dataset, sel=None, isel=None, variables=None):
+        """Select from a stored dataset, returning a DataArray if that is
+        what was stored.
+
+        """
+        name = dataset.attrs.get(DATAARRAY_ATTR)
+        if name is None and variables is not None:
+            dataset = dataset[list(variables)]
+        if isel:
+            dataset = dataset.isel(**isel)
+        if sel:
+            dataset = dataset.sel(**sel)
+
+        if name is None:
+            return dataset
+
+        array = dataset[name]
+        if name == UNNAMED:
+            array.name = None
+        return array
+
+    def get_data(self, key, sel=None, isel=None, variables=None, lazy=False,
+                 chunks=None, **kwargs):
+        """Retrieve xarray object stored in file, or a selection of it.
+
+        :Arguments:
+            *key*
+                name of data to retrieve
+
+        :Keywords:
+            *sel*
+                dict giving labels to select along each dimension, as for
+                :meth:`xarray.Dataset.sel`; slices of labels select ranges
+            *isel*
+                dict giving positions to select along each dimension, as for
+                :meth:`xarray.Dataset.isel`; applied before *sel*
+            *variables*
+                for Datasets, list of variables to return; all returned by
+                default
+            *lazy*
+                if True, return the selection backed by dask arrays, reading
+                the data only when computed; these read the data file
+                without locking it [``False``]
+            *chunks*
+                if *lazy*, chunks of the dask arrays, as for
+                :func:`xarray.open_dataset`; by default, the HDF5 chunks the
+                variables are stored with
+
+        :Returns:
+            *data*
+                the selected data
+        """
+        import xarray as xr
+
+        if lazy:
+            with self.read():
+                dataset = xr.open_dataset(
+                    self.filename, engine=ENGINE, group=key,
+                    chunks={} if chunks is None else chunks)
+            return self._select(dataset, sel=sel, isel=isel,
+                                variables=variables)
+
+        with self.read():
+            dataset = xr.open_dataset(self.filename, engine=ENGINE,
+                                      group=key, cache=False)
+            try:
+                return self._select(dataset, sel=sel, isel=isel,
+                                    variables=variables).load()
+            finally:
+                dataset.close()
+
+    def get_info(self, key):
+        """Describe stored xarray object from its metadata, without reading
+        it.
+
+        :Arguments:
+            *key*
+                name of data to describe
+
+        :Returns:
+            *info*
+                dict giving the type of object as *xarray_type*, the size of
+                each dimension as *dims*, the names of *coords*, the *dims*,
+                *shape*, and *dtype* of each of the *variables*, size in
+                memory as *nbytes*, as given by xarray for the stored object,
+                and size on disk in bytes as *size*
+        """
+        import xarray as xr
+
+        with self.read():
+            dataset = xr.open_dataset(self.filename, engine=ENGINE,
+                                      group=key, cache=False)
+            try:
+                name = dataset.attrs.get(DATAARRAY_ATTR)
+                info = {'xarray_type': ('Dataset' if name is None
+                                        else 'DataArray'),
+                        'dims': dict(dataset.sizes),
+                        'coords': list(dataset.coords),
+                        'variables': {
+                            var: {'dims': dataset[var].dims,
+                                  'shape': dataset[var].shape,
+                                  'dtype': str(dataset[var].dtype)}
+                            for var in dataset.data_vars},
+                        'nbytes': (dataset.nbytes if name is None
+                                   else dataset[name].nbytes)}
+            finally:
+                dataset.close()
+
+        info['size'] = self.get_size()
+        return info
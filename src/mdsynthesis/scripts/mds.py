@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+"""Query Sims and their datasets from the command line.
+
+Only the lightweight parts of :mod:`mdsynthesis` are used, so neither
+MDAnalysis nor the numpy/pandas stack are imported.
+
+"""
+import sys
+import json
+
+from mdsynthesis import discover
+from mdsynthesis.treants import Sim
+from mdsynthesis.util import starmap
+
+# categories of disk usage shown, in order
+USAGE_CATEGORIES = ('total', 'data', 'universe', 'coordinates', 'state',
+                    'other')
+
+
+def query(path, universe=False, data=False, usage=False):
+    """Query a Sim for what it has.
+
+    The Sim is only read, as an immutable Sim, so nothing is written to it;
+    Sims on read-only storage can be queried.
+
+    :Arguments:
+        *path*
+            path to the Sim
+
+    :Keywords:
+        *universe*
+            if True, include the Sim's universe definition
+        *data*
+            if True, include the Sim's datasets, their types and sizes
+        *usage*
+            if True, include the Sim's disk usage, as given by
+            :meth:`mdsynthesis.Sim.usage`
+
+    :Returns:
+        *result*
+            dict giving the Sim's path and name, along with anything else
+            requested
+    """
+    sim = Sim(path, immutable=True)
+    result = {'sim': sim.abspath, 'name': sim.name}
+
+    if universe:
+        universedef = sim.universedef
+        result['universe'] = {'topology': universedef.topology,
+                              'trajectory': universedef.trajectory,
+                              'kwargs': universedef.kwargs}
+    if data:
+        result['data'] = sim.data.usage()
+    if usage:
+        result['usage'] = sim.usage()
+
+    return result
+
+
+def scan(directories, universe=False, data=False, usage=False, depth=None,
+         processes=1):
+    """Query all Sims found in the given directories.
+
+    :Arguments:
+        *directories*
+            directories to search for Sims
+
+    :Keywords:
+        *universe*
+            if True, include each Sim's universe definition
+        *data*
+            if True, include each Sim's datasets, their types and sizes
+        *usage*
+            if True, include each Sim's disk usage
+        *depth*
+            maximum directory depth to search for Sims; no limit if ``None``
+        *processes*
+            how many processes to use for querying Sims
+
+    :Returns:
+        *results*
+            list giving the result of :func:`query` for each Sim, in order
+    """
+    paths = list()
+    for directory in directories:
+        for sim in discover(directory, depth=depth, immutable=True):
+            if sim.abspath not in paths:
+                paths.append(sim.abspath)
+
+    return starmap(query, [(path, universe, data, usage) for path in paths],
+                   processes=processes)
+
+
+def _format(result):
+    """Human-readable form of a query result."""
+    out = result['sim']
+
+    if 'universe' in result:
+        universe = result['universe']
+        trajectory = universe['trajectory']
+        if isinstance(trajectory, (list, tuple)):
+            trajectory = ', '.join(trajectory)
+        out += "\n  topology: {}".format(universe['topology'])
+        out += "\n  trajectory: {}".format(trajectory)
+        if universe['kwargs']:
+            out += "\n  kwargs: {}".format(universe['kwargs'])
+
+    if 'data' in result:
+        for handle in sorted(result['data']):
+            dataset = result['data'][handle]
+            out += "\n  {}  {}  {}".format(handle, dataset['type'],
+                                           dataset['size'])
+
+    if 'usage' in result:
+        usage = result['usage']
+        out += "\n  " + "  ".join(
+            "{}: {}".format(category, usage[category])
+            for category in USAGE_CATEGORIES)
+
+    return out
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Query Sims, their universe definitions, and datasets",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "directories",
+        metavar="DIRECTORY",
+        nargs="*",
+        default=['.'],
+        help="one or more directories to search for Sims")
+    common.add_argument(
+        "--depth",
+        type=int,
+        default=None,
+        help="maximum directory depth to search for Sims")
+    common.add_argument(
+        "-j", "--processes",
+        type=int,
+        default=1,
+        help="number of processes to use for querying Sims")
+    common.add_argument(
+        "--json",
+        action="store_true",
+        help="output as JSON")
+
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("list", parents=[common],
+                        help="list Sims")
+    commands.add_parser("universe", parents=[common],
+                        help="show universe definitions of Sims")
+    commands.add_parser("data", parents=[common],
+                        help="show datasets of Sims, with their types and "
+                             "sizes in bytes")
+    commands.add_parser("usage", parents=[common],
+                        help="show disk usage of Sims in bytes, by what it "
+                             "is used for")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+
+    results = scan(args.directories,
+                   universe=(args.command == 'universe'),
+                   data=(args.command == 'data'),
+                   usage=(args.command == 'usage'),
+                   depth=args.depth,
+                   processes=args.processes)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        for result in results:
+            print(_format(result))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -101,6 +101,61 @@ class Numpy4D():
         return np.random.rand(2, 4, 10000, 45)
 
 
+class NumpyStructured():
+    @pytest.fixture
+    def datastruct(self):
+        data = np.zeros(1000, dtype=[('frame', 'i8'), ('time', 'f8'),
+                                     ('rmsd', 'f4'), ('com', 'f8', (3,)),
+                                     ('label', 'S8')])
+        data['frame'] = np.arange(1000)
+        data['time'] = np.arange(1000) * 10.0
+        data['rmsd'] = np.random.rand(1000)
+        data['com'] = np.random.rand(1000, 3)
+        data['label'] = 'frame'
+        return data
+
+
+class XarrayDataArray():
+    @pytest.fixture
+    def datastruct(self):
+        xr = pytest.importorskip('xarray')
+        return xr.DataArray(np.random.rand(100, 20, 3),
+                            dims=('frame', 'residue', 'feature'),
+                            coords={'frame': np.arange(100) * 10.0,
+                                    'residue': ['R{}'.format(i)
+                                                for i in range(20)],
+                                    'feature': ['x', 'y', 'z']},
+                            attrs={'units': 'nm'})
+
+
+class XarrayDataset():
+    @pytest.fixture
+    def datastruct(self):
+        xr = pytest.importorskip('xarray')
+        return xr.Dataset({'rmsd': (('frame',), np.random.rand(100)),
+                           'contacts': (('frame', 'residue'),
+                                        np.random.randint(0, 10, (100, 20)))},
+                          coords={'frame': np.arange(100) * 10.0,
+                                  'residue': np.arange(1, 21)})
+
+
+class SparseMatrix():
+    @pytest.fixture
+    def datastruct(self):
+        sp = pytest.importorskip('scipy.sparse')
+        return sp.random(300, 200, density=0.01, format='csr',
+                         random_state=42)
+
+
+class SparseStack():
+    @pytest.fixture
+    def datastruct(self):
+        sp = pytest.importorskip('scipy.sparse')
+        return [sp.random(50, 50, density=0.02, format='coo',
+                          random_state=i)
+                for i in range(20)]
+
+
 class List():
     @pytest.fixture
     def datastruct(self):
@@ -0,0 +1,286 @@
+"""Tests for memoization of analyses.
+
+"""
+import os
+import sys
+import pickle
+import subprocess
+
+import numpy as np
+import pytest
+
+import mdsynthesis as mds
+from mdsynthesis.analysis import (memoize, Memoized, incremental, Incremental,
+                                  MEMOIZED_HANDLE)
+
+from MDAnalysisTests.datafiles import GRO, XTC, PDB
+
+calls = []
+
+
+@memoize(selections=['selection'])
+def n_atoms(sim, selection, scale=1):
+    calls.append((selection, scale))
+    return len(sim.atomselections.create(selection)) * scale
+
+
+@memoize
+def n_frames(sim):
+    calls.append(None)
+    return sim.universe.trajectory.n_frames
+
+
+class TestMemoize:
+    """Test memoized analyses of Sims"""
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        del calls[:]
+        with tmpdir.as_cwd():
+            s = mds.Sim('testsim')
+            s.universedef.define(GRO, XTC)
+            s.atomselections['CA'] = 'name CA'
+            s.atomselections['HA'] = 'name HA'
+        return s
+
+    def test_memoize(self, sim):
+        assert isinstance(n_atoms, Memoized)
+        assert n_atoms.__name__ == 'n_atoms'
+
+        first = n_atoms(sim, 'CA')
+        assert n_atoms(sim, 'CA') == first
+        assert n_atoms(sim, selection='CA', scale=1) == first
+        assert calls == [('CA', 1)]
+
+        assert n_atoms.handle(sim, 'CA') in sim.data.keys()
+
+        # other arguments give other results
+        assert n_atoms(sim, 'CA', scale=2) == 2 * first
+        assert n_atoms(sim, 'HA') != first
+        assert len(calls) == 3
+
+        # stored results are used by new instances of the Sim
+        assert n_atoms(mds.Sim(sim.abspath), 'CA') == first
+        assert len(calls) == 3
+
+    def test_selection_changed(self, sim):
+        first = n_atoms(sim, 'CA')
+        sim.atomselections['CA'] = 'name CA', 'name HA'
+        assert n_atoms(sim, 'CA') > first
+        assert len(calls) == 2
+
+        sim.atomselections['CA'] = 'name CA'
+        assert n_atoms(sim, 'CA') == first
+        assert len(calls) == 2
+
+    def test_universe_changed(self, sim):
+        assert n_frames(sim) == 10
+        assert n_frames(sim) == 10
+        sim.universedef.define(PDB)
+        assert n_frames(sim) == 1
+        assert len(calls) == 2
+
+    def test_files_changed(self, sim, tmpdir):
+        with tmpdir.as_cwd():
+            with open(GRO, 'rb') as f, open('copy.gro', 'wb') as g:
+                g.write(f.read())
+            sim.universedef.define('copy.gro')
+
+            n_frames(sim)
+            n_frames(sim)
+            assert len(calls) == 1
+
+            stat = os.stat('copy.gro')
+            os.utime('copy.gro', (stat.st_atime, stat.st_mtime + 10))
+            n_frames(sim)
+            assert len(calls) == 2
+
+    def test_version(self, sim):
+        def count(sim):
+            calls.append(None)
+            return 1
+
+        memoize(count)(sim)
+        memoize(count)(sim)
+        assert len(calls) == 1
+
+        memoize(version=2)(count)(sim)
+        assert len(calls) == 2
+
+        def count(sim):
+            calls.append(None)
+            return 2
+
+        assert memoize(count)(sim) == 2
+        assert len(calls) == 3
+
+    def test_clear(self, sim):
+        n_atoms(sim, 'CA')
+        n_atoms(sim, 'HA')
+        n_frames(sim)
+
+        n_atoms.clear(sim)
+        assert sim.data.keys() == [n_frames.handle(sim)]
+
+        n_atoms(sim, 'CA')
+        assert len(calls) == 4
+
+    def test_immutable(self, sim):
+        immutable = mds.Sim(sim.abspath, immutable=True)
+        assert n_frames(immutable) == 10
+        assert n_frames(immutable) == 10
+        assert len(calls) == 2
+        assert immutable.data.keys() == []
+
+    def test_pickle(self, sim):
+        assert pickle.loads(pickle.dumps(n_atoms)) is n_atoms
+
+        results = mds.Bundle(sim).map(n_atoms, processes=2, selection='CA')
+        assert results == [n_atoms(sim, 'CA')]
+        assert calls == []
+
+    def test_handle_canonical(self, sim):
+        assert (n_atoms.handle(sim, 'CA', scale={'b': 1, 'a': 2}) ==
+                n_atoms.handle(sim, 'CA', scale={'a': 2, 'b': 1}))
+        assert (n_atoms.handle(sim, 'CA', scale={'b': 1, 'a': 2}) !=
+                n_atoms.handle(sim, 'CA', scale={'a': 1, 'b': 2}))
+
+    def test_handle_hashseed(self, sim):
+        # handles must not depend on the hash seed of the interpreter, or
+        # results would never be found again in later sessions
+        script = (
+            "import sys\n"
+            "import mdsynthesis as mds\n"
+            "from mdsynthesis.analysis import memoize\n"
+            "@memoize\n"
+            "def residues(sim, names, weights):\n"
+            "    return [n for n in names if n in {'ALA', 'GLY', 'SER'}]\n"
+            "sim = mds.Sim(sys.argv[1])\n"
+            "print(residues.handle(sim, {'ALA', 'GLY', 'LYS', 'SER'},\n"
+            "                      {'b': frozenset(['x', 'y', 'z'])}))\n")
+
+        handles = set()
+        for seed in ('1', '2', '3'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            out = subprocess.check_output(
+                [sys.executable, '-c', script, sim.abspath], env=env)
+            handles.add(out.strip())
+        assert len(handles) == 1
+
+
+@incremental(selections=['selection'])
+def mean_x(sim, start, stop, selection='CA'):
+    import pandas as pd
+
+    calls.append((start, stop))
+    atoms = sim.atomselections.create(selection)
+    return pd.DataFrame(
+        {'x': [atoms.positions[:, 0].mean()
+               for ts in sim.universe.trajectory[start:stop]]},
+        index=range(start, stop))
+
+
+class TestIncremental:
+    """Test analyses of Sims extended as trajectories grow"""
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        del calls[:]
+        with tmpdir.as_cwd():
+            s = mds.Sim('testsim')
+            s.universedef.define(GRO, XTC)
+            s.atomselections['CA'] = 'name CA'
+        return s
+
+    @pytest.fixture
+    def parts(self, tmpdir):
+        """Trajectory split in two parts, of 4 and 6 frames"""
+        import MDAnalysis as mda
+
+        u = mda.Universe(GRO, XTC)
+        paths = [str(tmpdir.join('part{}.xtc'.format(i))) for i in range(2)]
+        for path, frames in zip(paths, (slice(0, 4), slice(4, None))):
+            with mda.Writer(path, u.atoms.n_atoms) as w:
+                for ts in u.trajectory[frames]:
+                    w.write(u.atoms)
+        return paths
+
+    def test_incremental(self, sim):
+        assert isinstance(mean_x, Incremental)
+        assert mean_x.frames(sim) == (0, 10)
+
+        result = mean_x(sim)
+        assert list(result.index) == list(range(10))
+        assert mean_x.frames(sim) == (10, 10)
+
+        assert mean_x(sim).equals(result)
+        assert calls == [(0, 10)]
+
+    def test_segments_added(self, sim, parts):
+        sim.universedef.define(GRO, parts[:1])
+        assert len(mean_x(sim)) == 4
+
+        sim.universedef.define(GRO, parts)
+        assert mean_x.frames(sim) == (4, 10)
+        result = mean_x(sim)
+        assert calls == [(0, 4), (4, 10)]
+
+        sim.universedef.define(GRO, XTC)
+        full = mean_x(sim)
+        np.testing.assert_allclose(result['x'], full['x'], rtol=1e-5)
+        assert list(result.index) == list(full.index)
+
+    def test_segment_extended(self, sim, parts, tmpdir):
+        path = str(tmpdir.join('growing.xtc'))
+        with open(parts[0], 'rb') as f, open(path, 'wb') as g:
+            g.write(f.read())
+
+        sim.universedef.define(GRO, path)
+        mean_x(sim)
+
+        # xtc files can be extended by appending frames
+        with open(parts[1], 'rb') as f, open(path, 'ab') as g:
+            g.write(f.read())
+
+        sim = mds.Sim(sim.abspath)
+        assert mean_x.frames(sim) == (4, 10)
+        assert len(mean_x(sim)) == 10
+        assert calls == [(0, 4), (4, 10)]
+
+    def test_segments_changed(self, sim, parts):
+        sim.universedef.define(GRO, parts)
+        mean_x(sim)
+
+        sim.universedef.define(GRO, parts[::-1])
+        assert mean_x.frames(sim) == (0, 10)
+
+    def test_dataset_changed(self, sim):
+        mean_x(sim)
+        sim.data.append(mean_x.handle(sim), mean_x.func(sim, 0, 1))
+        assert mean_x.frames(sim) == (0, 10)
+        assert len(mean_x(sim)) == 10
+
+    def test_clear(self, sim):
+        mean_x(sim)
+        mean_x.clear(sim)
+        assert sim.data.keys() == []
+        assert mean_x.frames(sim) == (0, 10)
+
+    def test_remove(self, sim):
+        # the record goes with the dataset, however it is removed
+        handle = mean_x.handle(sim)
+        mean_x(sim)
+        sim.data.remove(handle)
+
+        assert not os.path.exists(os.path.join(sim.abspath, MEMOIZED_HANDLE))
+        assert mean_x.frames(sim) == (0, 10)
+
+    def test_move(self, sim, tmpdir):
+        handle = mean_x.handle(sim)
+        mean_x(sim)
+
+        with tmpdir.as_cwd():
+            other = mds.Sim('other')
+        sim.data.move_to(other, handle)
+        assert not os.path.exists(os.path.join(sim.abspath, MEMOIZED_HANDLE))
+        assert other.data.keys() == [handle]
@@ -0,0 +1,197 @@
+"""Benchmarks guarding against performance regressions.
+
+Timings are compared against baselines measured in the same session, with
+generous margins, so that they hold on slow or busy machines.
+
+"""
+import os
+import sys
+import subprocess
+import timeit
+
+import numpy as np
+import pandas as pd
+import pytest
+import h5py
+from six.moves import cPickle as pickle
+
+import mdsynthesis as mds
+
+
+def best_time(func, repeat=5):
+    """Best wall time of several calls to `func`"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+class TestAddThroughput:
+    """Atomic replacement of datasets should cost no more than writing in
+    place.
+
+    """
+    handle = 'bench'
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        with tmpdir.as_cwd():
+            s = mds.Sim('benchsim')
+        return s
+
+    def test_add_numpy(self, sim, tmpdir):
+        data = np.random.rand(2000, 1000)
+        path = tmpdir.join('direct.h5').strpath
+
+        def direct():
+            with h5py.File(path, 'w') as f:
+                f.create_dataset('main', data=data)
+
+        def add():
+            sim.data.add(self.handle, data)
+
+        assert best_time(add) < 1.5 * best_time(direct) + 0.05
+
+    def test_add_python(self, sim, tmpdir):
+        data = [list(range(1000)) for i in range(1000)]
+        path = tmpdir.join('direct.pkl').strpath
+
+        def direct():
+            with open(path, 'wb+') as f:
+                pickle.dump(data, f, 2)
+
+        def add():
+            sim.data.add(self.handle, data)
+
+        assert best_time(add) < 1.5 * best_time(direct) + 0.05
+
+    def test_add_pandas(self, sim, tmpdir):
+        data = pd.DataFrame(np.random.rand(100000, 3),
+                            columns=('A', 'B', 'C'))
+        path = tmpdir.join('direct.h5').strpath
+
+        def direct():
+            store = pd.HDFStore(path, 'a')
+            store.put('main', data, format='table', data_columns=True,
+                      complevel=5, complib='blosc')
+            store.close()
+
+        def add():
+            sim.data.add(self.handle, data)
+
+        assert best_time(add) < 1.5 * best_time(direct) + 0.05
+
+
+class TestImmutableRetrieval:
+    """Reading from immutable Sims should be faster than from regular ones,
+    since no locks are taken and state files are cached.
+
+    """
+    nsims = 1000
+
+    @pytest.fixture(scope='class')
+    def paths(self, tmpdir_factory):
+        with tmpdir_factory.mktemp('sims').as_cwd():
+            sims = [mds.Sim('sim{}'.format(i)) for i in range(self.nsims)]
+            for sim in sims:
+                sim.data['names'] = ['inky', 'blinky']
+                sim.atomselections['backbone'] = 'name N CA C O'
+        return [sim.abspath for sim in sims]
+
+    @staticmethod
+    def latency(sims):
+        def retrieve():
+            for sim in sims:
+                sim.data['names']
+                sim.atomselections['backbone']
+
+        # the best of several runs, to absorb noise from other load
+        return best_time(retrieve, repeat=7)
+
+    def test_retrieve(self, paths):
+        sims = [mds.Sim(path) for path in paths]
+        immutables = [mds.Sim(path, immutable=True) for path in paths]
+
+        assert self.latency(immutables) < self.latency(sims)
+
+    def test_discover(self, paths):
+        top = os.path.dirname(os.path.normpath(paths[0]))
+        sims = mds.discover(top)
+        immutables = mds.discover(top, immutable=True)
+
+        assert len(immutables) == self.nsims
+        assert self.latency(immutables) < self.latency(sims)
+
+
+class TestFieldProjection:
+    """Retrieving a few fields of a structured array should take memory and
+    time in proportion to those fields, not to the whole array.
+
+    """
+    handle = 'records'
+    nfields = 20
+    nrows = 100000
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        dtype = [('f{}'.format(i), 'f8') for i in range(self.nfields)]
+        data = np.zeros(self.nrows, dtype=dtype)
+        with tmpdir.as_cwd():
+            s = mds.Sim('benchsim')
+        s.data.add(self.handle, data)
+        return s
+
+    @staticmethod
+    def peak_memory(func):
+        """Peak memory allocated by a call to `func`, in bytes"""
+        tracemalloc = pytest.importorskip('tracemalloc')
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_memory(self, sim):
+        def full():
+            sim.data.retrieve(self.handle)[['f0', 'f1']]
+
+        def projected():
+            sim.data.retrieve(self.handle, columns=['f0', 'f1'])
+
+        # two fields of twenty; allow for overheads
+        assert self.peak_memory(projected) < 0.25 * self.peak_memory(full)
+
+    def test_time(self, sim):
+        def full():
+            sim.data.retrieve(self.handle)[['f0', 'f1']]
+
+        def projected():
+            sim.data.retrieve(self.handle, columns=['f0', 'f1'])
+
+        assert best_time(projected) < 1.5 * best_time(full) + 0.05
+
+
+class TestImport:
+    """Importing mdsynthesis should not pull in the scientific stack; it
+    should be loaded on first use instead.
+
+    """
+    heavy = ('MDAnalysis', 'pandas', 'numpy', 'h5py', 'tables')
+
+    @staticmethod
+    def run(code):
+        return subprocess.check_output([sys.executable, '-c', code])
+
+    def test_import_leaves_heavy_modules(self):
+        code = ("import sys, mdsynthesis; "
+                "print(','.join(m for m in {!r} "
+                "if m in sys.modules))".format(self.heavy))
+
+        assert self.run(code).decode().strip() == ''
+
+    def test_import_time(self):
+        def baseline():
+            self.run('import datreant')
+
+        def imp():
+            self.run('import mdsynthesis')
+
+        assert best_time(imp) < best_time(baseline) + 0.5
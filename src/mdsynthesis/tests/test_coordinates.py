@@ -0,0 +1,136 @@
+"""Tests for local coordinate caches.
+
+"""
+import os
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+import mdsynthesis as mds
+
+import MDAnalysis as mda
+from MDAnalysisTests.datafiles import GRO, XTC
+
+
+def _add(args):
+    path, stop = args
+    return mds.Sim(path).coordinates.add(stop=stop)
+
+
+class TestCoordinates:
+    """Test caching coordinates of atom selections"""
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        with tmpdir.as_cwd():
+            s = mds.Sim('testsim')
+            s.universedef.define(GRO, XTC)
+            s.atomselections['CA'] = 'name CA'
+        return s
+
+    def test_add(self, sim):
+        assert sim.coordinates.keys() == []
+        assert sim.coordinates.add('CA') == sim.universe.trajectory.n_frames
+        assert sim.coordinates.keys() == ['CA']
+        assert 'CA' in sim.coordinates
+
+        info = sim.coordinates.info('CA')
+        assert info['selection'] == 'CA'
+        assert info['n_atoms'] == len(sim.atomselections.create('CA'))
+
+    def test_get(self, sim):
+        sim.coordinates.add('CA', step=3)
+        ca = sim.atomselections.create('CA')
+
+        positions = sim.coordinates.get('CA')
+        assert isinstance(positions, np.memmap)
+        assert positions.shape == (4, len(ca), 3)
+
+        sim.universe.trajectory[6]
+        np.testing.assert_allclose(positions[2], ca.positions)
+        np.testing.assert_allclose(sim.coordinates.get('CA', 'dimensions')[2],
+                                   sim.universe.dimensions)
+        assert sim.coordinates.get('CA', 'time')[2] == pytest.approx(
+            sim.universe.trajectory.time)
+        np.testing.assert_equal(sim.coordinates.get('CA', 'indices'),
+                                ca.indices)
+
+        with pytest.raises(ValueError):
+            sim.coordinates.get('CA', 'velocities')
+
+    def test_universe(self, sim):
+        sim.coordinates.add('CA')
+        ca = sim.atomselections.create('CA')
+        reduced = sim.coordinates.universe('CA')
+
+        assert isinstance(reduced, mda.Universe)
+        assert isinstance(reduced.trajectory.coordinate_array, np.memmap)
+        assert reduced.trajectory.n_frames == sim.universe.trajectory.n_frames
+        np.testing.assert_equal(reduced.atoms.names, ca.names)
+
+        for ts in sim.universe.trajectory[::-3]:
+            reduced.trajectory[ts.frame]
+            np.testing.assert_allclose(reduced.atoms.positions, ca.positions)
+
+    def test_universe_time(self, sim):
+        # times of a cache not starting at the first frame are kept
+        sim.coordinates.add('CA', start=2, step=3)
+        time = sim.coordinates.get('CA', 'time')
+        reduced = sim.coordinates.universe('CA')
+
+        assert time[0] > 0
+        for i, ts in enumerate(reduced.trajectory):
+            assert ts.time == time[i]
+        assert reduced.trajectory[1].time == pytest.approx(
+            sim.universe.trajectory[5].time)
+
+    def test_add_concurrent(self, sim):
+        pool = mp.Pool(4)
+        try:
+            n_frames = pool.map(_add, [(sim.abspath, stop % 10 + 1)
+                                       for stop in range(16)], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        assert n_frames == [stop % 10 + 1 for stop in range(16)]
+        assert len(sim.coordinates.get('all')) in n_frames
+        assert sim.coordinates.keys() == ['all']
+        assert not [f for f in os.listdir(sim.coordinates._path)
+                    if f.startswith('.')]
+
+    def test_all_atoms(self, sim):
+        sim.coordinates.add(stop=2)
+        assert sim.coordinates.get('all').shape == (2, len(sim.universe.atoms),
+                                                    3)
+
+    def test_replace(self, sim):
+        sim.coordinates.add('CA')
+        positions = sim.coordinates.get('CA')
+
+        sim.coordinates.add('CA', stop=2)
+        assert len(sim.coordinates.get('CA')) == 2
+
+        # existing memory maps are unaffected
+        assert len(positions) == sim.universe.trajectory.n_frames
+        assert not [f for f in os.listdir(sim.coordinates._path)
+                    if f.startswith('.')]
+
+    def test_remove(self, sim):
+        sim.coordinates.add('CA', name='ca')
+        del sim.coordinates['ca']
+
+        assert sim.coordinates.keys() == []
+        with pytest.raises(KeyError):
+            sim.coordinates.get('ca')
+
+    def test_immutable(self, sim):
+        sim.coordinates.add('CA')
+        sim = mds.Sim(sim.abspath, immutable=True)
+
+        assert len(sim.coordinates.universe('CA').trajectory) == 10
+        with pytest.raises(OSError):
+            sim.coordinates.add('CA')
+        with pytest.raises(OSError):
+            sim.coordinates.remove('CA')
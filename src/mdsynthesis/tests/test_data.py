@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 import pytest
+import json
 import os
+import threading
 import py
 
 import mdsynthesis as mds
@@ -56,9 +58,35 @@ class TestTreant:
                 np.testing.assert_equal(treant.data[self.handle],
                                         datastruct)
 
+            def test_overwrite_leaves_no_buffer(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                treant.data.add(self.handle, datastruct)
+
+                files = os.listdir(os.path.join(treant.abspath, self.handle))
+                assert not [f for f in files if f.endswith('.buffer')]
+
+            def test_failed_add_keeps_data(self, treant, datastruct):
+                """A failed overwrite should leave the dataset untouched"""
+                treant.data.add(self.handle, datastruct)
+
+                with pytest.raises(Exception):
+                    treant.data.add(self.handle, self.unstorable)
+
+                self.test_retrieve_data(treant, datastruct)
+
+            def test_info(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                info = treant.data.info(self.handle)
+
+                assert info['type'] == self.datafile
+                assert info['size'] == os.path.getsize(
+                    os.path.join(treant.abspath, self.handle, self.datafile))
+                assert treant.data.describe() == {self.handle: info}
+
         class PandasMixin(DataMixin):
             """Mixin class for pandas tests"""
             datafile = mds.persistent_dict.pddata.pddatafile
+            unstorable = pd.DataFrame({'A': [[1], [2, 3]]})
 
             def test_retrieve_data(self, treant, datastruct):
                 treant.data.add(self.handle, datastruct)
@@ -69,6 +97,18 @@ class TestTreant:
                         treant.data[self.handle].values,
                         datastruct.values)
 
+            def test_info(self, treant, datastruct):
+                super(TestTreant.TestData.PandasMixin, self).test_info(
+                    treant, datastruct)
+                info = treant.data.info(self.handle)
+
+                assert info['nrows'] == len(datastruct)
+                if isinstance(datastruct, pd.DataFrame):
+                    assert info['columns'] == list(datastruct.columns)
+
+                # serializable, as for other datasets
+                json.dumps(info)
+
         # TODO
         class AppendablesMixin:
             """Mixin class for pandas objects that we expect should append"""
@@ -105,9 +145,175 @@ class TestTreant:
         class Test_Panel4D(data.Panel4D, PandasMixin):
             pass
 
+        class TestSegments:
+            """Test appending rows to pandas datasets as segments"""
+            handle = 'testdata'
+
+            @pytest.fixture
+            def datastruct(self):
+                data = np.random.rand(100, 3)
+                return pd.DataFrame(data, columns=('A', 'B', 'C'))
+
+            @pytest.fixture
+            def segmented(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                for i in range(2):
+                    treant.data.append(self.handle, datastruct, segment=True)
+                return pd.concat([datastruct]*3)
+
+            def test_retrieve_segments(self, treant, segmented):
+                stored = treant.data.retrieve(self.handle)
+                np.testing.assert_equal(stored.values, segmented.values)
+
+            def test_retrieve_segments_rows(self, treant, segmented):
+                stored = treant.data.retrieve(self.handle, start=50, stop=250)
+                np.testing.assert_equal(stored.values,
+                                        segmented.iloc[50:250].values)
+
+                stored = treant.data.retrieve(self.handle, start=-30)
+                np.testing.assert_equal(stored.values,
+                                        segmented.iloc[-30:].values)
+
+            def test_retrieve_segments_where(self, treant, segmented):
+                stored = treant.data.retrieve(self.handle, where='A > .5',
+                                              columns=['A', 'C'])
+                equiv = segmented[segmented['A'] > .5][['A', 'C']]
+                np.testing.assert_equal(stored.values, equiv.values)
+
+            def test_compact(self, treant, segmented):
+                assert treant.data.compact(self.handle) == 2
+                assert treant.data.compact(self.handle) == 0
+
+                stored = treant.data.retrieve(self.handle)
+                np.testing.assert_equal(stored.values, segmented.values)
+
+            def segments(self, treant):
+                directory = os.path.join(treant.abspath, self.handle)
+                return [f for f in os.listdir(directory)
+                        if f.endswith('.segment')]
+
+            def test_compact_interrupted(self, treant, segmented,
+                                         monkeypatch):
+                # as if the process died after committing the merged data,
+                # before removing the segments
+                pdDataFile = mds.persistent_dict.pddata.pdDataFile
+                monkeypatch.setattr(pdDataFile, '_remove_merged',
+                                    lambda self: None)
+                assert treant.data.compact(self.handle) == 2
+                assert len(self.segments(treant)) == 2
+
+                stored = treant.data.retrieve(self.handle)
+                np.testing.assert_equal(stored.values, segmented.values)
+                assert treant.data.info(self.handle)['nrows'] == 300
+                assert treant.data.compact(self.handle) == 0
+
+                monkeypatch.undo()
+                treant.data.append(self.handle, segmented.iloc[:10],
+                                   segment=True)
+                assert treant.data.compact(self.handle) == 1
+                assert self.segments(treant) == []
+
+                stored = treant.data.retrieve(self.handle)
+                np.testing.assert_equal(stored.values,
+                                        segmented.iloc[list(range(300)) +
+                                                       list(range(10))].values)
+
+            def test_add_interrupted(self, treant, segmented, datastruct,
+                                     monkeypatch):
+                pdDataFile = mds.persistent_dict.pddata.pdDataFile
+                monkeypatch.setattr(pdDataFile, '_remove_merged',
+                                    lambda self: None)
+                treant.data.add(self.handle, datastruct)
+                assert len(self.segments(treant)) == 2
+                assert len(treant.data.retrieve(self.handle)) == 100
+
+                monkeypatch.undo()
+                treant.data.compact(self.handle)
+                assert self.segments(treant) == []
+                assert len(treant.data.retrieve(self.handle)) == 100
+
+            def test_add_concurrent_segment(self, treant, segmented,
+                                            datastruct, monkeypatch):
+                # a segment appended while the data is being replaced is
+                # committed only after it, so it is appended to the new data
+                pdDataFile = mds.persistent_dict.pddata.pdDataFile
+                listed = pdDataFile._segments
+                appender = list()
+                committed = list()
+
+                def segments(self):
+                    out = listed(self)
+                    if not appender:
+                        appender.append(threading.Thread(
+                            target=treant.data.append,
+                            args=(TestTreant.TestData.TestSegments.handle,
+                                  datastruct.iloc[:10]),
+                            kwargs={'segment': True}))
+                        appender[0].start()
+                        appender[0].join(0.5)
+                        committed.append(len(listed(self)) > len(out))
+                    return out
+
+                monkeypatch.setattr(pdDataFile, '_segments', segments)
+                treant.data.add(self.handle, datastruct)
+                appender[0].join()
+                monkeypatch.undo()
+
+                assert committed == [False]
+                stored = treant.data.retrieve(self.handle)
+                np.testing.assert_equal(
+                    stored.values,
+                    pd.concat([datastruct, datastruct.iloc[:10]]).values)
+
+            def test_info_segments(self, treant, segmented):
+                info = treant.data.info(self.handle)
+                assert info['nrows'] == len(segmented)
+                assert info['size'] > os.path.getsize(
+                    os.path.join(treant.abspath, self.handle,
+                                 mds.persistent_dict.pddata.pddatafile))
+
+            def test_add_discards_segments(self, treant, segmented,
+                                           datastruct):
+                treant.data.add(self.handle, datastruct)
+                assert len(treant.data.retrieve(self.handle)) == 100
+                assert self.segments(treant) == []
+
+            def test_remove_rows_with_segments(self, treant, segmented):
+                treant.data.remove(self.handle, start=0, stop=150)
+                stored = treant.data.retrieve(self.handle)
+                np.testing.assert_equal(stored.values,
+                                        segmented.iloc[150:].values)
+
+            def test_remove_with_segments(self, treant, segmented):
+                treant.data.remove(self.handle)
+                assert not os.path.exists(os.path.join(treant.abspath,
+                                                       self.handle))
+
+            def test_append_invalid_segment(self, treant, segmented):
+                with pytest.raises(TypeError):
+                    treant.data.append(self.handle, {'A': [1.0]},
+                                       segment=True)
+
+                # only Series and DataFrames can be segments
+                datafile = mds.persistent_dict.pddata.pdDataFile(
+                    os.path.join(treant.abspath, self.handle,
+                                 mds.persistent_dict.pddata.pddatafile))
+                with pytest.raises(TypeError):
+                    datafile.append_segment('main', np.random.rand(10, 3))
+                assert len(self.segments(treant)) == 2
+
         class NumpyMixin(DataMixin):
             """Test numpy datastructure storage and retrieval"""
             datafile = mds.persistent_dict.npdata.npdatafile
+            unstorable = np.array([{}, []], dtype=object)
+
+            def test_info(self, treant, datastruct):
+                super(TestTreant.TestData.NumpyMixin, self).test_info(
+                    treant, datastruct)
+                info = treant.data.info(self.handle)
+
+                assert info['shape'] == datastruct.shape
+                assert info['dtype'] == str(datastruct.dtype)
 
         class Test_NumpyScalar(data.NumpyScalar, NumpyMixin):
             pass
@@ -130,9 +336,669 @@ class TestTreant:
         class Test_Numpy4D(data.Numpy4D, NumpyMixin):
             pass
 
+        class Test_NumpyStructured(data.NumpyStructured, NumpyMixin):
+
+            def test_retrieve_columns(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                out = treant.data.retrieve(self.handle,
+                                           columns=['rmsd', 'com'])
+
+                assert out.dtype.names == ('rmsd', 'com')
+                np.testing.assert_equal(out['rmsd'], datastruct['rmsd'])
+                np.testing.assert_equal(out['com'], datastruct['com'])
+
+            def test_retrieve_columns_rows(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                out = treant.data.retrieve(self.handle, columns=['time'],
+                                           start=-100)
+
+                assert out.dtype.names == ('time',)
+                np.testing.assert_equal(out['time'],
+                                        datastruct['time'][-100:])
+                assert len(treant.data.retrieve(
+                    self.handle, columns=['time'], start=10, stop=5)) == 0
+
+            def test_retrieve_columns_sharded(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct, shard_rows=300)
+                out = treant.data.retrieve(self.handle,
+                                           columns=['frame', 'label'],
+                                           start=250, stop=650)
+
+                np.testing.assert_equal(
+                    out, datastruct[['frame', 'label']][250:650].astype(
+                        out.dtype))
+
+            def test_retrieve_columns_invalid(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                with pytest.raises(KeyError):
+                    treant.data.retrieve(self.handle, columns=['energy'])
+
+                treant.data.add(self.handle, np.random.rand(10, 3))
+                with pytest.raises(TypeError):
+                    treant.data.retrieve(self.handle, columns=['rmsd'])
+
+        class TestRegions:
+            """Test preallocated numpy arrays written by region"""
+            handle = 'testdata'
+
+            def test_create(self, treant):
+                treant.data.create(self.handle, (10, 3), 'float32',
+                                   chunks=(5, 3))
+                info = treant.data.info(self.handle)
+
+                assert info['shape'] == (10, 3)
+                assert info['dtype'] == 'float32'
+                assert info['chunks'] == (5, 3)
+                np.testing.assert_equal(treant.data[self.handle],
+                                        np.zeros((10, 3)))
+
+            def test_write_region(self, treant):
+                treant.data.create(self.handle, (10, 3), 'float64',
+                                   fillvalue=np.nan)
+                treant.data.write_region(self.handle, slice(2, 4), 1)
+                treant.data.write_region(self.handle,
+                                         (slice(6, None), 1), [2, 3, 4, 5])
+
+                expected = np.full((10, 3), np.nan)
+                expected[2:4] = 1
+                expected[6:, 1] = [2, 3, 4, 5]
+                np.testing.assert_equal(treant.data[self.handle], expected)
+
+            def test_write_region_invalid(self, treant):
+                with pytest.raises(KeyError):
+                    treant.data.write_region(self.handle, 0, 1)
+
+                treant.data[self.handle] = [1, 2, 3]
+                with pytest.raises(TypeError):
+                    treant.data.write_region(self.handle, 0, 1)
+
+        class TestLossy:
+            """Test numpy arrays stored with reduced precision"""
+            handle = 'testdata'
+
+            @pytest.fixture
+            def datastruct(self):
+                # smooth, like coordinates along a trajectory
+                return np.cumsum(np.random.randn(200, 50, 3), axis=0) + 50
+
+            def test_precision(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct, precision=3)
+                out = treant.data[self.handle]
+
+                assert out.dtype == datastruct.dtype
+                np.testing.assert_allclose(out, datastruct, rtol=0,
+                                           atol=5e-4 + 1e-9)
+                assert (treant.data.info(self.handle)['size'] <
+                        datastruct.nbytes / 3)
+
+            @pytest.mark.parametrize('precision', (1, 2, 3))
+            @pytest.mark.parametrize('dtype', ('float64', 'float32'))
+            @pytest.mark.parametrize('shard_rows', (None, 30000))
+            def test_precision_bound(self, treant, precision, dtype,
+                                     shard_rows):
+                # noisy and negative, unlike coordinates
+                array = np.random.uniform(-100, 0, (100000, 3)).astype(dtype)
+                treant.data.add(self.handle, array, precision=precision,
+                                shard_rows=shard_rows)
+                out = treant.data[self.handle]
+
+                assert out.dtype == array.dtype
+                error = np.abs(out.astype('float64') - array.astype('float64'))
+                # rounding, up to the precision of the dtype
+                assert error.max() <= 0.5 * 10**-precision + 1e-5
+
+            @pytest.mark.parametrize('downcast', ('float32', 'float16'))
+            def test_downcast(self, treant, datastruct, downcast):
+                treant.data.add(self.handle, datastruct, downcast=downcast)
+                out = treant.data[self.handle]
+
+                assert out.dtype == datastruct.dtype
+                np.testing.assert_equal(
+                    out, datastruct.astype(downcast).astype(datastruct.dtype))
+
+            def test_partial(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct, precision=2,
+                                downcast='float32')
+                expected = treant.data[self.handle]
+
+                np.testing.assert_equal(
+                    treant.data.retrieve(self.handle, start=20, stop=40),
+                    expected[20:40])
+
+                treant.data.add(self.handle, datastruct, precision=2,
+                                downcast='float32', shard_rows=64)
+                # values are rounded relative to an offset for each chunk
+                np.testing.assert_allclose(
+                    treant.data.retrieve(self.handle, start=20, stop=140),
+                    datastruct[20:140], rtol=0, atol=5e-3 + 1e-5)
+
+            def test_info(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct, downcast='float32')
+                info = treant.data.info(self.handle)
+
+                assert info['dtype'] == 'float64'
+                assert info['stored_dtype'] == 'float32'
+                assert info['precision'] is None
+                assert info['compression'] == 'gzip'
+
+                treant.data.add(self.handle, datastruct)
+                info = treant.data.info(self.handle)
+                assert info['stored_dtype'] is None
+
+            def test_invalid(self, treant, datastruct):
+                with pytest.raises(TypeError):
+                    treant.data.add(self.handle, np.arange(10), precision=3)
+                with pytest.raises(TypeError):
+                    treant.data.add(self.handle, datastruct, downcast='int16')
+                with pytest.raises(TypeError):
+                    treant.data.add(self.handle, [1.0, 2.0], precision=3)
+                with pytest.raises(ValueError):
+                    treant.data.add(self.handle, np.array(1.0),
+                                    precision=3)
+
+                for shard_rows in (None, 50):
+                    with pytest.raises(ValueError):
+                        treant.data.add(self.handle, datastruct, precision=2,
+                                        downcast='float16',
+                                        shard_rows=shard_rows)
+                assert self.handle not in treant.data
+
+        class TestRepack:
+            """Test reclaiming free space in datafiles"""
+            handle = 'testdata'
+
+            def test_pandas(self, treant):
+                df = pd.DataFrame(np.random.rand(20000, 4),
+                                  columns=('A', 'B', 'C', 'D'))
+                treant.data.add(self.handle, df)
+                treant.data.remove(self.handle, start=0, stop=19000)
+                size = treant.data.info(self.handle)['size']
+
+                recovered = treant.data.repack(self.handle)
+                assert recovered > 0
+                assert (treant.data.info(self.handle)['size'] ==
+                        size - recovered)
+                pd.testing.assert_frame_equal(treant.data[self.handle],
+                                              df[19000:])
+
+            def test_numpy(self, treant):
+                treant.data.create(self.handle, (100, 100), 'float64',
+                                   chunks=(10, 100))
+                treant.data.repack(self.handle, complevel=4)
+                assert (treant.data.info(self.handle)['compression'] ==
+                        'gzip')
+
+                # compressed chunks written over are moved, leaving holes
+                for i in range(3):
+                    array = np.random.rand(100, 100)
+                    treant.data.write_region(self.handle, slice(None), array)
+
+                assert treant.data.repack(self.handle) > 0
+                np.testing.assert_equal(treant.data[self.handle], array)
+                info = treant.data.info(self.handle)
+                assert info['compression'] == 'gzip'
+                assert info['chunks'] == (10, 100)
+
+                size = info['size']
+                assert treant.data.repack(self.handle, complevel=0) == 0
+                info = treant.data.info(self.handle)
+                assert info['compression'] is None
+                assert info['size'] > size
+                np.testing.assert_equal(treant.data[self.handle], array)
+
+            def test_sparse_empty(self, treant):
+                sp = pytest.importorskip('scipy.sparse')
+                treant.data.add(self.handle, sp.csr_matrix((10, 10)))
+
+                assert treant.data.repack(self.handle) == 0
+                assert treant.data[self.handle].shape == (10, 10)
+                assert treant.data[self.handle].nnz == 0
+
+            def test_lossy(self, treant):
+                array = np.random.rand(100, 3) * 10
+                treant.data.add(self.handle, array, precision=2,
+                                downcast='float32')
+                expected = treant.data[self.handle]
+
+                treant.data.repack(self.handle, complib='lzf')
+                info = treant.data.info(self.handle)
+                assert info['compression'] == 'lzf'
+                assert info['precision'] == 2
+                np.testing.assert_equal(treant.data[self.handle], expected)
+
+            def test_repack_all(self, treant):
+                treant.data['array'] = np.random.rand(10, 3)
+                treant.data['frame'] = pd.DataFrame(np.random.rand(10, 3))
+                treant.data.add('sharded', np.random.rand(10, 3),
+                                shard_rows=4)
+                treant.data['list'] = [1, 2, 3]
+
+                recovered = treant.data.repack_all()
+                assert sorted(recovered) == ['array', 'frame', 'list',
+                                             'sharded']
+                assert recovered['list'] == 0
+                assert treant.data['list'] == [1, 2, 3]
+
+            def test_readonly(self, treant):
+                treant.data[self.handle] = np.random.rand(10, 3)
+                data = mds.Sim(treant.abspath, immutable=True).data
+
+                with pytest.raises(OSError):
+                    data.repack(self.handle)
+                with pytest.raises(OSError):
+                    data.repack_all()
+
+        class TestUsage:
+            """Test disk usage of datasets"""
+
+            def test_usage(self, treant):
+                treant.data['array'] = np.random.rand(10, 3)
+                treant.data.add('sharded', np.random.rand(10, 3),
+                                shard_rows=4)
+                df = pd.DataFrame(np.random.rand(10, 3),
+                                  columns=('A', 'B', 'C'))
+                treant.data['frame/table'] = df
+                treant.data.append('frame/table', df, segment=True)
+
+                usage = treant.data.usage()
+                assert sorted(usage) == sorted(treant.data.keys())
+                for handle in usage:
+                    assert (usage[handle]['type'] ==
+                            treant.data.info(handle)['type'])
+                    assert (usage[handle]['size'] ==
+                            treant.data.info(handle)['size'])
+
+                treant.data.remove('sharded')
+                assert 'sharded' not in treant.data.usage()
+
+        class TestCopy:
+            """Test copying and moving datasets between Sims"""
+
+            @pytest.fixture
+            def other(self, tmpdir):
+                with tmpdir.as_cwd():
+                    s = mds.Sim('other')
+                return s
+
+            def test_copy(self, treant, other):
+                array = np.random.rand(100, 3)
+                treant.data.add('lossy', array, precision=2)
+                treant.data.add('sharded', array, shard_rows=30)
+                df = pd.DataFrame(np.random.rand(10, 3),
+                                  columns=('A', 'B', 'C'))
+                treant.data['frame'] = df
+                treant.data.append('frame', df, segment=True)
+                treant.data['object'] = {'a': 1}
+
+                methods = treant.data.copy_to(other, treant.data.keys())
+                assert sorted(methods) == sorted(treant.data.keys())
+                assert other.data.keys() == treant.data.keys()
+
+                # stored as they were, not written again
+                for handle in ('lossy', 'sharded', 'frame'):
+                    assert (other.data.info(handle) ==
+                            treant.data.info(handle))
+                np.testing.assert_equal(other.data['lossy'],
+                                        treant.data['lossy'])
+                np.testing.assert_equal(other.data['sharded'], array)
+                pd.testing.assert_frame_equal(other.data['frame'],
+                                              treant.data['frame'])
+                assert other.data['object'] == {'a': 1}
+
+                # copies are independent of the originals
+                treant.data.write_region('sharded', slice(0, 10), 0)
+                np.testing.assert_equal(other.data['sharded'], array)
+
+            def test_copy_replace(self, treant, other):
+                array = np.random.rand(100, 3)
+                treant.data.add('data', array, shard_rows=30)
+                other.data.add('data', np.random.rand(10, 3), shard_rows=3)
+                other.data.add('newname', [1, 2, 3])
+
+                treant.data.copy_to(other, 'data')
+                treant.data.copy_to(other, 'data', newhandle='newname')
+                for handle in ('data', 'newname'):
+                    np.testing.assert_equal(other.data[handle], array)
+                    assert other.data.info(handle)['shards'] == 4
+                    assert other.data.usage()[handle]['size'] == \
+                        treant.data.info('data')['size']
+
+            def test_copy_same(self, treant):
+                treant.data['data'] = np.random.rand(10, 3)
+                with pytest.raises(ValueError):
+                    treant.data.copy_to(treant, 'data')
+                with pytest.raises(KeyError):
+                    treant.data.copy_to(treant, 'missing')
+
+            def test_copy_readonly(self, treant, other):
+                treant.data['data'] = np.random.rand(10, 3)
+                immutable = mds.Sim(other.abspath, immutable=True)
+                with pytest.raises(OSError):
+                    treant.data.copy_to(immutable, 'data')
+
+            def test_move(self, treant, other):
+                array = np.random.rand(100, 3)
+                treant.data.add('sharded', array, shard_rows=30)
+                treant.data['array'] = array
+
+                assert treant.data.move_to(
+                    other, 'array', newhandle='moved') in ('hardlink', 'copy',
+                                                           'reflink')
+                treant.data.move_to(other, ['sharded'])
+                assert treant.data.keys() == []
+                assert other.data.keys() == ['moved', 'sharded']
+                np.testing.assert_equal(other.data['moved'], array)
+                np.testing.assert_equal(other.data['sharded'], array)
+
+        class TestShards:
+            """Test numpy arrays stored in shards"""
+            handle = 'testdata'
+
+            @pytest.fixture
+            def datastruct(self):
+                return np.random.rand(105, 4, 3)
+
+            def shards(self, treant):
+                directory = os.path.join(treant.abspath, self.handle)
+                return [f for f in os.listdir(directory)
+                        if f.endswith('.shard')]
+
+            def test_add(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct, shard_rows=10)
+
+                assert len(self.shards(treant)) == 11
+                np.testing.assert_equal(treant.data[self.handle], datastruct)
+
+                info = treant.data.info(self.handle)
+                assert info['type'] == mds.persistent_dict.shdata.shdatafile
+                assert info['shape'] == datastruct.shape
+                assert info['nrows'] == 105
+                assert info['shards'] == 11
+                assert info['nbytes'] == datastruct.nbytes
+
+            @pytest.mark.parametrize('start, stop', ((None, None), (0, 10),
+                                                     (5, 32), (-7, None),
+                                                     (50, 50), (100, 200)))
+            def test_retrieve_rows(self, treant, datastruct, start, stop):
+                treant.data.add(self.handle, datastruct, shard_rows=10)
+
+                np.testing.assert_equal(
+                    treant.data.retrieve(self.handle, start=start, stop=stop),
+                    datastruct[start:stop])
+
+            def test_replace(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                treant.data.add(self.handle, datastruct, shard_rows=50)
+                assert len(self.shards(treant)) == 3
+                np.testing.assert_equal(treant.data[self.handle], datastruct)
+
+                treant.data.add(self.handle, datastruct[:20], shard_rows=50)
+                assert len(self.shards(treant)) == 1
+                np.testing.assert_equal(treant.data[self.handle],
+                                        datastruct[:20])
+
+                treant.data.add(self.handle, datastruct)
+                assert treant.data.keys() == [self.handle]
+                np.testing.assert_equal(treant.data[self.handle], datastruct)
+                assert self.shards(treant) == []
+
+            def test_write_region(self, treant):
+                treant.data.create(self.handle, (25, 2), 'int32',
+                                   chunks=(8, 2), shard_rows=10)
+                treant.data.write_region(self.handle, slice(5, 22), 1)
+                treant.data.write_region(self.handle, (slice(8, 12), 0),
+                                         [2, 3, 4, 5])
+                treant.data.write_region(self.handle, -1, [6, 7])
+
+                expected = np.zeros((25, 2))
+                expected[5:22] = 1
+                expected[8:12, 0] = [2, 3, 4, 5]
+                expected[-1] = [6, 7]
+                np.testing.assert_equal(treant.data[self.handle], expected)
+
+                with pytest.raises(ValueError):
+                    treant.data.write_region(self.handle, slice(0, 10, 2), 1)
+
+            def test_remove(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct, shard_rows=10)
+                treant.data.remove(self.handle)
+
+                assert treant.data.keys() == []
+                assert not os.path.exists(os.path.join(treant.abspath,
+                                                       self.handle))
+
+        class TestLazy:
+            """Test retrieving datasets lazily as dask collections"""
+            handle = 'testdata'
+
+            @pytest.fixture(autouse=True)
+            def dask(self):
+                return pytest.importorskip('dask')
+
+            def test_numpy(self, treant):
+                array = np.random.rand(100, 3)
+                treant.data.create(self.handle, array.shape, array.dtype,
+                                   chunks=(30, 3))
+                treant.data.write_region(self.handle, slice(None), array)
+
+                lazy = treant.data.retrieve(self.handle, lazy=True)
+                assert lazy.chunks == ((30, 30, 30, 10), (3,))
+                np.testing.assert_equal(lazy.compute(), array)
+                np.testing.assert_allclose(lazy.sum(axis=0).compute(),
+                                           array.sum(axis=0))
+
+                lazy = treant.data.retrieve(self.handle, lazy=True,
+                                            chunks=(50, 3), start=10)
+                np.testing.assert_equal(lazy.compute(), array[10:])
+
+            def test_sharded(self, treant):
+                array = np.random.rand(105, 3)
+                treant.data.add(self.handle, array, shard_rows=20)
+
+                lazy = treant.data.retrieve(self.handle, lazy=True,
+                                            start=15, stop=70)
+                assert lazy.shape == (55, 3)
+                np.testing.assert_equal(lazy.compute(), array[15:70])
+
+            def test_pandas(self, treant):
+                df = pd.DataFrame(np.random.rand(100, 3),
+                                  columns=('A', 'B', 'C'))
+                treant.data.add(self.handle, df)
+                treant.data.append(self.handle, df, segment=True)
+
+                lazy = treant.data.retrieve(self.handle, lazy=True,
+                                            chunksize=30)
+                assert lazy.npartitions == 7
+                expected = pd.concat([df, df])
+                pd.testing.assert_frame_equal(lazy.compute(), expected)
+                assert lazy['A'].sum().compute() == pytest.approx(
+                    expected['A'].sum())
+
+                series = treant.data.retrieve(self.handle, lazy=True,
+                                              start=50, stop=150)['B']
+                pd.testing.assert_series_equal(series.compute(),
+                                               expected['B'][50:150])
+
+            def test_python(self, treant):
+                treant.data.add(self.handle, [1, 2, 3])
+                with pytest.raises(TypeError):
+                    treant.data.retrieve(self.handle, lazy=True)
+
+        class XarrayMixin(DataMixin):
+            """Test xarray datastructure storage and retrieval"""
+            datafile = mds.persistent_dict.xrdata.xrdatafile
+
+            @pytest.fixture(autouse=True)
+            def xr(self):
+                pytest.importorskip('h5netcdf')
+                return pytest.importorskip('xarray')
+
+            @property
+            def unstorable(self):
+                import xarray as xr
+                return xr.Dataset({'A': (('x',), np.array([{}, []],
+                                                          dtype=object))})
+
+            def test_retrieve_data(self, treant, datastruct):
+                import xarray as xr
+
+                treant.data.add(self.handle, datastruct)
+                xr.testing.assert_identical(
+                    treant.data.retrieve(self.handle), datastruct)
+                xr.testing.assert_identical(treant.data[self.handle],
+                                            datastruct)
+
+            def test_retrieve_selection(self, treant, datastruct, xr):
+                treant.data.add(self.handle, datastruct)
+                sel = {'frame': slice(200, 500)}
+                isel = {'residue': [1, 5, 7]}
+
+                xr.testing.assert_identical(
+                    treant.data.retrieve(self.handle, sel=sel, isel=isel),
+                    datastruct.isel(**isel).sel(**sel))
+
+            def test_retrieve_lazy(self, treant, datastruct, xr):
+                pytest.importorskip('dask')
+                treant.data.add(self.handle, datastruct)
+
+                lazy = treant.data.retrieve(self.handle, lazy=True,
+                                            sel={'frame': slice(None, 300)})
+                assert lazy.chunks
+                xr.testing.assert_identical(
+                    lazy.compute(), datastruct.sel(frame=slice(None, 300)))
+
+            def test_info(self, treant, datastruct):
+                super(TestTreant.TestData.XarrayMixin, self).test_info(
+                    treant, datastruct)
+                info = treant.data.info(self.handle)
+
+                assert info['xarray_type'] == type(datastruct).__name__
+                assert info['dims'] == dict(datastruct.sizes)
+                assert info['nbytes'] == datastruct.nbytes
+
+        class Test_XarrayDataArray(data.XarrayDataArray, XarrayMixin):
+            pass
+
+        class Test_XarrayDataset(data.XarrayDataset, XarrayMixin):
+
+            def test_retrieve_variables(self, treant, datastruct, xr):
+                treant.data.add(self.handle, datastruct)
+                xr.testing.assert_identical(
+                    treant.data.retrieve(self.handle, variables=['rmsd']),
+                    datastruct[['rmsd']])
+
+        class SparseMixin(DataMixin):
+            """Test sparse matrix storage and retrieval"""
+            datafile = mds.persistent_dict.spdata.spdatafile
+
+            @pytest.fixture(autouse=True)
+            def sp(self):
+                return pytest.importorskip('scipy.sparse')
+
+            @property
+            def unstorable(self):
+                import scipy.sparse as sp
+                matrix = sp.identity(2, format='csr')
+                matrix.data = np.array([{}, []], dtype=object)
+                return matrix
+
+            @staticmethod
+            def assert_sparse_equal(a, b):
+                assert type(a) is type(b)
+                assert a.shape == b.shape
+                np.testing.assert_array_equal(a.toarray(), b.toarray())
+
+        class Test_SparseMatrix(data.SparseMatrix, SparseMixin):
+
+            def test_retrieve_data(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                self.assert_sparse_equal(treant.data.retrieve(self.handle),
+                                         datastruct)
+                self.assert_sparse_equal(treant.data[self.handle],
+                                         datastruct)
+
+            def test_retrieve_rows(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                self.assert_sparse_equal(
+                    treant.data.retrieve(self.handle, start=100, stop=150),
+                    datastruct[100:150])
+                self.assert_sparse_equal(
+                    treant.data.retrieve(self.handle, start=-10),
+                    datastruct[-10:])
+                assert treant.data.retrieve(self.handle, start=250,
+                                            stop=200).shape == (0, 200)
+
+            def test_formats(self, treant, datastruct, sp):
+                for matrix in (datastruct.tocoo(), datastruct.tocsc(),
+                               sp.csr_array(datastruct),
+                               sp.csr_matrix(datastruct.shape)):
+                    treant.data.add(self.handle, matrix)
+                    self.assert_sparse_equal(
+                        treant.data.retrieve(self.handle), matrix)
+
+            def test_info(self, treant, datastruct):
+                super(TestTreant.TestData.Test_SparseMatrix, self).test_info(
+                    treant, datastruct)
+                info = treant.data.info(self.handle)
+
+                assert info['format'] == 'csr'
+                assert info['shape'] == datastruct.shape
+                assert info['nnz'] == datastruct.nnz
+                assert info['frames'] is None
+
+            def test_append(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                with pytest.raises(TypeError):
+                    treant.data.append(self.handle, datastruct)
+
+        class Test_SparseStack(data.SparseStack, SparseMixin):
+
+            def test_retrieve_data(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                for retrieved in (treant.data.retrieve(self.handle),
+                                  treant.data[self.handle]):
+                    assert len(retrieved) == len(datastruct)
+                    for a, b in zip(retrieved, datastruct):
+                        self.assert_sparse_equal(a, b)
+
+            def test_retrieve_frames(self, treant, datastruct):
+                treant.data.add(self.handle, datastruct)
+                retrieved = treant.data.retrieve(self.handle, start=5,
+                                                 stop=8)
+                assert len(retrieved) == 3
+                for a, b in zip(retrieved, datastruct[5:8]):
+                    self.assert_sparse_equal(a, b)
+
+            def test_mismatched_shapes(self, treant, datastruct, sp):
+                # not a stack; pickled as a list instead
+                mixed = datastruct + [sp.identity(3, format='coo')]
+                treant.data.add(self.handle, mixed)
+                assert (treant.data.info(self.handle)['type'] ==
+                        mds.persistent_dict.pydata.pydatafile)
+
+            def test_info(self, treant, datastruct):
+                super(TestTreant.TestData.Test_SparseStack, self).test_info(
+                    treant, datastruct)
+                info = treant.data.info(self.handle)
+
+                assert info['format'] == 'coo'
+                assert info['shape'] == (50, 50)
+                assert info['nnz'] == sum(m.nnz for m in datastruct)
+                assert info['frames'] == len(datastruct)
+
         class PythonMixin(DataMixin):
             """Test pandas datastructure storage and retrieval"""
             datafile = mds.persistent_dict.pydata.pydatafile
+            unstorable = ['arthur', lambda x: x]
+
+            def test_info(self, treant, datastruct):
+                super(TestTreant.TestData.PythonMixin, self).test_info(
+                    treant, datastruct)
+                info = treant.data.info(self.handle)
+
+                assert info['pytype'] == '{}.{}'.format(
+                    type(datastruct).__module__, type(datastruct).__name__)
+                assert info['length'] == len(datastruct)
 
             def test_overwrite_data(self, treant, datastruct):
                 treant.data[self.handle] = datastruct
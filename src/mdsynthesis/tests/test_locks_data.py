@@ -1,10 +1,14 @@
+import os
 import random
+import threading
 import multiprocessing as mp
 import pytest
 import numpy as np
 import pandas as pd
 
 import mdsynthesis as mds
+from mdsynthesis.persistent_dict import pddata
+from mdsynthesis.persistent_dict.base import ProxyLock
 
 
 def append(treantfilepath, df):
@@ -12,6 +16,89 @@ def append(treantfilepath, df):
     sim.data.append('testdata', df)
 
 
+def append_shadow(treantfilepath, df):
+    sim = mds.Sim(treantfilepath)
+    sim.data.append('testdata', df, shadow=True)
+
+
+def append_segment(treantfilepath, df):
+    sim = mds.Sim(treantfilepath)
+    sim.data.append('testdata', df, segment=True)
+
+
+def write_rows(treantfilepath, start, stop):
+    sim = mds.Sim(treantfilepath)
+    rows = np.arange(start, stop)
+    sim.data.write_region('testdata', slice(start, stop),
+                          np.repeat(rows[:, None], 3, axis=1))
+
+
+def retrieve_length(treantfilepath):
+    sim = mds.Sim(treantfilepath)
+    return len(sim.data['testdata'])
+
+
+def increment(counter):
+    """Increment a counter in a file, in two writes; only safe holding an
+    exclusive lock"""
+    with open(counter, 'r+') as f:
+        value = int(f.read())
+        f.seek(0)
+        f.write('-1'.ljust(8))
+        f.flush()
+        f.seek(0)
+        f.write(str(value + 1).ljust(8))
+
+
+def read_counter(counter):
+    with open(counter, 'r') as f:
+        value = int(f.read())
+    assert value >= 0
+    return value
+
+
+def contend(proxy, counter, n):
+    """Increment a counter under a ProxyLock, from a thread upgrading a
+    shared lock, a thread taking it exclusively, and threads reading"""
+    lock = ProxyLock.get(proxy)
+
+    def upgrade():
+        for i in range(n):
+            lock.acquire()
+            read_counter(counter)
+            lock.acquire(exclusive=True)
+            increment(counter)
+            lock.release(exclusive=True)
+            lock.release()
+
+    def write():
+        for i in range(n):
+            lock.acquire(exclusive=True)
+            increment(counter)
+            lock.release(exclusive=True)
+
+    def read():
+        for i in range(n):
+            lock.acquire()
+            read_counter(counter)
+            lock.release()
+
+    try:
+        TestThreads.run([upgrade, write, read, read])
+    finally:
+        ProxyLock.put(lock)
+
+
+def hold(proxy, held, done):
+    """Hold a ProxyLock exclusively until told to stop"""
+    lock = ProxyLock.get(proxy)
+    lock.acquire(exclusive=True)
+    held.set()
+    done.wait(10)
+    lock.release(exclusive=True)
+    ProxyLock.put(lock)
+
+
 class TestTreantFile:
 
     @pytest.fixture
@@ -25,6 +112,12 @@ class TestTreantFile:
         data = np.random.rand(100, 3)
         return pd.DataFrame(data, columns=('A', 'B', 'C'))
 
+    @pytest.fixture
+    def pdfile(self, sim, dataframe):
+        sim.data.add('testdata', dataframe)
+        return pddata.pdDataFile(os.path.join(sim.abspath, 'testdata',
+                                              pddata.pddatafile))
+
     def test_async_append(self, sim, dataframe):
         pool = mp.Pool(processes=4)
         num = 53
@@ -35,3 +128,235 @@ class TestTreantFile:
         pool.join()
 
         assert len(sim.data['testdata']) == len(dataframe)*(num+0)
+
+    def test_async_append_shadow(self, sim, dataframe):
+        pool = mp.Pool(processes=4)
+        num = 53
+        for i in range(num):
+            pool.apply_async(append_shadow, args=(sim.abspath,
+                                                  dataframe))
+        pool.close()
+        pool.join()
+
+        assert len(sim.data['testdata']) == len(dataframe)*num
+
+    def test_async_write_region(self, sim):
+        sim.data.create('testdata', (1000, 3), 'int64', chunks=(50, 3))
+
+        pool = mp.Pool(processes=4)
+        for start in range(0, 1000, 50):
+            pool.apply_async(write_rows, args=(sim.abspath,
+                                               start, start + 50))
+        pool.close()
+        pool.join()
+
+        expected = np.repeat(np.arange(1000)[:, None], 3, axis=1)
+        np.testing.assert_equal(sim.data['testdata'], expected)
+
+    def test_async_write_region_shards(self, sim):
+        sim.data.create('testdata', (1000, 3), 'int64', shard_rows=100)
+
+        pool = mp.Pool(processes=4)
+        for start in range(0, 1000, 50):
+            pool.apply_async(write_rows, args=(sim.abspath,
+                                               start, start + 50))
+        pool.close()
+        pool.join()
+
+        expected = np.repeat(np.arange(1000)[:, None], 3, axis=1)
+        np.testing.assert_equal(sim.data['testdata'], expected)
+
+    def test_async_append_segment(self, sim, dataframe, pdfile):
+        pool = mp.Pool(processes=4)
+        num = 53
+        for i in range(num):
+            pool.apply_async(append_segment, args=(sim.abspath,
+                                                   dataframe))
+        pool.close()
+        pool.join()
+
+        assert len(sim.data['testdata']) == len(dataframe)*(num+1)
+        assert sim.data.compact('testdata') == num
+        assert len(sim.data['testdata']) == len(dataframe)*(num+1)
+
+    def test_shadow_append_during_read(self, sim, dataframe, pdfile):
+        """A reader holding the datafile shouldn't block a shadow append."""
+        pool = mp.Pool(processes=1)
+        with pdfile.read():
+            result = pool.apply_async(append_shadow, args=(sim.abspath,
+                                                           dataframe))
+            result.get(timeout=60)
+
+            # the reader still sees the data as it was
+            assert len(pdfile.handle['main']) == len(dataframe)
+        pool.close()
+        pool.join()
+
+        assert len(sim.data['testdata']) == 2*len(dataframe)
+
+    def test_read_during_shadow_append(self, sim, dataframe, pdfile):
+        """A shadow append in progress shouldn't block readers."""
+        pool = mp.Pool(processes=1)
+        with pdfile.stage():
+            pdfile.handle.append('main', dataframe)
+
+            result = pool.apply_async(retrieve_length, args=(sim.abspath,))
+            assert result.get(timeout=60) == len(dataframe)
+        pool.close()
+        pool.join()
+
+        assert len(sim.data['testdata']) == 2*len(dataframe)
+
+    def test_failed_shadow_append(self, sim, dataframe, pdfile):
+        """A failed shadow append should leave the dataset untouched."""
+        with pytest.raises(ValueError):
+            sim.data.append('testdata', dataframe[['A', 'B']], shadow=True)
+
+        assert len(sim.data['testdata']) == len(dataframe)
+        assert not os.path.exists(pdfile._writebuffer)
+
+
+class TestThreads:
+    """Test sharing Data between threads"""
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        with tmpdir.as_cwd():
+            t = mds.Sim('sprout')
+        return t
+
+    @pytest.fixture
+    def dataframe(self):
+        data = np.random.rand(100, 3)
+        return pd.DataFrame(data, columns=('A', 'B', 'C'))
+
+    @staticmethod
+    def run(targets):
+        """Run each target in its own thread, re-raising the first error"""
+        errors = []
+
+        def wrapped(target):
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=wrapped, args=(target,))
+                   for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def test_concurrent_retrieve(self, sim, dataframe):
+        sim.data['frame'] = dataframe
+        sim.data['names'] = ['inky', 'blinky', 'pinky', 'clyde']
+
+        def reader():
+            for i in range(20):
+                handle = random.choice(['frame', 'names'])
+                if handle == 'frame':
+                    np.testing.assert_equal(sim.data[handle].values,
+                                            dataframe.values)
+                else:
+                    assert len(sim.data[handle]) == 4
+
+        self.run([reader] * 8)
+
+    def test_concurrent_read_write(self, sim, dataframe):
+        sim.data['frame'] = dataframe
+        num = 10
+
+        def reader():
+            for i in range(20):
+                assert len(sim.data['frame']) % len(dataframe) == 0
+
+        def writer(**kwargs):
+            for i in range(num):
+                sim.data.append('frame', dataframe, **kwargs)
+
+        self.run([reader] * 4 + [writer, lambda: writer(shadow=True)])
+
+        assert len(sim.data['frame']) == len(dataframe) * (2 * num + 1)
+
+    def test_write_waits_for_read(self, sim, dataframe):
+        """A lock held by one thread should block a writer in another."""
+        sim.data.add('testdata', dataframe)
+        path = os.path.join(sim.abspath, 'testdata', pddata.pddatafile)
+        reading = pddata.pdDataFile(path)
+        written = threading.Event()
+
+        def writer():
+            pddata.pdDataFile(path).append_data('main', dataframe)
+            written.set()
+
+        with reading.read():
+            thread = threading.Thread(target=writer)
+            thread.start()
+            assert not written.wait(1)
+            assert len(reading.handle['main']) == len(dataframe)
+
+        thread.join()
+        assert written.is_set()
+        assert len(sim.data['testdata']) == 2 * len(dataframe)
+
+
+class TestProxyLock:
+    """Test locks on proxy files between threads and processes"""
+
+    def test_contend(self, tmpdir):
+        """Upgrades of shared locks in several processes at once should
+        neither deadlock nor fail."""
+        proxy = str(tmpdir.join('.proxy'))
+        counter = str(tmpdir.join('counter'))
+        with open(counter, 'w') as f:
+            f.write('0')
+
+        n = 100
+        pool = mp.Pool(4)
+        try:
+            # a deadlock would otherwise hang
+            pool.starmap_async(contend, [(proxy, counter, n)] * 4,
+                               chunksize=1).get(timeout=60)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        assert read_counter(counter) == 4 * 2 * n
+
+    def test_wait_releases_threads(self, tmpdir):
+        """Threads should not be blocked while one waits on another
+        process."""
+        proxy = str(tmpdir.join('.proxy'))
+        held, done = mp.Event(), mp.Event()
+        holder = mp.Process(target=hold, args=(proxy, held, done))
+        holder.start()
+
+        lock = ProxyLock.get(proxy)
+        acquired = []
+
+        def waiter():
+            lock.acquire()
+            acquired.append(lock._mode)
+            lock.release()
+
+        try:
+            assert held.wait(10)
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            thread.join(0.5)
+            assert thread.is_alive()
+
+            assert lock._cond.acquire(timeout=1)
+            lock._cond.release()
+        finally:
+            done.set()
+            holder.join()
+            thread.join()
+            ProxyLock.put(lock)
+
+        assert acquired == ['shared']
+        assert lock._mode is None
@@ -1,5 +1,13 @@
+import os
+
+import numpy as np
+import pytest
 import datreant as dtr
 import mdsynthesis as mds
+from mdsynthesis.manipulators import (describe, define_universes,
+                                      update_atomselections, concatenate,
+                                      repack, usage)
+from MDAnalysisTests.datafiles import GRO, XTC, PDB
 
 
 def test_discover(tmpdir):
@@ -31,3 +39,142 @@ def test_discover(tmpdir):
 
         for treant in sims + treants:
             assert treant in dtrb
+
+
+def test_describe(tmpdir):
+    with tmpdir.as_cwd():
+        sims = [mds.Sim(name) for name in ('inky', 'blinky')]
+        sims[0].data['positions'] = np.zeros((10, 3))
+        sims[1].data['names'] = ['clyde', 'pinky']
+
+        b = mds.discover('.')
+        for processes in (1, 2):
+            info = describe(b, processes=processes)
+
+            assert set(info) == set(b.abspaths)
+            assert info[sims[0].abspath]['positions']['shape'] == (10, 3)
+            assert info[sims[1].abspath]['names']['length'] == 2
+
+
+def test_define_universes(tmpdir):
+    with tmpdir.as_cwd():
+        sims = [mds.Sim(name) for name in ('inky', 'blinky', 'pinky')]
+        b = mds.Bundle(sims)
+
+        define_universes(b, {'topology': GRO, 'trajectory': XTC},
+                         processes=2)
+        assert [s.universedef._args for s in sims] == [[GRO, XTC]] * 3
+
+        define_universes(b, [{'topology': GRO}, {'topology': PDB},
+                             {'topology': None}])
+        assert [s.universedef.topology for s in sims] == [GRO, PDB, None]
+
+        with pytest.raises(ValueError):
+            define_universes(b, [{'topology': GRO}])
+
+
+def test_update_atomselections(tmpdir):
+    with tmpdir.as_cwd():
+        sims = [mds.Sim(name) for name in ('inky', 'blinky', 'pinky')]
+        selections = {'CA': 'name CA', 'firsts': np.arange(10)}
+
+        for processes in (1, 2):
+            update_atomselections(mds.Bundle(sims), selections,
+                                  processes=processes)
+
+            for sim in sims:
+                assert sim.atomselections['CA'] == 'name CA'
+                assert (sim.atomselections['firsts'] == np.arange(10)).all()
+
+
+def test_usage(tmpdir):
+    with tmpdir.as_cwd():
+        sims = [mds.Sim(name) for name in ('inky', 'blinky', 'pinky')]
+        sims[0].universedef.define(GRO, XTC)
+        sims[1].data['array'] = np.random.rand(10)
+
+        b = mds.Bundle(sims)
+        for processes in (1, 2):
+            out = usage(b, processes=processes)
+            assert out == dict((sim.abspath, sim.usage()) for sim in sims)
+
+        assert out[sims[0].abspath]['universe'] > 0
+        assert out[sims[1].abspath]['datasets']['array']['size'] > 0
+
+
+def test_usage_treant(tmpdir):
+    # measuring Treants that aren't Sims doesn't make them Sims
+    def files():
+        return sorted(os.path.join(root, f)
+                      for root, dirs, filenames in os.walk(tmpdir.strpath)
+                      for f in dirs + filenames)
+
+    with tmpdir.as_cwd():
+        treant = dtr.Treant('clyde', tags=['ghost'])
+        mds.data.Data(treant)['array'] = np.random.rand(10)
+        sim = mds.Sim('inky')
+
+        before = files()
+        for processes in (1, 2):
+            out = usage(dtr.Bundle([treant, sim]), processes=processes)
+            assert files() == before
+
+        assert not mds.manipulators._is_sim(treant)
+        usage_treant = out[treant.abspath]
+        assert usage_treant['universe'] == usage_treant['coordinates'] == 0
+        assert usage_treant['datasets']['array']['size'] > 0
+        assert usage_treant['state'] > 0
+        assert usage_treant['total'] == (usage_treant['data'] +
+                                         usage_treant['state'] +
+                                         usage_treant['other'])
+        assert out[sim.abspath] == sim.usage()
+
+
+def test_repack(tmpdir):
+    import pandas as pd
+
+    with tmpdir.as_cwd():
+        sims = [mds.Sim(name) for name in ('inky', 'blinky', 'pinky')]
+        for sim in sims:
+            sim.data['frame'] = pd.DataFrame(np.random.rand(5000, 3))
+            sim.data.remove('frame', start=0, stop=4000)
+        sims[0].data['array'] = np.random.rand(10)
+
+        b = mds.Bundle(sims)
+        recovered = repack(b, processes=2)
+        assert sorted(recovered) == sorted(b.abspaths)
+        assert recovered[sims[0].abspath]['array'] == 0
+        assert all(out['frame'] > 0 for out in recovered.values())
+        assert all(len(sim.data['frame']) == 1000 for sim in sims)
+
+
+def test_concatenate(tmpdir):
+    pytest.importorskip('dask')
+    import pandas as pd
+
+    with tmpdir.as_cwd():
+        sims = [mds.Sim(name) for name in ('inky', 'blinky', 'pinky')]
+        arrays = [np.random.rand(n, 3) for n in (10, 20, 30)]
+        for sim, array in zip(sims, arrays):
+            sim.data['array'] = array
+            sim.data['frame'] = pd.DataFrame(array, columns=('A', 'B', 'C'))
+        sims[1].data['mixed'] = arrays[1]
+        sims[2].data['mixed'] = pd.DataFrame(arrays[2])
+
+        b = mds.Bundle(sims)
+        lazy = concatenate(b, 'array')
+        assert lazy.shape == (60, 3)
+        np.testing.assert_allclose(lazy.mean(axis=0).compute(),
+                                   np.concatenate(arrays).mean(axis=0))
+
+        lazy = concatenate(b, 'frame', stop=5)
+        np.testing.assert_equal(lazy.compute().values,
+                                np.concatenate([a[:5] for a in arrays]))
+
+        sims[0].data.remove('array')
+        assert concatenate(b, 'array').shape == (50, 3)
+
+        with pytest.raises(KeyError):
+            concatenate(b, 'nothing')
+        with pytest.raises(TypeError):
+            concatenate(b, 'mixed')
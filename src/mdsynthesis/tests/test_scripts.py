@@ -0,0 +1,125 @@
+"""Tests for command-line scripts.
+
+"""
+import os
+import sys
+import json
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import mdsynthesis as mds
+from mdsynthesis.scripts import mds as mdscli
+from mdsynthesis.persistent_dict import npdata, pddata
+
+
+class TestMDS:
+
+    @pytest.fixture
+    def sims(self, tmpdir):
+        with tmpdir.as_cwd():
+            sims = [mds.Sim(name) for name in ('inky', 'sub/blinky',
+                                               'sub/deeper/pinky')]
+
+            sims[0].universedef.topology = 'inky.gro'
+            sims[0].universedef.trajectory = ['inky1.xtc', 'inky2.xtc']
+            sims[0].data['numbers'] = np.random.rand(10, 3)
+            sims[0].data['frame/table'] = pd.DataFrame(
+                np.random.rand(10, 3), columns=('A', 'B', 'C'))
+        return sims
+
+    def test_scan(self, sims, tmpdir):
+        results = mdscli.scan([tmpdir.strpath])
+
+        assert (sorted(r['sim'] for r in results) ==
+                sorted(s.abspath for s in sims))
+
+        results = mdscli.scan([tmpdir.strpath], depth=2)
+        assert len(results) == 2
+
+    def test_scan_universe(self, sims, tmpdir):
+        results = mdscli.scan([sims[0].abspath], universe=True)
+
+        assert len(results) == 1
+        universe = results[0]['universe']
+        assert universe['topology'] == sims[0].universedef.topology
+        assert universe['trajectory'] == sims[0].universedef.trajectory
+
+    def test_scan_data(self, sims, tmpdir):
+        results = mdscli.scan([sims[0].abspath], data=True)
+
+        data = results[0]['data']
+        assert set(data) == set(['numbers', 'frame/table'])
+        assert data['numbers']['type'] == npdata.npdatafile
+        assert data['frame/table']['type'] == pddata.pddatafile
+        assert data['numbers']['size'] == os.path.getsize(
+            os.path.join(sims[0].abspath, 'numbers', npdata.npdatafile))
+
+    def test_scan_usage(self, sims, tmpdir):
+        results = mdscli.scan([sims[0].abspath], usage=True)
+
+        usage = results[0]['usage']
+        assert usage == sims[0].usage()
+        assert set(usage['datasets']) == set(['numbers', 'frame/table'])
+
+    def test_main_usage(self, sims, tmpdir, capsys):
+        assert mdscli.main(['usage', sims[0].abspath]) == 0
+
+        out = capsys.readouterr()[0]
+        assert sims[0].abspath in out
+        assert "data: {}".format(sims[0].usage()['data']) in out
+
+    def test_scan_readonly(self, sims, tmpdir):
+        # nothing is written to Sims queried, not even the proxy files used
+        # for locking, so Sims on read-only storage can be queried
+        def proxies():
+            return [os.path.join(root, f)
+                    for root, dirs, files in os.walk(tmpdir.strpath)
+                    for f in files if f.endswith('proxy')]
+
+        for proxy in proxies():
+            os.remove(proxy)
+
+        results = mdscli.scan([tmpdir.strpath], data=True, universe=True,
+                              usage=True)
+        assert len(results) == 3
+        inky = [r for r in results if r['name'] == 'inky'][0]
+        assert set(inky['data']) == set(['numbers', 'frame/table'])
+        assert proxies() == []
+
+    def test_scan_parallel(self, sims, tmpdir):
+        serial = mdscli.scan([tmpdir.strpath], data=True, universe=True)
+        parallel = mdscli.scan([tmpdir.strpath], data=True, universe=True,
+                               processes=2)
+
+        assert serial == parallel
+
+    def test_main_json(self, sims, tmpdir, capsys):
+        assert mdscli.main(['data', '--json', tmpdir.strpath]) == 0
+
+        results = json.loads(capsys.readouterr()[0])
+        assert len(results) == 3
+
+    def test_main(self, sims, tmpdir, capsys):
+        assert mdscli.main(['universe', sims[0].abspath]) == 0
+
+        out = capsys.readouterr()[0]
+        assert sims[0].abspath in out
+        assert sims[0].universedef.topology in out
+
+    def test_no_heavy_imports(self, sims, tmpdir):
+        code = ("import sys; from mdsynthesis.scripts import mds; "
+                "mds.main(['data', '--json', {!r}]); "
+                "heavy = ('MDAnalysis', 'pandas', 'numpy', 'h5py'); "
+                "sys.stderr.write(','.join(m for m in heavy "
+                "if m in sys.modules))".format(tmpdir.strpath))
+
+        p = subprocess.Popen([sys.executable, '-c', code],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate()
+
+        assert p.returncode == 0
+        assert len(json.loads(out.decode())) == 3
+        assert err.decode().strip() == ''
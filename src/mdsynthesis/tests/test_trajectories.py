@@ -0,0 +1,99 @@
+"""Tests for extraction of reduced trajectories.
+
+"""
+import os
+
+import numpy as np
+import pytest
+
+import mdsynthesis as mds
+from mdsynthesis.trajectories import _blocks
+
+from MDAnalysisTests.datafiles import GRO, XTC
+
+
+def test_blocks():
+    assert _blocks(0, 10, 1, 3) == [(0, 4, 1), (4, 7, 1), (7, 10, 1)]
+    assert _blocks(2, 10, 3, 4) == [(2, 3, 3), (5, 6, 3), (8, 9, 3)]
+    assert _blocks(0, 10, 1, 1) == [(0, 10, 1)]
+
+
+class TestReduce:
+    """Test writing reduced trajectories of Sims"""
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        with tmpdir.as_cwd():
+            s = mds.Sim('testsim')
+            s.universedef.define(GRO, XTC)
+            s.atomselections['CA'] = 'name CA'
+        return s
+
+    @staticmethod
+    def check(sim, reduced, atoms, frames, times=True):
+        assert reduced.trajectory.n_frames == len(frames)
+        np.testing.assert_equal(reduced.atoms.names, atoms.names)
+
+        for ts, frame in zip(reduced.trajectory, frames):
+            sim.universe.trajectory[frame]
+            if times:
+                assert ts.time == pytest.approx(sim.universe.trajectory.time)
+            np.testing.assert_allclose(reduced.atoms.positions,
+                                       atoms.positions, atol=1e-2)
+
+    @pytest.mark.parametrize('processes', (1, 3))
+    def test_reduce(self, sim, processes):
+        assert sim.reduce('CA', processes=processes) == 10
+        assert sim.universedef.alternates == ['CA']
+
+        self.check(sim, sim.alternate('CA'),
+                   sim.atomselections.create('CA'), range(10))
+
+    def test_reduce_frames(self, sim):
+        assert sim.reduce(name='strided', start=1, step=2, blocks=3) == 5
+
+        self.check(sim, sim.alternate('strided'), sim.universe.atoms,
+                   range(1, 10, 2))
+
+    def test_reduce_format(self, sim):
+        sim.reduce('CA', format='dcd', processes=2)
+
+        definition = sim.universedef.get_alternate('CA')
+        assert definition['trajectory'].endswith('.dcd')
+        # DCD files don't keep the times of frames
+        self.check(sim, sim.alternate('CA'),
+                   sim.atomselections.create('CA'), range(10), times=False)
+
+    def test_replace(self, sim):
+        sim.reduce('CA')
+        sim.reduce('CA', stop=3)
+
+        assert sim.alternate('CA').trajectory.n_frames == 3
+        basedir = os.path.dirname(
+            sim.universedef.get_alternate('CA')['topology'])
+        assert not [f for f in os.listdir(os.path.dirname(basedir))
+                    if f.startswith('.')]
+
+    def test_no_frames(self, sim):
+        with pytest.raises(ValueError):
+            sim.reduce('CA', start=5, stop=5)
+        with pytest.raises(ValueError):
+            sim.reduce('CA', step=-1)
+
+        assert sim.universedef.alternates == []
+
+    def test_pyramid(self, sim):
+        levels = sim.pyramid('CA', strides=(2, 4, 3), processes=2)
+        assert levels == {'CA.stride2': 5, 'CA.stride3': 4, 'CA.stride4': 3}
+        assert sim.universedef.alternates == sorted(levels)
+
+        atoms = sim.atomselections.create('CA')
+        for stride in (2, 3, 4):
+            self.check(sim, sim.alternate('CA.stride{}'.format(stride)),
+                       atoms, range(0, 10, stride))
+
+    def test_pyramid_invalid(self, sim):
+        with pytest.raises(ValueError):
+            sim.pyramid(strides=(1, 10))
+        with pytest.raises(ValueError):
+            sim.reduce('CA', source='all')
@@ -2,11 +2,15 @@
 
 """
 
+import os
+
 import mdsynthesis as mds
 import pytest
 import py
 from pkg_resources import parse_version
+from six.moves import cPickle as pickle
 
+from datreant.exceptions import NotATreantError
 from datreant.tests.test_treants import TestTreant
 
 import MDAnalysis as mda
@@ -125,6 +129,94 @@ class TestSim(TestTreant):
             assert isinstance(treant.universe, mda.Universe)
             assert treant.universe.trajectory.n_frames == 1
 
+        def test_define(self, treant):
+            """Test setting the whole definition at once"""
+            treant.universedef.define(PSF, [XTC, XTC], {'in_memory': False})
+
+            assert treant.universedef.topology == PSF
+            assert treant.universedef.trajectory == (XTC, XTC)
+            assert treant.universedef.kwargs == {'in_memory': False}
+
+            treant.universedef.define(GRO)
+            assert treant.universedef.topology == GRO
+            assert treant.universedef.trajectory is None
+            assert treant.universedef.kwargs == {}
+            assert treant.universedef._args == [GRO]
+            assert isinstance(treant.universe, mda.Universe)
+
+        def test_alternates(self, treant):
+            """Test defining alternate universes"""
+            treant.universedef.define(GRO, XTC)
+            treant.universedef.add_alternate('pdb', PDB)
+            treant.universedef.add_alternate('psf', PSF, [XTC, XTC],
+                                             {'in_memory': False})
+
+            assert treant.universedef.alternates == ['pdb', 'psf']
+            assert treant.universedef.get_alternate('psf') == {
+                'topology': PSF,
+                'trajectory': (XTC, XTC),
+                'kwargs': {'in_memory': False}}
+
+            u = treant.alternate('pdb')
+            assert isinstance(u, mda.Universe)
+            assert u.trajectory.n_frames == 1
+            assert treant.alternate('pdb') is u
+
+            # redefining gives a new universe
+            treant.universedef.add_alternate('pdb', GRO, XTC)
+            assert treant.alternate('pdb').trajectory.n_frames == 10
+
+            # the universe itself is untouched
+            treant.universedef.define(GRO)
+            assert treant.universedef.alternates == ['pdb', 'psf']
+
+            treant.universedef.remove_alternate('pdb')
+            assert treant.universedef.alternates == ['psf']
+            with pytest.raises(KeyError):
+                treant.alternate('pdb')
+            with pytest.raises(KeyError):
+                treant.universedef.remove_alternate('pdb')
+            with pytest.raises(ValueError):
+                treant.universedef.add_alternate('none', None)
+
+        def test_usage(self, treant):
+            """Test accounting of disk usage"""
+            import numpy as np
+
+            treant.universedef.define(GRO, XTC)
+            treant.universedef.add_alternate('pdb', PDB)
+            treant.data['numbers'] = np.random.rand(100, 3)
+            with open(os.path.join(treant.abspath, 'notes.txt'), 'w') as f:
+                f.write('notes')
+
+            usage = treant.usage()
+            assert usage['files'] == dict((path, os.path.getsize(path))
+                                          for path in (GRO, XTC, PDB))
+            assert usage['universe'] == sum(usage['files'].values())
+            assert usage['datasets'] == treant.data.usage()
+            assert usage['data'] == usage['datasets']['numbers']['size']
+            assert usage['other'] == 5
+            assert usage['state'] > 0
+            assert usage['coordinates'] == 0
+            assert usage['total'] == sum(
+                usage[category] for category in
+                ('data', 'universe', 'coordinates', 'state', 'other'))
+
+            missing = os.path.join(treant.abspath, 'missing.xtc')
+            treant.universedef.trajectory = missing
+            assert treant.usage()['files'][missing] is None
+
+        def test_define_invalid(self, treant):
+            """A definition that fails validation should change nothing"""
+            treant.universedef.define(GRO, XTC)
+
+            with pytest.raises(ValueError):
+                treant.universedef.define(PDB, kwargs={'parser': object()})
+            with pytest.raises(TypeError):
+                treant.universedef.define(PDB, trajectory=72)
+
+            assert treant.universedef._args == [GRO, XTC]
+
     class TestSelections:
         """Test stored atomselections functionality"""
         @pytest.fixture
@@ -260,6 +352,32 @@ class TestSim(TestTreant):
             ag3 = treant.universe.select_atoms('protein and name CA') + ag
             assert (ag2.indices == ag3.indices).all()
 
+        def test_update(self, treant):
+            """Add many selections at once"""
+            ag = treant.universe.atoms[25:50:3]
+            treant.atomselections['CA'] = 'name CA'
+
+            treant.atomselections.update({
+                'CA': 'protein and name CA',
+                'ag': ag.indices,
+                'mix': ('resid 1', ag.indices),
+                'strings': ['resid 1', 'resid 2']})
+
+            assert set(treant.atomselections) == set(['CA', 'ag', 'mix',
+                                                      'strings'])
+            assert treant.atomselections['CA'] == 'protein and name CA'
+            assert (treant.atomselections['ag'] == ag.indices).all()
+            assert treant.atomselections['mix'][0] == 'resid 1'
+            assert treant.atomselections['strings'] == ('resid 1', 'resid 2')
+
+        def test_update_invalid(self, treant):
+            """An invalid selection should keep all from being stored"""
+            with pytest.raises(ValueError):
+                treant.atomselections.update({'CA': 'name CA',
+                                              'bogus': [72.5]})
+
+            assert treant.atomselections.keys() == []
+
 
 class TestReadOnly:
     """Test Sim functionality when read-only"""
@@ -324,3 +442,62 @@ class TestReadOnly:
 
     def test_get_atomselection_as_readonly(self, sim):
         assert sim.atomselections['aspartates'] == 'resname ASP'
+
+
+class TestImmutable:
+    """Test Sim functionality when immutable"""
+
+    @pytest.fixture
+    def sim(self, tmpdir):
+        with tmpdir.as_cwd():
+            c = mds.Sim('testsim', tags=['archived'])
+            c.universedef.topology = GRO
+            c.universedef.trajectory = XTC
+            c.atomselections['aspartates'] = 'resname ASP'
+            c.data['names'] = ['inky', 'blinky']
+
+            # no locks are taken, so no proxy files should be needed
+            for proxy in py.path.local(c.abspath).visit('.*proxy'):
+                proxy.remove()
+
+        return mds.Sim(c.abspath, immutable=True)
+
+    def proxies(self, sim):
+        return list(py.path.local(sim.abspath).visit('.*proxy'))
+
+    def test_read(self, sim):
+        assert sim.immutable
+        assert isinstance(sim.universe, mda.Universe)
+        assert sim.atomselections['aspartates'] == 'resname ASP'
+        assert 'archived' in sim.tags
+        assert sim.data['names'] == ['inky', 'blinky']
+        assert sim.data.keys() == ['names']
+        assert not self.proxies(sim)
+
+    def test_write(self, sim):
+        with pytest.raises(OSError):
+            sim.atomselections['foo'] = 'bar'
+        with pytest.raises(OSError):
+            sim.universe = None
+        with pytest.raises(OSError):
+            sim.tags.add('foo')
+        with pytest.raises(OSError):
+            sim.data['foo'] = 'bar'
+        with pytest.raises(OSError):
+            sim.data.remove('names')
+
+        assert sim.data['names'] == ['inky', 'blinky']
+        assert not self.proxies(sim)
+
+    def test_new(self, tmpdir):
+        with tmpdir.as_cwd():
+            with pytest.raises(NotATreantError):
+                mds.Sim('newsim', immutable=True)
+            assert not tmpdir.join('newsim').check()
+
+    def test_pickle(self, sim):
+        assert pickle.loads(pickle.dumps(sim)).immutable
+
+    def test_discover(self, sim, tmpdir):
+        b = mds.discover(tmpdir.strpath, immutable=True)
+        assert [s.immutable for s in b] == [True]
@@ -0,0 +1,251 @@
+"""
+Extraction of reduced trajectories from the universe of a Sim, such as those
+of a single stored selection or of every n-th frame.
+
+"""
+import os
+import errno
+import shutil
+
+from .names import UNIVERSES_DIR_NAME
+from .util import starmap, replace_directory
+
+# trajectory formats whose files can be joined by concatenating their bytes
+CONCATENABLE = ('xtc', 'trr')
+
+
+def _blocks(start, stop, step, n_blocks):
+    """Split a range of frames into at most `n_blocks` contiguous blocks.
+
+    Blocks are given as ``(start, stop, step)``, and differ in size by at
+    most one frame.
+
+    """
+    frames = range(start, stop, step)
+    n_blocks = max(1, min(n_blocks, len(frames)))
+    size, extra = divmod(len(frames), n_blocks)
+
+    blocks = list()
+    first = 0
+    for i in range(n_blocks):
+        last = first + size + (1 if i < extra else 0)
+        blocks.append((frames[first], frames[last - 1] + 1, step))
+        first = last
+
+    return blocks
+
+
+def _universe(sim, source):
+    if source is not None:
+        return sim.alternate(source)
+
+    universe = sim.universe
+    if universe is None:
+        raise ValueError("Sim has no universe defined.")
+    return universe
+
+
+def _atoms(sim, selection, source):
+    universe = _universe(sim, source)
+
+    if selection is None:
+        return universe.atoms
+    else:
+        return sim.atomselections.create(selection)
+
+
+def _write_block(sim, selection, source, start, stop, step, path):
+    """Write the frames of a block of the Sim's trajectory to a file.
+
+    """
+    import MDAnalysis as mda
+
+    atoms = _atoms(sim, selection, source)
+    with mda.Writer(path, atoms.n_atoms) as writer:
+        for ts in atoms.universe.trajectory[start:stop:step]:
+            writer.write(atoms)
+
+
+def _concatenate(topology, paths, path, format):
+    """Join trajectory files into one, in order.
+
+    """
+    if len(paths) == 1:
+        os.rename(paths[0], path)
+    elif format in CONCATENABLE:
+        with open(path, 'wb') as out:
+            for block in paths:
+                with open(block, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+    else:
+        import MDAnalysis as mda
+
+        universe = mda.Universe(topology, paths)
+        with mda.Writer(path, universe.atoms.n_atoms) as writer:
+            for ts in universe.trajectory:
+                writer.write(universe.atoms)
+
+    for block in paths:
+        if os.path.exists(block):
+            os.remove(block)
+
+
+def reduce(sim, selection=None, name=None, start=None, stop=None, step=None,
+           format='xtc', processes=1, blocks=None, source=None):
+    """Write a reduced trajectory of a Sim, and add it as an alternate
+    universe definition.
+
+    The trajectory has only the atoms of a stored selection, and only the
+    frames in the given range. It is written in contiguous blocks of frames,
+    which are processed in parallel and then concatenated. The reduced
+    topology is written as a PDB file, with the atoms' positions in the first
+    frame written. The files are stored inside the Sim, and replace those of
+    any existing reduced trajectory of the same name only once complete.
+
+    Parameters
+    ----------
+    sim : Sim
+        Sim whose trajectory to reduce.
+    selection : str
+        Handle of the stored atom selection to keep; ``None`` keeps all
+        atoms.
+    name : str
+        Name to give the alternate universe definition; defaults to
+        *selection*, or ``'all'`` if keeping all atoms.
+    start, stop, step : int
+        Range of frames to keep, as for slicing the trajectory; *step* must
+        be positive.
+    format : str
+        Format of the reduced trajectory, given as its file extension.
+    processes : int
+        Number of processes to use.
+    blocks : int
+        Number of blocks to split the frames into; defaults to *processes*.
+    source : str
+        Name of an alternate universe definition to reduce instead of the
+        Sim's universe; *selection* must then be ``None``, since stored
+        selections apply to the Sim's universe.
+
+    Returns
+    -------
+    n_frames : int
+        Number of frames in the reduced trajectory.
+
+    """
+    if getattr(sim, 'immutable', False):
+        raise OSError(errno.EROFS, "Sim '{}' is read-only".format(sim.abspath))
+
+    if name is None:
+        name = 'all' if selection is None else selection
+    if not name or name.startswith('.') or os.sep in name:
+        raise ValueError("Invalid name for reduced universe: "
+                         "'{}'".format(name))
+
+    if source is not None and selection is not None:
+        raise ValueError("Stored selections can't be applied to alternate "
+                         "universes.")
+
+    atoms = _atoms(sim, selection, source)
+    trajectory = atoms.universe.trajectory
+
+    start, stop, step = slice(start, stop, step).indices(trajectory.n_frames)
+    if step < 1:
+        raise ValueError("Frames must be in increasing order.")
+    n_frames = len(range(start, stop, step))
+    if not n_frames:
+        raise ValueError("No frames in the given range.")
+
+    basedir = os.path.join(sim._simdir, UNIVERSES_DIR_NAME)
+    directory = os.path.join(basedir, name)
+    wbuffer = os.path.join(basedir, '.{}.buffer'.format(name))
+    if os.path.exists(wbuffer):
+        shutil.rmtree(wbuffer)
+    os.makedirs(wbuffer)
+
+    topfile = 'topology.pdb'
+    trajfile = 'trajectory.{}'.format(format)
+
+    try:
+        trajectory[start]
+        atoms.write(os.path.join(wbuffer, topfile))
+
+        arglists = list()
+        for i, block in enumerate(_blocks(start, stop, step,
+                                          blocks or processes)):
+            path = os.path.join(wbuffer, '.block{}.{}'.format(i, format))
+            arglists.append((sim, selection, source) + block + (path,))
+
+        starmap(_write_block, arglists, processes=processes)
+
+        _concatenate(os.path.join(wbuffer, topfile),
+                     [args[-1] for args in arglists],
+                     os.path.join(wbuffer, trajfile), format)
+
+        replace_directory(wbuffer, directory)
+    except BaseException:
+        if os.path.exists(wbuffer):
+            shutil.rmtree(wbuffer)
+        raise
+
+    sim.universedef.add_alternate(name,
+                                  os.path.join(directory, topfile),
+                                  os.path.join(directory, trajfile))
+
+    return n_frames
+
+
+def pyramid(sim, selection=None, strides=(10, 100), name=None, format='xtc',
+            processes=1):
+    """Write reduced trajectories of a Sim at decreasing time resolutions.
+
+    Each level keeps every n-th frame for one of the given strides, and is
+    added as an alternate universe definition named ``'<name>.stride<n>'``.
+    Levels are written from finest to coarsest, with each reduced from the
+    previous level where its stride is a multiple of the previous one, so
+    only the finest level reads the full trajectory.
+
+    Parameters
+    ----------
+    sim : Sim
+        Sim whose trajectory to reduce.
+    selection : str
+        Handle of the stored atom selection to keep; ``None`` keeps all
+        atoms.
+    strides : list
+        Strides of the levels to write; each must be greater than one.
+    name : str
+        Base name of the levels; defaults to *selection*, or ``'all'`` if
+        keeping all atoms.
+    format : str
+        Format of the reduced trajectories, given as their file extension.
+    processes : int
+        Number of processes to use.
+
+    Returns
+    -------
+    levels : dict
+        Number of frames in each level, by name.
+
+    """
+    strides = sorted(set(strides))
+    if not strides or strides[0] < 2:
+        raise ValueError("Strides must be greater than one.")
+
+    if name is None:
+        name = 'all' if selection is None else selection
+
+    levels = dict()
+    previous = None
+    for stride in strides:
+        level = '{}.stride{}'.format(name, stride)
+        if previous is not None and stride % previous[1] == 0:
+            levels[level] = reduce(sim, name=level,
+                                   step=stride // previous[1],
+                                   format=format, processes=processes,
+                                   source=previous[0])
+        else:
+            levels[level] = reduce(sim, selection, name=level, step=stride,
+                                   format=format, processes=processes)
+        previous = (level, stride)
+
+    return levels
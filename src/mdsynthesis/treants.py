@@ -8,14 +8,76 @@ import warnings
 import os
 from functools import wraps
 
-import MDAnalysis as mda
-
-from datreant import Treant
+from datreant import Treant, Tree
 from datreant.names import TREANTDIR_NAME
+from datreant.exceptions import NotATreantError
 from datreant.util import makedirs
-from .names import SIMDIR_NAME
+from .names import SIMDIR_NAME, COORDINATES_DIR_NAME
 from . import metadata
-from .data import Data
+from . import trajectories
+from .data import Data, _datafiles
+from .coordinates import Coordinates
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # missing, or removed since listing
+        return None
+
+
+def _usage(top, files=(), cachedir=None):
+    """Get the space on disk taken by a Treant, by what it is used for.
+
+    See :meth:`Sim.usage`; Treants other than Sims have no universe
+    definition or coordinate caches, so only their datasets, state, and
+    other files are counted.
+
+    """
+    files = dict((path, _size(path)) for path in files)
+    usage = {'data': 0,
+             'universe': sum(n for n in files.values() if n),
+             'coordinates': 0,
+             'state': 0,
+             'other': 0,
+             'datasets': dict(),
+             'files': files}
+
+    treantdir = os.path.join(top, TREANTDIR_NAME)
+    for root, dirs, filenames in os.walk(top):
+        datafiletype, members = _datafiles(filenames)
+        if cachedir and (root == cachedir or
+                         root.startswith(cachedir + os.sep)):
+            category = 'coordinates'
+        elif root == treantdir or root.startswith(treantdir + os.sep):
+            category = 'state'
+        else:
+            category = 'other'
+
+        datasize = 0
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            if path in files:
+                # already counted
+                continue
+
+            n = _size(path) or 0
+            if filename in members:
+                datasize += n
+            else:
+                usage[category] += n
+
+        if datafiletype is not None:
+            usage['data'] += datasize
+            handle = os.path.relpath(root, start=top)
+            usage['datasets'][handle] = {'type': datafiletype,
+                                         'size': datasize}
+
+    usage['total'] = sum(usage[category] for category in
+                         ('data', 'universe', 'coordinates', 'state',
+                          'other'))
+    return usage
 
 
 class Sim(Treant):
@@ -47,26 +109,61 @@ class Sim(Treant):
     tags : list
         list with user-defined values; like categories, but useful for adding
         many distinguishing descriptors
+    immutable : bool
+        if True, the Sim must already exist and is treated as read-only:
+        its state files and datasets are read without locking, state files
+        are read only once and cached, and any attempt to modify the Sim
+        raises :exc:`OSError`; only safe if no one modifies the Sim, e.g. for
+        archives on read-only storage
     """
     _treanttype = 'Sim'
 
-    def __init__(self, sim, categories=None, tags=None):
+    def __init__(self, sim, categories=None, tags=None, immutable=False):
+        if immutable:
+            if categories or tags:
+                raise ValueError("Cannot add categories or tags to an "
+                                 "immutable Sim.")
+
+            path = sim.abspath if isinstance(sim, Tree) else sim
+            if not os.path.isdir(os.path.join(path, TREANTDIR_NAME)):
+                raise NotATreantError("Directory '{}' is not a Treant; "
+                                      "immutable Sims must already "
+                                      "exist.".format(path))
+
         super(Sim, self).__init__(sim,
                                   categories=categories,
                                   tags=tags)
 
-        self._universedef = metadata.UniverseDefinition(self)
+        self._immutable = immutable
         self._universe = None
         self._args = None
-        self._atomselections = metadata.AtomSelections(self, parent=self)
+        self._alternates = dict()
+
+        if immutable:
+            self._tags = metadata.ReadOnlyTags(self)
+            self._categories = metadata.ReadOnlyCategories(self)
+            self._universedef = metadata.ReadOnlyUniverseDefinition(self)
+            self._atomselections = metadata.ReadOnlyAtomSelections(
+                self, parent=self)
+        else:
+            self._universedef = metadata.UniverseDefinition(self)
+            self._atomselections = metadata.AtomSelections(self, parent=self)
+
+            # make simdir
+            self._make_simdir()
 
-        # make simdir
-        self._make_simdir()
-        self._data = Data(self)
+        self._data = Data(self, readonly=immutable)
+        self._coordinates = Coordinates(self)
 
     def __repr__(self):
         return "<{}: '{}'>".format(self._treanttype, self.name)
 
+    def __getstate__(self):
+        return {'abspath': self.abspath, 'immutable': self._immutable}
+
+    def __setstate__(self, state):
+        self.__init__(state['abspath'], immutable=state['immutable'])
+
     def _make_simdir(self):
         abspath = self._path.absolute()
         simdir = abspath / os.path.join(TREANTDIR_NAME, SIMDIR_NAME)
@@ -86,6 +183,14 @@ class Sim(Treant):
     def _simdir(self):
         return os.path.join(self.abspath, TREANTDIR_NAME, SIMDIR_NAME)
 
+    @property
+    def immutable(self):
+        """Whether the Sim is read-only, with state files read without locking
+        and cached.
+
+        """
+        return self._immutable
+
     @property
     def universe(self):
         """The universe of the Sim.
@@ -97,6 +202,8 @@ class Sim(Treant):
         universe definition for this Sim. Setting to ``None`` will remove
         the universe definition entirely.
 
+        MDAnalysis is only imported once a universe is first built.
+
         """
         _args = self.universedef._args
         if _args != self._args:
@@ -105,6 +212,7 @@ class Sim(Treant):
             if _args is None:
                 self._universe = None
             else:
+                import MDAnalysis as mda
                 self._universe = mda.Universe(*_args, **kwargs)
         return self._universe
 
@@ -113,6 +221,142 @@ class Sim(Treant):
         self.universedef.update(universe)
         self._universe = universe
 
+    def alternate(self, name):
+        """Get the universe of an alternate universe definition.
+
+        As for :attr:`universe`, the universe is only built again if its
+        definition has changed.
+
+        Parameters
+        ----------
+        name : str
+            Name of the alternate universe definition.
+
+        Returns
+        -------
+        universe : MDAnalysis.Universe
+            The alternate universe.
+
+        """
+        definition = self.universedef._alternate_args(name)
+
+        built = self._alternates.get(name)
+        if built is None or built[0] != definition:
+            import MDAnalysis as mda
+            args, kwargs = definition
+            built = self._alternates[name] = (definition,
+                                              mda.Universe(*args, **kwargs))
+        return built[1]
+
+    def reduce(self, selection=None, name=None, start=None, stop=None,
+               step=None, format='xtc', processes=1, blocks=None,
+               source=None):
+        """Write a reduced trajectory, and add it as an alternate universe
+        definition.
+
+        The trajectory has only the atoms of a stored selection, and only the
+        frames in the given range. Blocks of frames are written in parallel,
+        then concatenated. The reduced topology and trajectory are stored
+        inside the Sim; the reduced universe is then available with
+        :meth:`alternate`.
+
+        Parameters
+        ----------
+        selection : str
+            Handle of the stored atom selection to keep; ``None`` keeps all
+            atoms.
+        name : str
+            Name to give the alternate universe definition; defaults to
+            *selection*, or ``'all'`` if keeping all atoms.
+        start, stop, step : int
+            Range of frames to keep, as for slicing the trajectory; *step*
+            must be positive.
+        format : str
+            Format of the reduced trajectory, given as its file extension.
+        processes : int
+            Number of processes to use.
+        blocks : int
+            Number of blocks to split the frames into; defaults to
+            *processes*.
+        source : str
+            Name of an alternate universe definition to reduce instead of the
+            Sim's universe; *selection* must then be ``None``.
+
+        Returns
+        -------
+        n_frames : int
+            Number of frames in the reduced trajectory.
+
+        """
+        return trajectories.reduce(self, selection=selection, name=name,
+                                   start=start, stop=stop, step=step,
+                                   format=format, processes=processes,
+                                   blocks=blocks, source=source)
+
+    def pyramid(self, selection=None, strides=(10, 100), name=None,
+                format='xtc', processes=1):
+        """Write reduced trajectories at decreasing time resolutions.
+
+        Each level keeps every n-th frame for one of the given strides, and is
+        added as an alternate universe definition named
+        ``'<name>.stride<n>'``, available with :meth:`alternate`. Overview
+        analyses can then use a coarse level, reading only a fraction of the
+        trajectory. Coarser levels are reduced from finer ones where possible.
+
+        Parameters
+        ----------
+        selection : str
+            Handle of the stored atom selection to keep; ``None`` keeps all
+            atoms.
+        strides : list
+            Strides of the levels to write; each must be greater than one.
+        name : str
+            Base name of the levels; defaults to *selection*, or ``'all'`` if
+            keeping all atoms.
+        format : str
+            Format of the reduced trajectories, given as their file extension.
+        processes : int
+            Number of processes to use.
+
+        Returns
+        -------
+        levels : dict
+            Number of frames in each level, by name.
+
+        """
+        return trajectories.pyramid(self, selection=selection,
+                                    strides=strides, name=name,
+                                    format=format, processes=processes)
+
+    def usage(self):
+        """Get the space on disk taken by the Sim, by what it is used for.
+
+        Only the sizes of files are looked up, without opening any, so this
+        is fast enough to run over many Sims; see
+        :func:`mdsynthesis.manipulators.usage`.
+
+        Files referenced by the universe definition, or by its alternates,
+        are counted wherever they are, even outside the Sim's directory; all
+        other files counted are within it. Each file is counted only once.
+
+        Returns
+        -------
+        usage : dict
+            Total bytes on disk taken by stored datasets as ``'data'``, the
+            topology and trajectory files of the universe definitions as
+            ``'universe'``, coordinate caches as ``'coordinates'``, state
+            files and other internals as ``'state'``, anything else in the
+            Sim's directory as ``'other'``, and all of these as ``'total'``.
+            The type and size of each dataset are given as for
+            :meth:`mdsynthesis.data.Data.usage` under ``'datasets'``, and
+            the size of each file of the universe definitions under
+            ``'files'``, with ``None`` for missing files.
+
+        """
+        return _usage(self.abspath, files=self.universedef._files(),
+                      cachedir=os.path.join(self._simdir,
+                                            COORDINATES_DIR_NAME))
+
     @property
     def universedef(self):
         """The universe definition for this Sim.
@@ -132,3 +376,13 @@ class Sim(Treant):
     @property
     def data(self):
         return self._data
+
+    @property
+    def coordinates(self):
+        """Local caches of coordinates for stored atom selections.
+
+        Caches are uncompressed and memory-mapped on use, giving random
+        access to frames at memory speed for repeated analyses of a
+        selection.
+        """
+        return self._coordinates
@@ -0,0 +1,174 @@
+"""
+Utility functions used throughout :mod:`mdsynthesis`.
+
+"""
+import os
+import sys
+import uuid
+import errno
+import shutil
+import multiprocessing as mp
+
+
+def isinstance_lazy(obj, module, *classnames):
+    """Check if `obj` is an instance of any of the named classes of a module.
+
+    The module isn't imported to do this, since if it hasn't been imported
+    already, `obj` can't be an instance of its classes. This allows checking
+    for e.g. numpy arrays or pandas objects without paying for the import.
+
+    :Arguments:
+        *obj*
+            object to check
+        *module*
+            name of the module containing the classes, e.g. ``'numpy'``
+        *classnames*
+            names of the classes within the module, e.g. ``'ndarray'``;
+            classes missing from the module are ignored
+
+    :Returns:
+        *isinstance*
+            True if `obj` is an instance of any of the classes
+    """
+    mod = sys.modules.get(module)
+    if mod is None:
+        return False
+
+    classes = tuple(getattr(mod, name) for name in classnames
+                    if hasattr(mod, name))
+    return isinstance(obj, classes)
+
+
+def starmap(function, arglists, processes=1):
+    """Apply a function to each of a list of argument lists, perhaps in
+    parallel.
+
+    :Arguments:
+        *function*
+            function to apply; must be picklable if *processes* > 1
+        *arglists*
+            list of tuples of positional arguments to call *function* with
+
+    :Keywords:
+        *processes*
+            how many processes to use; if 1, calls are made in order in this
+            process
+
+    :Returns:
+        *results*
+            list giving the result of each call, in order
+    """
+    if processes > 1:
+        pool = mp.Pool(processes=processes)
+        try:
+            results = [pool.apply_async(function, args=args)
+                       for args in arglists]
+            results = [result.get() for result in results]
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [function(*args) for args in arglists]
+
+    return results
+
+
+def replace_directory(source, target):
+    """Move a directory into place, replacing any existing one.
+
+    The existing directory is first moved aside, so that `target` is only
+    ever missing for the moment between two renames; processes holding files
+    in it open keep them. If another process puts its own directory in place
+    meanwhile, that is replaced in turn.
+
+    :Arguments:
+        *source*
+            directory to move
+        *target*
+            path to move it to; must be on the same filesystem
+    """
+    parent, name = os.path.split(os.path.normpath(target))
+    while True:
+        try:
+            os.rename(source, target)
+            return
+        except OSError as e:
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                raise
+
+        # unique across processes, so concurrent replacements don't collide
+        old = os.path.join(parent, '.{}.{}.old'.format(name,
+                                                       uuid.uuid4().hex))
+        try:
+            os.rename(target, old)
+        except OSError as e:
+            # already moved aside by another process
+            if e.errno != errno.ENOENT:
+                raise
+        else:
+            shutil.rmtree(old)
+
+
+# ioctl request for cloning a whole file on Linux; see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+def _reflink(source, target):
+    """Clone a file as a reflink, sharing its blocks copy-on-write.
+
+    """
+    try:
+        import fcntl
+    except ImportError:  # not on POSIX
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported")
+
+    with open(source, 'rb') as src:
+        with open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def clone_file(source, target, method='auto'):
+    """Copy a file as cheaply as the filesystem allows.
+
+    Reflinks share the blocks of the file until either copy is changed, so
+    they are made in constant time without taking more space; they are
+    supported by e.g. Btrfs and XFS. Hardlinks are the same file under two
+    names, so changes made in place to either are seen in both; they are
+    only safe if one of the names is removed, as when moving a file.
+
+    :Arguments:
+        *source*
+            path of file to copy
+        *target*
+            path to copy it to; must not exist already
+
+    :Keywords:
+        *method*
+            ``'reflink'``, ``'hardlink'``, or ``'copy'`` to copy the file's
+            contents; ``'auto'`` makes a reflink if possible and copies
+            otherwise [``'auto'``]
+
+    :Returns:
+        *method*
+            the method used
+    """
+    if method not in ('auto', 'reflink', 'hardlink', 'copy'):
+        raise ValueError("Unknown method of copying files: "
+                         "'{}'".format(method))
+
+    if method in ('auto', 'reflink'):
+        try:
+            _reflink(source, target)
+            return 'reflink'
+        except (IOError, OSError):
+            if os.path.exists(target):
+                os.remove(target)
+            if method == 'reflink':
+                raise
+
+    if method == 'hardlink':
+        os.link(source, target)
+        return 'hardlink'
+
+    shutil.copyfile(source, target)
+    return 'copy'